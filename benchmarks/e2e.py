@@ -0,0 +1,192 @@
+"""
+End-to-end ingestion benchmark.
+
+    python -m benchmarks.e2e --files-per-second 50 --duration 60 --vehicles 1000 --rows-per-file 500
+
+Runs the pipeline as main.py wires it (observer, worker pool, micro-batcher, ledger and retries)
+against a scratch database on the docker-compose Postgres, while the fleet generator writes
+files into a temporary input directory at a fixed rate. Once the generator stops, the pipeline
+is given --drain-timeout seconds to commit the remaining files.
+
+Reports sustained files/s and rows/s, p50/p99 event-to-commit latency (from the file appearing
+in the input directory to the commit of its rows) and the peak RSS of the process, which also
+runs the generator, as JSON, on stdout and optionally into --output.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from services.db.config import get_connection_details
+from services.db.postgres_client import PostgresDB
+from services.db.ledger import IngestionLedger
+from services.observer.observer_client import DirectoryObserver
+from file_processing.batcher import MicroBatcher, DEFAULT_MAX_ROWS, DEFAULT_MAX_BYTES, DEFAULT_MAX_LATENCY
+from file_processing.retry import RetryScheduler
+from file_processing.worker_pool import DEFAULT_NUM_WORKERS
+from benchmarks.fleet import FleetGenerator, add_generator_arguments, generator_from_arguments
+
+BENCHMARK_DATABASE = "benchmark_e2e_db"
+
+
+class CommitRecorder(RetryScheduler):
+    """
+    RetryScheduler recording when every file was committed, or failed, before handling the result.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.committed_at: dict[str, float] = {}
+        self.failed: set[str] = set()
+        self._results_lock = threading.Lock()
+
+    def on_result(self, file_path: str, error: Exception | None):
+        now = time.monotonic()
+        with self._results_lock:
+            if error is None:
+                self.committed_at.setdefault(file_path, now)
+            else:
+                self.failed.add(file_path)
+        super().on_result(file_path=file_path, error=error)
+
+    def done(self, file_paths) -> bool:
+        with self._results_lock:
+            return all(path in self.committed_at for path in file_paths)
+
+
+def run(
+        config: dict,
+        generator: FleetGenerator,
+        files_per_second: float,
+        duration: float,
+        num_workers: int,
+        drain_timeout: float
+) -> dict:
+    """
+    Run the pipeline while generating files, and measure it.
+
+    :return: The measurements.
+    """
+    work_dir = tempfile.mkdtemp(prefix="benchmark_e2e_")
+    input_dir = os.path.join(work_dir, "input")
+    os.makedirs(input_dir)
+    written_at: dict[str, float] = {}
+    try:
+        with PostgresDB(connection_details=config, pool_size=num_workers) as db:
+            db.initialize()
+            ledger = IngestionLedger(db=db)
+            recorder = CommitRecorder(db=db, quarantine_dir=os.path.join(work_dir, "quarantine"))
+            batcher = MicroBatcher(
+                db=db,
+                max_rows=DEFAULT_MAX_ROWS,
+                max_bytes=DEFAULT_MAX_BYTES,
+                max_latency=DEFAULT_MAX_LATENCY,
+                on_result=recorder.on_result,
+                ledger=ledger
+            )
+            observer = DirectoryObserver(
+                directory_path=input_dir, db=db, num_workers=num_workers, batcher=batcher, ledger=ledger, retry=recorder
+            )
+            observer.start_observer()
+            try:
+                started = time.monotonic()
+                next_write = started
+                while time.monotonic() - started < duration:
+                    delay = next_write - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    file_path = generator.write_file(input_dir)
+                    written_at[file_path] = time.monotonic()
+                    next_write += 1 / files_per_second
+                generation_seconds = time.monotonic() - started
+                deadline = time.monotonic() + drain_timeout
+                while not recorder.done(written_at) and time.monotonic() < deadline:
+                    time.sleep(0.05)
+            finally:
+                observer.stop_observer()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    latencies = sorted(
+        recorder.committed_at[path] - written for path, written in written_at.items() if path in recorder.committed_at
+    )
+    committed = len(latencies)
+    elapsed = (max(recorder.committed_at.values()) - min(written_at.values())) if committed else 0.0
+    rows = committed * generator.rows_per_file
+    return {
+        "files_written": len(written_at),
+        "files_committed": committed,
+        "files_failed": len(recorder.failed),
+        "generation_seconds": round(generation_seconds, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "files_per_second": round(committed / elapsed, 2) if elapsed else 0.0,
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_seconds": round(_percentile(latencies, 0.50), 4),
+        "latency_p99_seconds": round(_percentile(latencies, 0.99), 4),
+        "latency_max_seconds": round(latencies[-1], 4) if latencies else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _percentile(values: list[float], quantile: float) -> float | None:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(quantile * len(values)) - 1))]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files-per-second", type=float, default=20, help="Rate at which files are written")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds during which files are written")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="Seconds allowed to commit the remaining files")
+    parser.add_argument("--workers", type=int, default=DEFAULT_NUM_WORKERS, help="Ingestion worker threads")
+    parser.add_argument("--output", help="File receiving the JSON results")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    config = {**get_connection_details(), "database": BENCHMARK_DATABASE}
+    PostgresDB.drop_database(config=config)
+    PostgresDB.create_database(config=config)
+    try:
+        results = run(
+            config=config,
+            generator=generator_from_arguments(args),
+            files_per_second=args.files_per_second,
+            duration=args.duration,
+            num_workers=args.workers,
+            drain_timeout=args.drain_timeout
+        )
+    finally:
+        PostgresDB.drop_database(config=config)
+
+    report = {
+        "commit": _git_commit(),
+        "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+
+
+if __name__ == "__main__":
+    main()
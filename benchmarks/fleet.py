@@ -0,0 +1,160 @@
+"""
+Synthetic fleet data generator.
+
+    python -m benchmarks.fleet out_dir/ --files 100 --vehicles 1000 --rows-per-file 500
+
+Writes objects detection and vehicle status files in the naming scheme of the input
+directory. Files are deterministic for a given seed, so runs on different commits load
+the same data.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from file_processing.handler import OBJECT_NAME_PREFIX, VEHICLES_STATUS_PREFIX, FILE_TIMESTAMP_FORMAT
+from file_processing.loader import OBJECTS_DETECTION_SOURCE, VEHICLE_STATUS_SOURCE
+
+OBJECT_TYPES = ("pedestrians", "cars", "trucks", "signs", "obstacles")
+STATUSES = ("driving", "parking", "accident")
+DEFAULT_START = datetime(2024, 7, 21, tzinfo=timezone.utc)
+
+
+class FleetGenerator:
+    """
+    Generate input files for a simulated fleet. Every file covers one second of simulated time
+    following the previous file, and its rows are spread over the fleet's vehicles.
+    """
+
+    def __init__(
+            self,
+            vehicles: int = 1000,
+            rows_per_file: int = 500,
+            detections_per_event: int = 3,
+            status_share: float = 0.5,
+            seed: int = 0,
+            start: datetime = DEFAULT_START
+    ):
+        """
+        :param vehicles: Number of vehicles in the fleet.
+        :param rows_per_file: Number of events or statuses per file.
+        :param detections_per_event: Average number of detections per objects detection event.
+        :param status_share: Share of the files that are vehicle status files.
+        :param seed: Seed of the random generator.
+        :param start: Simulated time of the first file.
+        """
+        self.rows_per_file = rows_per_file
+        self.detections_per_event = detections_per_event
+        self.status_share = status_share
+        self._random = random.Random(seed)
+        self.vehicle_ids = [f"{self._random.getrandbits(128):032x}" for _ in range(vehicles)]
+        self._clock = start
+        self._sequence = 0
+
+    def next_file(self) -> tuple[str, bytes]:
+        """
+        Generate the next file.
+
+        :return: The file name and content.
+        """
+        file_time = self._clock
+        self._clock += timedelta(seconds=1)
+        self._sequence += 1
+        if self._random.random() < self.status_share:
+            prefix, content = VEHICLES_STATUS_PREFIX, self._vehicle_status(file_time)
+        else:
+            prefix, content = OBJECT_NAME_PREFIX, self._objects_detection(file_time)
+        # The sequence number keeps names unique when several files share a second
+        return f"{prefix}_{file_time.strftime(FILE_TIMESTAMP_FORMAT)}_{self._sequence:06d}.json", content
+
+    def write_file(self, directory: str) -> str:
+        """
+        Write the next file into the directory atomically: the file is written next to it and
+        renamed into it, so a watcher never sees a partial file.
+
+        :param directory: Target directory.
+        :return: Path of the written file.
+        """
+        file_name, content = self.next_file()
+        staging_dir = os.path.join(os.path.dirname(os.path.abspath(directory)), ".fleet_staging")
+        os.makedirs(staging_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=staging_dir, delete=False) as file:
+            file.write(content)
+        file_path = os.path.join(directory, file_name)
+        os.replace(file.name, file_path)
+        return file_path
+
+    def _objects_detection(self, file_time: datetime) -> bytes:
+        rng = self._random
+        max_detections = 2 * self.detections_per_event
+        events = [
+            {
+                "vehicle_id": rng.choice(self.vehicle_ids),
+                "detection_time": _format_time(file_time + timedelta(microseconds=rng.randrange(1_000_000))),
+                "detections": [
+                    {"object_type": rng.choice(OBJECT_TYPES), "object_value": rng.randint(1, 10)}
+                    for _ in range(rng.randint(0, max_detections))
+                ],
+            }
+            for _ in range(self.rows_per_file)
+        ]
+        return json.dumps({OBJECTS_DETECTION_SOURCE.data_key: events}).encode()
+
+    def _vehicle_status(self, file_time: datetime) -> bytes:
+        rng = self._random
+        statuses = [
+            {
+                "vehicle_id": rng.choice(self.vehicle_ids),
+                "report_time": _format_time(file_time + timedelta(microseconds=rng.randrange(1_000_000))),
+                "status": rng.choice(STATUSES),
+            }
+            for _ in range(self.rows_per_file)
+        ]
+        return json.dumps({VEHICLE_STATUS_SOURCE.data_key: statuses}).encode()
+
+
+def _format_time(timestamp: datetime) -> str:
+    return timestamp.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def add_generator_arguments(parser: argparse.ArgumentParser):
+    """
+    Add the FleetGenerator parameters to a command line parser.
+    """
+    parser.add_argument("--vehicles", type=int, default=1000, help="Vehicles in the fleet")
+    parser.add_argument("--rows-per-file", type=int, default=500, help="Events or statuses per file")
+    parser.add_argument("--detections-per-event", type=int, default=3, help="Average detections per event")
+    parser.add_argument("--status-share", type=float, default=0.5, help="Share of vehicle status files")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+
+
+def generator_from_arguments(args: argparse.Namespace) -> FleetGenerator:
+    """
+    Create a FleetGenerator from the parsed arguments of `add_generator_arguments`.
+    """
+    return FleetGenerator(
+        vehicles=args.vehicles,
+        rows_per_file=args.rows_per_file,
+        detections_per_event=args.detections_per_event,
+        status_share=args.status_share,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output_dir", help="Directory receiving the files")
+    parser.add_argument("--files", type=int, default=100, help="Number of files to write")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    generator = generator_from_arguments(args)
+    for _ in range(args.files):
+        generator.write_file(args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
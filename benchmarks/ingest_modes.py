@@ -0,0 +1,85 @@
+"""
+Compare the sync (worker pool) and async ingestion modes on the same set of input files.
+
+    python -m benchmarks.ingest_modes sample_files/ --workers 8 --max-in-flight 256
+
+Every mode loads all files of the input directory into a scratch database, which is
+created before and dropped after the run, and reports files/s.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from sqlalchemy import text
+
+from services.db.config import get_connection_details
+from services.db.postgres_client import PostgresDB
+from services.db.async_postgres_client import AsyncPostgresDB
+from file_processing.handler import load_file
+from file_processing.async_handler import consume_files, DEFAULT_MAX_IN_FLIGHT
+from file_processing.worker_pool import IngestionWorkerPool, DEFAULT_NUM_WORKERS
+from models import Base
+
+BENCHMARK_DATABASE = "benchmark_db"
+
+
+def run_sync(config: dict, file_paths: list[str], num_workers: int) -> float:
+    with PostgresDB(connection_details=config, pool_size=num_workers) as db:
+        pool = IngestionWorkerPool(db=db, process=load_file, num_workers=num_workers)
+        started = time.perf_counter()
+        pool.start()
+        for file_path in file_paths:
+            pool.submit(file_name=os.path.basename(file_path), file_path=file_path)
+        pool.stop()
+        return time.perf_counter() - started
+
+
+async def run_async(config: dict, file_paths: list[str], max_in_flight: int, pool_size: int) -> float:
+    async with AsyncPostgresDB(connection_details=config, pool_size=pool_size) as db:
+        file_queue = asyncio.Queue()
+        started = time.perf_counter()
+        consumer = asyncio.create_task(consume_files(file_queue=file_queue, db=db, max_in_flight=max_in_flight))
+        for file_path in file_paths:
+            file_queue.put_nowait(file_path)
+        await file_queue.join()
+        consumer.cancel()
+        return time.perf_counter() - started
+
+
+def reset_tables(config: dict):
+    with PostgresDB(connection_details=config) as db:
+        db.initialize()
+        tables = ', '.join(table.name for table in Base.metadata.sorted_tables)
+        db.execute(text(f"TRUNCATE {tables}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir", help="Directory containing the input files")
+    parser.add_argument("--workers", type=int, default=DEFAULT_NUM_WORKERS, help="Sync mode worker threads")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT, help="Async mode concurrent files")
+    parser.add_argument("--db-pool-size", type=int, default=20, help="Async mode database connections")
+    args = parser.parse_args()
+
+    file_paths = sorted(entry.path for entry in os.scandir(args.input_dir) if entry.is_file())
+    config = {**get_connection_details(), "database": BENCHMARK_DATABASE}
+    PostgresDB.create_database(config=config)
+    try:
+        results = {}
+        reset_tables(config)
+        results["sync"] = run_sync(config, file_paths, args.workers)
+        reset_tables(config)
+        results["async"] = asyncio.run(run_async(config, file_paths, args.max_in_flight, args.db_pool_size))
+    finally:
+        PostgresDB.drop_database(config=config)
+
+    print(json.dumps({
+        mode: {"seconds": round(elapsed, 3), "files_per_second": round(len(file_paths) / elapsed, 1)}
+        for mode, elapsed in results.items()
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
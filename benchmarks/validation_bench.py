@@ -0,0 +1,90 @@
+"""
+Microbenchmark of parsing and validating objects detection files.
+
+    python -m benchmarks.validation_bench --sizes 10 10000 1000000
+
+Compares, per file size, the per-item path (json.loads -> model(**item) -> model_dump) with
+the pydantic-core fast path (TypeAdapter.validate_json over the whole document into row
+tuples) and prints rows/s for both as JSON.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from file_processing.loader import OBJECTS_DETECTION_SOURCE, validate_rows
+
+OBJECT_TYPES = ["pedestrians", "cars", "trucks", "signs", "obstacles"]
+
+
+def generate_document(rows: int, seed: int = 0) -> bytes:
+    """
+    Generate an objects detection document with the given number of events.
+    """
+    rng = random.Random(seed)
+    start = datetime(2024, 7, 21, tzinfo=timezone.utc)
+    events = [
+        {
+            "vehicle_id": f"{rng.getrandbits(128):032x}",
+            "detection_time": (start + timedelta(milliseconds=index * 250)).isoformat().replace("+00:00", "Z"),
+            "detections": [
+                {"object_type": rng.choice(OBJECT_TYPES), "object_value": rng.randint(1, 10)}
+                for _ in range(rng.randint(1, 4))
+            ],
+        }
+        for index in range(rows)
+    ]
+    return json.dumps({OBJECTS_DETECTION_SOURCE.data_key: events}).encode()
+
+
+def per_item(content: bytes) -> int:
+    data = json.loads(content)
+    source_model = OBJECTS_DETECTION_SOURCE.source_model
+    return len([source_model(**item).model_dump() for item in data[OBJECTS_DETECTION_SOURCE.data_key]])
+
+
+def fast_path(content: bytes) -> int:
+    return len(validate_rows(
+        content=content, source_model=OBJECTS_DETECTION_SOURCE.source_model, data_key=OBJECTS_DETECTION_SOURCE.data_key
+    ))
+
+
+def measure(func, content: bytes, min_seconds: float) -> float:
+    """
+    Run func repeatedly for at least min_seconds and return the best rows/s.
+    """
+    best = 0.0
+    total = 0.0
+    while total < min_seconds:
+        started = time.perf_counter()
+        rows = func(content)
+        elapsed = time.perf_counter() - started
+        total += elapsed
+        best = max(best, rows / elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 10_000, 1_000_000], help="Rows per file")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="Minimum run time per measurement")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        content = generate_document(size)
+        per_item_rate = measure(per_item, content, args.min_seconds)
+        fast_path_rate = measure(fast_path, content, args.min_seconds)
+        results.append({
+            "rows": size,
+            "bytes": len(content),
+            "per_item_rows_per_second": round(per_item_rate),
+            "fast_path_rows_per_second": round(fast_path_rate),
+            "speedup": round(fast_path_rate / per_item_rate, 2),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import asyncio
+import os
+
+from pydantic import ValidationError
+from json.decoder import JSONDecodeError
+from sqlalchemy.exc import SQLAlchemyError
+from watchdog.events import FileSystemEventHandler
+
+from services.db.async_postgres_client import AsyncPostgresDB
+from file_processing.handler import get_prefix, DATA_SOURCES
+from file_processing.loader import iter_file_chunks, DataSource, DEFAULT_BATCH_SIZE
+from file_processing.formats import UnsupportedFormatError, detect_format, open_decoded
+from logger_config import get_logger, get_event_log
+
+# Number of files processed concurrently by the event loop
+DEFAULT_MAX_IN_FLIGHT = 256
+
+# Set up logging
+logger = get_logger(__name__)
+file_events = get_event_log(__name__)
+
+
+async def async_load_file(file_name: str, file_path: str, db: AsyncPostgresDB, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Asynchronous counterpart of handler.load_file. The file is read and validated in
+    the default executor, so the event loop only waits on it, and the validated chunks
+    are inserted in a single transaction.
+
+    :param file_name: Name of the file to check.
+    :param file_path: Path to the file to be loaded.
+    :param db: Instance of AsyncPostgresDB to handle database operations.
+    :param batch_size: Number of items inserted per statement.
+    """
+    data_source = DATA_SOURCES.get(get_prefix(file_name=file_name))
+    if not data_source:
+        logger.warning(f"No load function found for file name: {file_name}")
+        return
+    try:
+        await _load_data(file_path=file_path, db=db, data_source=data_source, batch_size=batch_size)
+        file_events.info('loaded', "Successfully loaded file: %s", file_path)
+    except JSONDecodeError as e:
+        logger.error(f"JSON decode error for file {file_path}: {e}")
+    except ValidationError as e:
+        logger.error(f"Validation error for file {file_path}: {e}")
+    except SQLAlchemyError as e:
+        logger.error(f"Database error for file {file_path}: {e}")
+    except UnsupportedFormatError as e:
+        logger.error(f"Unsupported format for file {file_path}: {e}")
+
+
+async def _load_data(file_path: str, db: AsyncPostgresDB, data_source: DataSource, batch_size: int):
+    file_format = await asyncio.to_thread(detect_format, file_path)
+    file = await asyncio.to_thread(open_decoded, file_path, file_format)
+    try:
+        chunks = iter_file_chunks(
+            file=file,
+            file_format=file_format,
+            source_model=data_source.source_model,
+            data_key=data_source.data_key,
+            batch_size=batch_size
+        )
+        async with db.transaction() as session:
+            while chunk := await asyncio.to_thread(next, chunks, None):
+                await db.insert(model=data_source.db_model, data=chunk, session=session)
+    finally:
+        await asyncio.to_thread(file.close)
+
+
+class AsyncFileHandler(FileSystemEventHandler):
+    """
+    Event handler bridging watchdog's observer thread into an asyncio event loop.
+    Created files are put on a bounded asyncio queue; when it is full the observer
+    thread blocks until the loop catches up.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, file_queue: asyncio.Queue):
+        self.loop = loop
+        self.file_queue = file_queue
+
+    def on_created(self, event):
+        """
+        Handle the event when a new file is created.
+
+        :param event: The event representing the file creation.
+        """
+        if event.is_directory:
+            return  # Ignore directory creation events
+
+        file_path = event.src_path
+        file_events.info('detected', "Detected new file: %s", file_path)
+        asyncio.run_coroutine_threadsafe(self.file_queue.put(file_path), self.loop).result()
+
+
+async def consume_files(file_queue: asyncio.Queue, db: AsyncPostgresDB, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+    """
+    Load files from the queue with up to `max_in_flight` files in progress at once.
+    Runs until cancelled, await `file_queue.join()` first to let queued files finish.
+
+    :param file_queue: Queue of paths of files to load.
+    :param db: Instance of AsyncPostgresDB to handle database operations.
+    :param max_in_flight: Maximum number of files loaded concurrently.
+    """
+    async def worker():
+        while True:
+            file_path = await file_queue.get()
+            try:
+                await async_load_file(file_name=os.path.basename(file_path), file_path=file_path, db=db)
+            except Exception as e:
+                logger.exception(f"Unexpected error processing file {file_path}: {e}")
+            finally:
+                file_queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max_in_flight)]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
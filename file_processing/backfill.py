@@ -0,0 +1,542 @@
+import os
+import time
+from json.decoder import JSONDecodeError
+from typing import Iterable
+
+from pydantic import ValidationError
+from sqlalchemy import BigInteger, Column, Index, Integer, MetaData, String, Table, Text, TIMESTAMP, func, text
+from sqlalchemy import insert, select, update, delete
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from services.db.postgres_client import PostgresDB
+from services.db.bulk import COPY
+from services.db.ledger import IngestionLedger, DuplicateFileError, FileRecord, LOADED, fingerprint_file
+from services.db.partitions import partition_start, next_partition_start
+from models.db_models import ObjectsDetectionEvent, Detection, DetectionHourlyRollup, VehicleStatus, IngestedFile
+from file_processing.handler import DATA_SOURCES, get_prefix
+from file_processing.loader import DataSource, load_data
+from file_processing.formats import UnsupportedFormatError
+from file_processing.parallel_parser import ParallelParser
+from services.observer.scanner import backlog_order
+from logger_config import get_logger
+
+# Approximate number of staged rows merged into the real tables per transaction
+DEFAULT_MERGE_BATCH_ROWS = 1_000_000
+# Interval in seconds between progress log lines
+DEFAULT_PROGRESS_INTERVAL = 10.0
+# maintenance_work_mem of the sessions building the deferred indexes
+INDEX_BUILD_MEMORY = '1GB'
+
+# Tables whose secondary indexes may be dropped during the merge and built again afterwards
+INDEXED_MODELS = (ObjectsDetectionEvent, Detection, DetectionHourlyRollup, VehicleStatus)
+
+# Set up logging
+logger = get_logger(__name__)
+
+STAGING_METADATA = MetaData()
+
+# Staged files, with their ledger identity, logged so that the progress survives a crash
+BACKFILL_FILES = Table(
+    'backfill_files',
+    STAGING_METADATA,
+    Column('file_id', Integer, primary_key=True),
+    Column('file_name', String, nullable=False),
+    Column('file_size', BigInteger, nullable=False),
+    Column('content_hash', String(64), nullable=False, unique=True),
+    Column('target', String, nullable=False),
+    Column('row_count', Integer),
+    Column('started_at', TIMESTAMP(timezone=True)),
+    Column('merged_at', TIMESTAMP(timezone=True)),
+)
+
+# Definitions of the indexes dropped for the merge, until they are built again
+DEFERRED_INDEXES = Table(
+    'backfill_deferred_indexes',
+    STAGING_METADATA,
+    Column('index_name', String, primary_key=True),
+    Column('definition', Text, nullable=False),
+)
+
+
+def _staging_table(model, columns: list[str]) -> Table:
+    """
+    Define the UNLOGGED staging table of a model. Staged rows take the file_id of the transaction
+    writing them from a setting, so COPY does not send it with every row, and the BRIN index on
+    file_id, which only grows, lets every merge batch read its range of files.
+    """
+    table = Table(
+        f"backfill_{model.__tablename__}",
+        STAGING_METADATA,
+        Column('file_id', Integer, nullable=False, server_default=text("current_setting('backfill.file_id')::integer")),
+        *[Column(name, model.__table__.c[name].type) for name in columns],
+        prefixes=['UNLOGGED'],
+    )
+    Index(f"ix_{table.name}_file_id", table.c.file_id, postgresql_using='brin')
+    return table
+
+
+class StagingModel:
+    """
+    Target of PostgresDB.insert writing the rows of a model into its staging table with COPY.
+    """
+    bulk_strategy = COPY
+
+    def __init__(self, table: Table):
+        self.__table__ = table
+
+
+STAGING_MODELS = {
+    ObjectsDetectionEvent: StagingModel(_staging_table(ObjectsDetectionEvent, ['vehicle_id', 'detection_time', 'detections'])),
+    VehicleStatus: StagingModel(_staging_table(VehicleStatus, ['vehicle_id', 'report_time', 'status'])),
+}
+
+# Unmerged files of the merge batch, for the statements below
+_BATCH_FILES = (
+    "SELECT file_id FROM backfill_files "
+    "WHERE file_id BETWEEN :first AND :last AND target = :target AND merged_at IS NULL"
+)
+
+# Events get their ids from the sequence as they are inserted, and their detections and hourly
+# rollups are derived from the inserted events in the same statement, as ObjectsDetectionEvent.related_rows does
+MERGE_STATEMENTS = {
+    ObjectsDetectionEvent: f"""
+        WITH events AS (
+            INSERT INTO {ObjectsDetectionEvent.__tablename__} (vehicle_id, detection_time, detections)
+            SELECT vehicle_id, detection_time, detections
+            FROM backfill_{ObjectsDetectionEvent.__tablename__}
+            WHERE file_id IN ({_BATCH_FILES})
+            RETURNING id, vehicle_id, detection_time, detections
+        ), detections AS (
+            INSERT INTO {Detection.__tablename__} (event_id, vehicle_id, detection_time, object_type, object_value)
+            SELECT events.id, events.vehicle_id, events.detection_time,
+                   item ->> 'object_type', (item ->> 'object_value')::integer
+            FROM events CROSS JOIN LATERAL json_array_elements(events.detections::json) AS item
+            RETURNING vehicle_id, detection_time, object_type, object_value
+        )
+        INSERT INTO {DetectionHourlyRollup.__tablename__}
+            (vehicle_id, hour, object_type, detection_count, object_value_sum)
+        SELECT vehicle_id, date_trunc('hour', detection_time, 'UTC'), object_type, count(*), sum(object_value)
+        FROM detections
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (vehicle_id, hour, object_type) DO UPDATE SET
+            detection_count = {DetectionHourlyRollup.__tablename__}.detection_count + EXCLUDED.detection_count,
+            object_value_sum = {DetectionHourlyRollup.__tablename__}.object_value_sum + EXCLUDED.object_value_sum
+    """,
+    # Newest-wins, as VehicleStatus.insert_statement
+    VehicleStatus: f"""
+        INSERT INTO {VehicleStatus.__tablename__} (vehicle_id, report_time, status)
+        SELECT DISTINCT ON (vehicle_id) vehicle_id, report_time, status
+        FROM backfill_{VehicleStatus.__tablename__}
+        WHERE file_id IN ({_BATCH_FILES})
+        ORDER BY vehicle_id, report_time DESC
+        ON CONFLICT (vehicle_id) DO UPDATE SET report_time = EXCLUDED.report_time, status = EXCLUDED.status
+        WHERE {VehicleStatus.__tablename__}.report_time IS NULL
+           OR {VehicleStatus.__tablename__}.report_time < EXCLUDED.report_time
+    """,
+}
+
+# The merged files are recorded as loaded, unless a file with the same content was loaded meanwhile
+RECORD_LOADED_STATEMENT = f"""
+    INSERT INTO {IngestedFile.__tablename__}
+        (file_name, file_size, content_hash, row_count, status, started_at, finished_at)
+    SELECT file_name, file_size, content_hash, row_count, '{LOADED}', started_at, now()
+    FROM backfill_files
+    WHERE file_id IN ({_BATCH_FILES})
+    ON CONFLICT (content_hash) DO UPDATE SET
+        file_name = EXCLUDED.file_name, file_size = EXCLUDED.file_size, row_count = EXCLUDED.row_count,
+        status = EXCLUDED.status, error = NULL, started_at = EXCLUDED.started_at, finished_at = EXCLUDED.finished_at
+    WHERE {IngestedFile.__tablename__}.status != '{LOADED}'
+    RETURNING content_hash
+"""
+
+SECONDARY_INDEXES_QUERY = """
+    SELECT index_class.relname, pg_get_indexdef(index_class.oid)
+    FROM pg_index
+    JOIN pg_class AS index_class ON index_class.oid = pg_index.indexrelid
+    JOIN pg_class AS table_class ON table_class.oid = pg_index.indrelid
+    WHERE table_class.relname = ANY(:tables) AND pg_index.indisprimary IS FALSE AND pg_index.indisunique IS FALSE
+      AND pg_table_is_visible(table_class.oid)
+"""
+
+
+def find_input_files(paths: Iterable[str]) -> list[str]:
+    """
+    List the input files under the given files and directories, directories being walked
+    recursively, oldest first according to the timestamp in their names. Names starting with
+    a dot are ignored.
+
+    :param paths: Paths to files and directories.
+    :return: Paths to the files.
+    """
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for directory, subdirectories, file_names in os.walk(path):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith('.')]
+            files.extend(os.path.join(directory, name) for name in file_names if not name.startswith('.'))
+    return sorted(files, key=lambda file_path: (backlog_order(os.path.basename(file_path)), file_path))
+
+
+class BackfillProgress:
+    """
+    Counters of a backfill phase, logged every `interval` seconds.
+    """
+
+    def __init__(self, phase: str, total: int, unit: str, interval: float = DEFAULT_PROGRESS_INTERVAL):
+        """
+        :param phase: Name of the phase in the log lines.
+        :param total: Number of units to process.
+        :param unit: Name of the units, e.g. files.
+        :param interval: Interval in seconds between progress log lines.
+        """
+        self.phase = phase
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+        self.done = 0
+        self.rows = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started = self._last_log = time.monotonic()
+
+    def add(self, rows: int = 0, size: int = 0, skipped: bool = False, failed: bool = False):
+        """
+        Count a processed unit, and log the progress if due.
+
+        :param rows: Number of rows of the unit.
+        :param size: Size of the unit in bytes.
+        :param skipped: Whether the unit was skipped.
+        :param failed: Whether the unit failed.
+        """
+        self.done += 1
+        self.rows += rows
+        self.bytes += size
+        self.skipped += skipped
+        self.failed += failed
+        if time.monotonic() - self._last_log >= self.interval:
+            self.log()
+
+    def log(self):
+        """
+        Log the progress and throughput of the phase.
+        """
+        self._last_log = time.monotonic()
+        summary = self.summary()
+        logger.info(
+            f"{self.phase}: {self.done}/{self.total} {self.unit}, {self.rows} rows, "
+            f"{self.bytes / 2 ** 20:.1f} MB in {summary['seconds']:.0f}s "
+            f"({summary['rows_per_second']:.0f} rows/s, {summary['mb_per_second']:.1f} MB/s), "
+            f"{self.skipped} skipped, {self.failed} failed"
+        )
+
+    def summary(self) -> dict:
+        """
+        :return: The counters and throughput of the phase.
+        """
+        seconds = time.monotonic() - self.started
+        return {
+            self.unit: self.done,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'seconds': round(seconds, 3),
+            'rows_per_second': self.rows / seconds if seconds else 0.0,
+            'mb_per_second': self.bytes / 2 ** 20 / seconds if seconds else 0.0,
+        }
+
+
+class Backfill:
+    """
+    One-shot load of archived input files, without the per-row costs of the live path.
+
+    Files are first staged: every file is validated as in the live path, its rows are written
+    with COPY into the UNLOGGED staging table of its model, which writes no WAL and has no index
+    but a BRIN one, and it is recorded in backfill_files, all in one transaction per file. Files
+    whose content is already loaded or staged are skipped, and files that fail are recorded as
+    failed in the ledger.
+
+    The staged files are then merged into the real tables in batches of about
+    `merge_batch_rows` rows, one transaction per batch: a handful of set-based statements insert
+    the events with their detections and hourly rollups, upsert the vehicle statuses
+    newest-wins, and record the files as loaded in the ledger. With `defer_indexes`, the
+    secondary indexes of the real tables are dropped before the merge and built again after it.
+
+    The backfill is resumable: run it again with the same files after an interruption. Staged
+    and merged files are skipped, the remaining batches are merged, and dropped indexes are
+    built. If the database crashed, the UNLOGGED staging tables were emptied and their unmerged
+    files are staged again.
+    """
+
+    def __init__(
+            self,
+            db: PostgresDB,
+            parser: ParallelParser | None = None,
+            merge_batch_rows: int = DEFAULT_MERGE_BATCH_ROWS,
+            defer_indexes: bool = False,
+            progress_interval: float = DEFAULT_PROGRESS_INTERVAL
+    ):
+        """
+        :param db: Instance of PostgresDB to handle database operations, with `partitions` set if
+                   the tables are partitioned.
+        :param parser: Optional ParallelParser for large files, started by the caller.
+        :param merge_batch_rows: Approximate number of staged rows merged per transaction.
+        :param defer_indexes: Whether to drop the secondary indexes during the merge and build them afterwards.
+        :param progress_interval: Interval in seconds between progress log lines.
+        """
+        self.db = db
+        self.parser = parser
+        self.merge_batch_rows = merge_batch_rows
+        self.defer_indexes = defer_indexes
+        self.progress_interval = progress_interval
+        self.ledger = IngestionLedger(db=db)
+
+    def run(self, file_paths: list[str]) -> dict:
+        """
+        Stage the files, merge them and build the deferred indexes.
+
+        :param file_paths: Paths to the input files, see `find_input_files`.
+        :return: Counters and throughput of every phase.
+        """
+        self.prepare()
+        summary = {'stage': self.stage_files(file_paths), 'merge': self.merge()}
+        started = time.monotonic()
+        built = self.build_deferred_indexes()
+        summary['indexes'] = {'indexes': built, 'seconds': round(time.monotonic() - started, 3)}
+        self.finish()
+        return summary
+
+    def prepare(self):
+        """
+        Create the backfill tables, and forget the unmerged files whose staged rows were lost.
+        """
+        with self.db.transaction():
+            for table in STAGING_METADATA.sorted_tables:
+                self.db.execute(CreateTable(table, if_not_exists=True))
+                for index in table.indexes:
+                    self.db.execute(CreateIndex(index, if_not_exists=True))
+        for model, staging_model in STAGING_MODELS.items():
+            staging_table = staging_model.__table__
+            if self.db.execute(select(select(staging_table.c.file_id).limit(1).exists())).scalar():
+                continue
+            # An UNLOGGED table is emptied when the database recovers from a crash
+            lost = self.db.execute(
+                delete(BACKFILL_FILES)
+                .where(BACKFILL_FILES.c.target == model.__tablename__)
+                .where(BACKFILL_FILES.c.merged_at.is_(None))
+                .where(BACKFILL_FILES.c.row_count > 0)
+            ).rowcount
+            if lost:
+                logger.warning(f"{staging_table.name} lost its rows, staging its {lost} unmerged files again")
+
+    def stage_files(self, file_paths: list[str]) -> dict:
+        """
+        Stage the files, see `stage_file`.
+
+        :param file_paths: Paths to the input files.
+        :return: Counters and throughput of the phase.
+        """
+        progress = BackfillProgress(
+            phase="Staging", total=len(file_paths), unit='files', interval=self.progress_interval
+        )
+        for file_path in file_paths:
+            size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            row_count = self.stage_file(file_path)
+            progress.add(rows=row_count or 0, size=size, skipped=row_count is None, failed=row_count == -1)
+        progress.log()
+        return progress.summary()
+
+    def stage_file(self, file_path: str) -> int | None:
+        """
+        Validate a file and write its rows into the staging table of its model.
+
+        :param file_path: Path to the input file.
+        :return: Number of staged rows, None if the file was skipped, -1 if it failed.
+        """
+        prefix = get_prefix(file_name=os.path.basename(file_path))
+        if not prefix:
+            logger.warning(f"Skipping file of unknown type: {file_path}")
+            return
+        record = None
+        try:
+            record = fingerprint_file(file_path)
+            if self._is_known(record.content_hash):
+                return
+            return self._stage(file_path=file_path, record=record, data_source=DATA_SOURCES[prefix])
+        except (JSONDecodeError, ValidationError, UnsupportedFormatError, OSError) as e:
+            logger.error(f"Could not stage file {file_path}: {e}")
+            if record:
+                self.ledger.record_failed(record=record, error=e)
+            return -1
+
+    def merge(self) -> dict:
+        """
+        Merge the staged files into the real tables, one batch per transaction.
+
+        :return: Counters and throughput of the phase.
+        """
+        batches = self._merge_batches()
+        progress = BackfillProgress(
+            phase="Merging", total=len(batches), unit='batches', interval=self.progress_interval
+        )
+        if batches and self.defer_indexes:
+            self.drop_secondary_indexes()
+        for model, first, last, row_count in batches:
+            while True:
+                try:
+                    merged, skipped = self._merge_batch(model=model, first=first, last=last)
+                    break
+                except DuplicateFileError as e:
+                    logger.warning(f"Retrying merge batch of files {first} to {last}: {e}")
+            progress.add(rows=row_count, skipped=skipped > 0)
+            logger.info(f"Merged {merged} {model.__tablename__} files {first} to {last}, {skipped} already loaded")
+        if batches:
+            with self.db.transaction():
+                for model in STAGING_MODELS:
+                    self.db.execute(text(f"ANALYZE {model.__tablename__}"))
+        progress.log()
+        return progress.summary()
+
+    def drop_secondary_indexes(self):
+        """
+        Drop the secondary indexes of the real tables, keeping their definitions to build them again.
+        Primary keys and unique indexes are kept, the merge relies on them.
+        """
+        tables = [model.__tablename__ for model in INDEXED_MODELS]
+        with self.db.transaction():
+            indexes = self.db.execute(text(SECONDARY_INDEXES_QUERY).bindparams(tables=tables)).all()
+            for index_name, definition in indexes:
+                # The index of a partitioned table is defined ON ONLY the table, which would create an invalid
+                # index without the partitions' indexes; without ONLY the partitions are indexed too
+                definition = definition.replace(' ON ONLY ', ' ON ', 1)
+                self.db.execute(insert(DEFERRED_INDEXES).values(index_name=index_name, definition=definition))
+                self.db.execute(text(f'DROP INDEX "{index_name}"'))
+        logger.info(f"Dropped {len(indexes)} secondary indexes for the merge")
+
+    def build_deferred_indexes(self) -> int:
+        """
+        Build the indexes dropped by `drop_secondary_indexes`, one transaction per index.
+
+        :return: Number of indexes built.
+        """
+        indexes = self.db.execute(select(DEFERRED_INDEXES.c.index_name, DEFERRED_INDEXES.c.definition)).all()
+        for index_name, definition in indexes:
+            started = time.monotonic()
+            with self.db.transaction():
+                self.db.execute(text(f"SET LOCAL maintenance_work_mem = '{INDEX_BUILD_MEMORY}'"))
+                self.db.execute(text(definition))
+                self.db.execute(delete(DEFERRED_INDEXES).where(DEFERRED_INDEXES.c.index_name == index_name))
+            logger.info(f"Built index {index_name} in {time.monotonic() - started:.1f}s")
+        return len(indexes)
+
+    def finish(self):
+        """
+        Empty the staging tables once every staged file is merged.
+        """
+        unmerged = select(BACKFILL_FILES.c.file_id).where(BACKFILL_FILES.c.merged_at.is_(None)).limit(1).exists()
+        if self.db.execute(select(unmerged)).scalar():
+            return
+        with self.db.transaction():
+            for staging_model in STAGING_MODELS.values():
+                self.db.execute(text(f"TRUNCATE {staging_model.__table__.name}"))
+            self.db.execute(delete(BACKFILL_FILES))
+
+    def _is_known(self, content_hash: str) -> bool:
+        loaded = select(IngestedFile.id).where(IngestedFile.content_hash == content_hash, IngestedFile.status == LOADED)
+        staged = select(BACKFILL_FILES.c.file_id).where(BACKFILL_FILES.c.content_hash == content_hash)
+        return self.db.execute(select(loaded.exists() | staged.exists())).scalar()
+
+    def _stage(self, file_path: str, record: FileRecord, data_source: DataSource) -> int:
+        staging_source = data_source._replace(db_model=STAGING_MODELS[data_source.db_model])
+        with self.db.transaction():
+            file_id = self.db.execute(
+                insert(BACKFILL_FILES)
+                .values(
+                    file_name=record.file_name,
+                    file_size=record.file_size,
+                    content_hash=record.content_hash,
+                    target=data_source.db_model.__tablename__,
+                    started_at=record.started_at
+                )
+                .returning(BACKFILL_FILES.c.file_id)
+            ).scalar()
+            self.db.execute(text("SELECT set_config('backfill.file_id', :file_id, true)").bindparams(file_id=str(file_id)))
+            if self.parser and self.parser.accepts(file_path):
+                row_count = self.parser.load(file_path=file_path, db=self.db, data_source=staging_source)
+            else:
+                row_count = load_data(file_path=file_path, db=self.db, **staging_source._asdict())
+            self.db.execute(
+                update(BACKFILL_FILES).where(BACKFILL_FILES.c.file_id == file_id).values(row_count=row_count)
+            )
+        return row_count
+
+    def _merge_batches(self) -> list[tuple[type, int, int, int]]:
+        """
+        Group the unmerged files into batches of consecutive files of the same model.
+
+        :return: (model, first file_id, last file_id, row count) of every batch.
+        """
+        models = {model.__tablename__: model for model in STAGING_MODELS}
+        files = self.db.execute(
+            select(BACKFILL_FILES.c.file_id, BACKFILL_FILES.c.target, BACKFILL_FILES.c.row_count)
+            .where(BACKFILL_FILES.c.merged_at.is_(None))
+            .order_by(BACKFILL_FILES.c.target, BACKFILL_FILES.c.file_id)
+        ).all()
+        batches = []
+        for file_id, target, row_count in files:
+            model = models[target]
+            if batches and batches[-1][0] is model and batches[-1][3] < self.merge_batch_rows:
+                _, first, _, rows = batches[-1]
+                batches[-1] = (model, first, file_id, rows + (row_count or 0))
+            else:
+                batches.append((model, file_id, file_id, row_count or 0))
+        return batches
+
+    def _merge_batch(self, model, first: int, last: int) -> tuple[int, int]:
+        """
+        Merge a batch of staged files of a model and record them as loaded.
+
+        :return: Numbers of files merged and of files skipped because they were loaded meanwhile.
+        """
+        if model is ObjectsDetectionEvent and self.db.partitions:
+            self._ensure_partitions(first=first, last=last)
+        batch = {'first': first, 'last': last, 'target': model.__tablename__}
+        batch_files = (
+            BACKFILL_FILES.c.file_id.between(first, last)
+            & (BACKFILL_FILES.c.target == model.__tablename__)
+            & BACKFILL_FILES.c.merged_at.is_(None)
+        )
+        with self.db.transaction():
+            loaded_meanwhile = (
+                select(IngestedFile.id)
+                .where(IngestedFile.content_hash == BACKFILL_FILES.c.content_hash, IngestedFile.status == LOADED)
+                .exists()
+            )
+            skipped = self.db.execute(
+                update(BACKFILL_FILES).where(batch_files & loaded_meanwhile).values(merged_at=func.now())
+            ).rowcount
+            expected = self.db.execute(select(func.count()).where(batch_files)).scalar()
+            self.db.execute(text(MERGE_STATEMENTS[model]).bindparams(**batch))
+            recorded = len(self.db.execute(text(RECORD_LOADED_STATEMENT).bindparams(**batch)).all())
+            if recorded != expected:
+                raise DuplicateFileError(f"{expected - recorded} files were loaded concurrently")
+            self.db.execute(update(BACKFILL_FILES).where(batch_files).values(merged_at=func.now()))
+        return expected, skipped
+
+    def _ensure_partitions(self, first: int, last: int):
+        staging_table = STAGING_MODELS[ObjectsDetectionEvent].__table__
+        low, high = self.db.execute(
+            select(func.min(staging_table.c.detection_time), func.max(staging_table.c.detection_time))
+            .where(staging_table.c.file_id.between(first, last))
+        ).one()
+        if low is None:
+            return
+        interval = self.db.partitions.interval
+        starts = [partition_start(low, interval)]
+        while (start := next_partition_start(starts[-1], interval)) <= high:
+            starts.append(start)
+        self.db.partitions.ensure_partitions(starts)
@@ -0,0 +1,209 @@
+import threading
+import time
+from typing import Callable, Iterable, NamedTuple
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from services.db.postgres_client import PostgresDB
+from services.db.ledger import IngestionLedger, DuplicateFileError, FileRecord
+from services.metrics import record_file, OUTCOME_LOADED, OUTCOME_SKIPPED, OUTCOME_FAILED
+from models import Base
+from logger_config import get_logger, get_event_log
+
+DEFAULT_MAX_ROWS = 50_000
+DEFAULT_MAX_BYTES = 16 * 2 ** 20
+DEFAULT_MAX_LATENCY = 0.5
+
+# Set up logging
+logger = get_logger(__name__)
+file_events = get_event_log(__name__)
+
+
+class _PendingFile(NamedTuple):
+    file_path: str
+    model: type[Base]
+    rows: list[dict]
+    record: FileRecord | None
+    prefix: str | None
+
+
+class MicroBatcher:
+    """
+    Coalesce the validated rows of many small files into a single transaction.
+
+    Rows are buffered per file and flushed together as soon as the buffered row count or
+    file size reaches its limit, or the oldest buffered file has waited `max_latency` seconds.
+    If the batch transaction fails, with any error, its files are retried one transaction each, so a
+    bad file only fails itself. The outcome of every file is logged and reported to `on_result`. With a ledger,
+    files carrying a ledger record are recorded in the transaction writing their rows.
+    """
+
+    def __init__(
+            self,
+            db: PostgresDB,
+            max_rows: int = DEFAULT_MAX_ROWS,
+            max_bytes: int = DEFAULT_MAX_BYTES,
+            max_latency: float = DEFAULT_MAX_LATENCY,
+            on_result: Callable[[str, Exception | None], None] | None = None,
+            ledger: IngestionLedger | None = None
+    ):
+        """
+        :param db: Instance of PostgresDB to handle database operations.
+        :param max_rows: Number of buffered rows triggering a flush.
+        :param max_bytes: Total size in bytes of the buffered files triggering a flush.
+        :param max_latency: Maximum number of seconds a file stays buffered.
+        :param on_result: Callable invoked as on_result(file_path, error) once a file is written or failed.
+        :param ledger: Optional IngestionLedger recording the written files.
+        """
+        self.db = db
+        self.ledger = ledger
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.on_result = on_result
+        self._lock = threading.Lock()
+        self._pending: list[_PendingFile] = []
+        self._rows = 0
+        self._bytes = 0
+        self._oldest = None
+        self._stopped = threading.Event()
+        self._timer = None
+
+    def start(self):
+        """
+        Start the background thread flushing batches that reached their maximum latency.
+        """
+        self._stopped.clear()
+        self._timer = threading.Thread(target=self._run_timer, name="micro-batcher", daemon=True)
+        self._timer.start()
+
+    def stop(self):
+        """
+        Stop the background thread and flush the remaining rows.
+        """
+        self._stopped.set()
+        if self._timer:
+            self._timer.join()
+            self._timer = None
+        self.flush()
+
+    def add(
+            self,
+            file_path: str,
+            model: Base,
+            rows: list[dict],
+            size_bytes: int = 0,
+            record: FileRecord | None = None,
+            prefix: str | None = None
+    ):
+        """
+        Buffer the validated rows of a file, flushing the batch if a threshold is reached.
+
+        :param file_path: Path of the file the rows were read from.
+        :param model: The SQLAlchemy model to insert the rows into.
+        :param rows: A list of dictionaries representing the rows.
+        :param size_bytes: Size of the file, counted towards max_bytes.
+        :param record: The file's ledger record, if the file is tracked by the ledger.
+        :param prefix: Type of the file, used to label its metrics.
+        """
+        with self._lock:
+            self._pending.append(
+                _PendingFile(file_path=file_path, model=model, rows=rows, record=record, prefix=prefix)
+            )
+            self._rows += len(rows)
+            self._bytes += size_bytes
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = self._rows >= self.max_rows or self._bytes >= self.max_bytes
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered rows in a single transaction.
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+            self._rows = self._bytes = 0
+            self._oldest = None
+        if not pending:
+            return
+        try:
+            with self.db.transaction():
+                for model, rows in group_by_model(pending).items():
+                    self.db.insert(model=model, data=rows)
+                for pending_file in pending:
+                    self._record_loaded(pending_file)
+        except Exception as e:
+            # Not only database errors, e.g. a row the driver cannot encode: no file may be left without a result
+            logger.warning(f"Batch of {len(pending)} files failed, retrying files separately: {e}")
+            self._write_separately(pending)
+            return
+        for pending_file in pending:
+            self._report(pending_file, None)
+
+    def _write_separately(self, pending: list[_PendingFile]):
+        for pending_file in pending:
+            try:
+                with self.db.transaction():
+                    self.db.insert(model=pending_file.model, data=pending_file.rows)
+                    self._record_loaded(pending_file)
+            except DuplicateFileError as e:
+                self._report(pending_file, e)
+            except Exception as e:
+                if self.ledger and pending_file.record:
+                    self.ledger.record_failed(record=pending_file.record, error=e)
+                self._report(pending_file, e)
+            else:
+                self._report(pending_file, None)
+
+    def _report(self, pending_file: _PendingFile, error: Exception | None):
+        _log_result(file_path=pending_file.file_path, error=error)
+        if isinstance(error, DuplicateFileError):
+            outcome = OUTCOME_SKIPPED
+        else:
+            outcome = OUTCOME_FAILED if error else OUTCOME_LOADED
+        record_file(
+            file_path=pending_file.file_path, prefix=pending_file.prefix, outcome=outcome, row_count=len(pending_file.rows)
+        )
+        if self.on_result:
+            self.on_result(pending_file.file_path, error)
+
+    def _record_loaded(self, pending_file: _PendingFile):
+        if self.ledger and pending_file.record:
+            self.ledger.record_loaded(record=pending_file.record, row_count=len(pending_file.rows))
+
+    def _run_timer(self):
+        try:
+            while not self._stopped.wait(self.max_latency / 4):
+                with self._lock:
+                    expired = self._oldest is not None and time.monotonic() - self._oldest >= self.max_latency
+                if expired:
+                    self.flush()
+        finally:
+            self.db.remove_session()
+
+
+def group_by_model(pending: Iterable) -> dict:
+    """
+    Concatenate the rows of several files per model, to write each model in one statement.
+
+    :param pending: Files with a `model` and `rows`, e.g. the files of a batch.
+    :return: A dictionary of model -> rows, in the order of the files.
+    """
+    rows_by_model = {}
+    for pending_file in pending:
+        rows_by_model.setdefault(pending_file.model, []).extend(pending_file.rows)
+    return rows_by_model
+
+
+def _log_result(file_path: str, error: Exception | None):
+    if isinstance(error, DuplicateFileError):
+        file_events.info('skipped', "Skipping already loaded file: %s", file_path)
+    elif isinstance(error, SQLAlchemyError):
+        logger.error(f"Database error for file {file_path}: {error}")
+    elif error:
+        logger.error(f"Error loading file {file_path}: {error!r}")
+    else:
+        file_events.info('loaded', "Successfully loaded file: %s", file_path)
@@ -0,0 +1,219 @@
+import os
+import socket
+import threading
+import time
+from typing import Callable
+
+from logger_config import get_logger
+
+DEFAULT_PROCESSING_DIR = 'processing/'
+# Seconds between two heartbeats of a worker, and since the last heartbeat after which its claims are recovered
+DEFAULT_HEARTBEAT_INTERVAL = 5.0
+DEFAULT_STALE_AFTER = 60.0
+HEARTBEAT_FILE_NAME = '.heartbeat'
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+def default_worker_id() -> str:
+    """
+    Worker ID unique across the hosts sharing a directory, e.g. ingest-01-4242.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class FileClaims:
+    """
+    Atomic claiming of the files of an input directory shared by several worker processes,
+    possibly on several hosts.
+
+    A worker claims a file by renaming it into its own directory under `processing_dir`.
+    A rename within a filesystem is atomic, so exactly one worker wins a file and the others
+    find it gone. Once a file is done it is moved into `done_dir`, or deleted without one;
+    files that fail permanently are moved out by the RetryScheduler's quarantine.
+
+    Every worker touches a heartbeat file in its directory. A worker whose heartbeat is older
+    than `stale_after` seconds is presumed dead, and the files it claimed are moved back into
+    the input directory to be claimed again; the ledger skips any of them whose rows were
+    committed before the worker died. Heartbeats are compared with the recovering worker's own
+    heartbeat rather than its clock, so on a shared filesystem both come from the file server's clock.
+    """
+
+    def __init__(
+            self,
+            input_dir: str,
+            worker_id: str | None = None,
+            processing_dir: str = DEFAULT_PROCESSING_DIR,
+            done_dir: str | None = None,
+            heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL,
+            stale_after: float = DEFAULT_STALE_AFTER
+    ):
+        """
+        :param input_dir: The shared input directory.
+        :param worker_id: ID of this worker, stable across restarts so a restarted worker finds its claims.
+        :param processing_dir: Directory holding one directory of claimed files per worker, on the input's filesystem.
+        :param done_dir: Directory receiving the loaded files, None deletes them.
+        :param heartbeat_interval: Seconds between two heartbeats, and stale claim checks.
+        :param stale_after: Seconds without a heartbeat after which a worker's claims are recovered.
+        """
+        self.input_dir = input_dir
+        self.worker_id = worker_id or default_worker_id()
+        self.processing_dir = processing_dir
+        self.done_dir = done_dir
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.worker_dir = os.path.join(processing_dir, self.worker_id)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, on_recovered: Callable[[str], None] | None = None):
+        """
+        Start the heartbeat thread, which also recovers the claims of dead workers.
+
+        :param on_recovered: Callable invoked with the path of every file moved back to the input directory.
+        """
+        os.makedirs(self.worker_dir, exist_ok=True)
+        if self.done_dir:
+            os.makedirs(self.done_dir, exist_ok=True)
+        self.heartbeat()
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(on_recovered,), name="claims-heartbeat", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Worker {self.worker_id} claiming files from {self.input_dir}")
+
+    def stop(self):
+        """
+        Stop the heartbeat thread. Files still claimed stay in the worker's directory, for the
+        worker to resume after a restart or for another worker to recover.
+        """
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def claim(self, file_path: str) -> str | None:
+        """
+        Claim a file of the input directory.
+
+        :param file_path: Path to the file.
+        :return: Path of the claimed file in the worker's directory, None if another worker claimed it.
+        """
+        if self.is_claimed(file_path):
+            return file_path
+        target = self._free_path(self.worker_dir, os.path.basename(file_path))
+        try:
+            os.rename(file_path, target)
+        except FileNotFoundError:
+            return
+        return target
+
+    def complete(self, file_path: str):
+        """
+        Release a claimed file that is done, moving it into the done directory or deleting it.
+
+        :param file_path: Path of the claimed file, other paths are ignored.
+        """
+        if not self.is_claimed(file_path):
+            return
+        try:
+            if self.done_dir:
+                os.replace(file_path, os.path.join(self.done_dir, os.path.basename(file_path)))
+            else:
+                os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+    def is_claimed(self, file_path: str) -> bool:
+        """
+        Whether a path is a file claimed by this worker.
+        """
+        return os.path.dirname(os.path.abspath(file_path)) == os.path.abspath(self.worker_dir)
+
+    def claimed_files(self) -> list[str]:
+        """
+        List the files claimed by this worker, e.g. left over by its previous run.
+        """
+        return [path for path, _ in _list_files(self.worker_dir)]
+
+    def heartbeat(self):
+        """
+        Touch the worker's heartbeat file.
+        """
+        path = os.path.join(self.worker_dir, HEARTBEAT_FILE_NAME)
+        with open(path, 'a'):
+            pass
+        os.utime(path)
+
+    def recover_stale(self) -> list[str]:
+        """
+        Move the files claimed by dead workers back into the input directory.
+
+        :return: Paths of the recovered files in the input directory.
+        """
+        try:
+            now = os.path.getmtime(os.path.join(self.worker_dir, HEARTBEAT_FILE_NAME))
+        except FileNotFoundError:
+            now = time.time()
+        recovered = []
+        with os.scandir(self.processing_dir) as entries:
+            worker_dirs = [entry.path for entry in entries if entry.is_dir() and entry.name != self.worker_id]
+        for worker_dir in worker_dirs:
+            heartbeat_path = os.path.join(worker_dir, HEARTBEAT_FILE_NAME)
+            try:
+                last_heartbeat = os.path.getmtime(heartbeat_path)
+            except FileNotFoundError:
+                try:
+                    last_heartbeat = os.path.getmtime(worker_dir)
+                except FileNotFoundError:
+                    continue
+            if now - last_heartbeat < self.stale_after:
+                continue
+            moved = []
+            for path, file_name in _list_files(worker_dir):
+                target = self._free_path(self.input_dir, file_name)
+                try:
+                    os.rename(path, target)
+                except FileNotFoundError:
+                    continue  # Recovered by another worker meanwhile
+                moved.append(target)
+            if moved:
+                logger.warning(f"Recovered {len(moved)} files claimed by stale worker {os.path.basename(worker_dir)}")
+            recovered.extend(moved)
+            try:
+                os.remove(heartbeat_path)
+                os.rmdir(worker_dir)
+            except OSError:
+                pass  # Removed by another worker, or the worker came back
+        return recovered
+
+    def _free_path(self, directory: str, file_name: str) -> str:
+        # rename() replaces an existing target, never overwrite a file of the same name. The name is made
+        # unique before its extensions, so it keeps the prefix and timestamp the handler looks for
+        target = os.path.join(directory, file_name)
+        if os.path.exists(target):
+            stem, dot, extensions = file_name.partition('.')
+            target = os.path.join(directory, f"{stem}_{time.time_ns()}{dot}{extensions}")
+        return target
+
+    def _run(self, on_recovered: Callable[[str], None] | None):
+        while not self._stopped.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+                recovered = self.recover_stale()
+            except OSError as e:
+                logger.error(f"Could not maintain the claims of worker {self.worker_id}: {e}")
+                continue
+            if on_recovered:
+                for file_path in recovered:
+                    on_recovered(file_path)
+
+
+def _list_files(directory: str) -> list[tuple[str, str]]:
+    with os.scandir(directory) as entries:
+        return [
+            (entry.path, entry.name) for entry in entries
+            if entry.is_file() and entry.name != HEARTBEAT_FILE_NAME
+        ]
@@ -0,0 +1,127 @@
+import gzip
+import os
+import zlib
+from json.decoder import JSONDecodeError
+from typing import BinaryIO, NamedTuple
+
+try:
+    import zstandard
+except ImportError:  # Optional, only needed for zstd compressed input files
+    zstandard = None
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZSTD_FRAME_HEADER_MAX_SIZE = 18
+COMPRESSION_SUFFIXES = {'.gz': GZIP, '.zst': ZSTD}
+NDJSON_SUFFIXES = ('.ndjson', '.jsonl')
+
+# Errors raised when reading truncated or corrupt compressed data
+DECOMPRESSION_ERRORS = (EOFError, gzip.BadGzipFile, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+class UnsupportedFormatError(Exception):
+    """
+    Raised for input files whose format cannot be read, e.g. zstd without the zstandard package.
+    """
+
+
+class FileFormat(NamedTuple):
+    """
+    Format of an input file.
+
+    Attributes:
+        compression (str | None): GZIP, ZSTD, or None for uncompressed files.
+        ndjson (bool): Whether the file holds one item per line rather than a JSON document.
+    """
+    compression: str | None
+    ndjson: bool
+
+
+def detect_format(file_path: str) -> FileFormat:
+    """
+    Detect the format of an input file. The compression is read from the suffix (`.gz`, `.zst`)
+    or, without one, from the magic bytes of the file; newline-delimited JSON from the suffix
+    before it (`.ndjson`, `.jsonl`), e.g. `objects_detection_20240721T143000.ndjson.gz`.
+
+    :param file_path: Path to the file.
+    :return: The format of the file.
+    """
+    name, suffix = os.path.splitext(file_path.lower())
+    compression = COMPRESSION_SUFFIXES.get(suffix)
+    if compression:
+        suffix = os.path.splitext(name)[1]
+    else:
+        with open(file_path, 'rb') as file:
+            magic = file.read(len(ZSTD_MAGIC))
+        if magic.startswith(GZIP_MAGIC):
+            compression = GZIP
+        elif magic == ZSTD_MAGIC:
+            compression = ZSTD
+    return FileFormat(compression=compression, ndjson=suffix in NDJSON_SUFFIXES)
+
+
+def open_decoded(file_path: str, file_format: FileFormat | None = None) -> BinaryIO:
+    """
+    Open an input file as a binary stream of its decompressed content, decompressed as it is read.
+
+    :param file_path: Path to the file.
+    :param file_format: The file's format, detected if omitted.
+    :return: A binary file object, to be closed by the caller.
+    """
+    file_format = file_format or detect_format(file_path)
+    if file_format.compression == GZIP:
+        return gzip.open(file_path, 'rb')
+    if file_format.compression == ZSTD:
+        if zstandard is None:
+            raise UnsupportedFormatError(f"Reading {file_path} requires the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True)
+    return open(file_path, 'rb')
+
+
+def read_decoded(file_path: str, file_format: FileFormat | None = None) -> bytes:
+    """
+    Read the whole decompressed content of an input file. Truncated or corrupt compressed
+    data, usually a file that is still being written, is reported as a JSONDecodeError.
+
+    :param file_path: Path to the file.
+    :param file_format: The file's format, detected if omitted.
+    :return: The decompressed content.
+    """
+    file_format = file_format or detect_format(file_path)
+    with open_decoded(file_path, file_format) as file:
+        try:
+            return file.read()
+        except DECOMPRESSION_ERRORS as e:
+            raise JSONDecodeError(f"Corrupt or truncated {file_format.compression} data: {e}", '', 0) from e
+
+
+def decoded_size(file_path: str, file_format: FileFormat | None = None) -> int | None:
+    """
+    Get the size of the decompressed content of an input file without decompressing it.
+
+    :param file_path: Path to the file.
+    :param file_format: The file's format, detected if omitted.
+    :return: The size in bytes, None if the file does not record it.
+    """
+    file_format = file_format or detect_format(file_path)
+    size = os.path.getsize(file_path)
+    if file_format.compression == GZIP:
+        # The trailer holds the size of the last member modulo 2**32, never less than the compressed size
+        with open(file_path, 'rb') as file:
+            file.seek(max(0, size - 4))
+            return max(size, int.from_bytes(file.read(4), 'little'))
+    if file_format.compression == ZSTD:
+        if zstandard is None:
+            return None
+        with open(file_path, 'rb') as file:
+            header = file.read(ZSTD_FRAME_HEADER_MAX_SIZE)
+        try:
+            content_size = zstandard.frame_content_size(header)
+        except zstandard.ZstdError:
+            return None
+        return content_size if content_size >= 0 else None
+    return size
+
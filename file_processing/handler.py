@@ -1,4 +1,9 @@
 import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
 
 from pydantic import ValidationError
 from json.decoder import JSONDecodeError
@@ -6,8 +11,20 @@ from sqlalchemy.exc import SQLAlchemyError
 from watchdog.events import FileSystemEventHandler
 
 from services.db.postgres_client import PostgresDB
-from file_processing.loader import load_objects_detection_events, load_vehicle_status
-from logger_config import get_logger
+from services.db.ledger import IngestionLedger, DuplicateFileError, FileRecord, fingerprint_file
+from file_processing.worker_pool import IngestionWorkerPool
+from file_processing.batcher import MicroBatcher
+from file_processing.retry import RetryScheduler
+from file_processing.spool import Spool
+from file_processing.claims import FileClaims
+from file_processing.formats import UnsupportedFormatError, decoded_size
+from file_processing.parallel_parser import ParallelParser
+from services.metrics import record_file, OUTCOME_LOADED, OUTCOME_SKIPPED, OUTCOME_FAILED
+from file_processing.loader import (
+    load_objects_detection_events, load_vehicle_status, read_validated_rows, DataSource,
+    OBJECTS_DETECTION_SOURCE, VEHICLE_STATUS_SOURCE, FAST_PATH_MAX_BYTES
+)
+from logger_config import get_logger, get_event_log
 
 OBJECT_NAME_PREFIX = "objects_detection"
 VEHICLES_STATUS_PREFIX = "vehicle_status"
@@ -18,8 +35,23 @@ LOAD_FUNCS = {
     VEHICLES_STATUS_PREFIX: load_vehicle_status,
 }
 
+# Mapping of prefixes to the description of their data, for loaders other than LOAD_FUNCS
+DATA_SOURCES: dict[str, DataSource] = {
+    OBJECT_NAME_PREFIX: OBJECTS_DETECTION_SOURCE,
+    VEHICLES_STATUS_PREFIX: VEHICLE_STATUS_SOURCE,
+}
+
+# Timestamp embedded in file names, e.g. objects_detection_20240721T143000.json
+FILE_TIMESTAMP_PATTERN = re.compile(r'_(\d{8}T\d{6})')
+FILE_TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S'
+
+# Number of dispatched files remembered to avoid processing a file twice
+DEFAULT_MAX_CLAIMS = 2 ** 20
+
 # Set up logging
 logger = get_logger(__name__)
+# Per-file messages, rate-limited with periodic summaries
+file_events = get_event_log(__name__)
 
 
 def get_prefix(file_name: str) -> str | None:
@@ -35,37 +67,182 @@ def get_prefix(file_name: str) -> str | None:
     return
 
 
-def load_file(file_name: str, file_path: str, db: PostgresDB):
+def get_file_timestamp(file_name: str) -> datetime | None:
+    """
+    Extract the timestamp embedded in the file name.
+
+    :param file_name: Name of the file to check.
+    :return: The timestamp, or None if the name has no valid timestamp.
+    """
+    match = FILE_TIMESTAMP_PATTERN.search(file_name)
+    if not match:
+        return
+    try:
+        return datetime.strptime(match.group(1), FILE_TIMESTAMP_FORMAT)
+    except ValueError:
+        return
+
+
+def load_file(
+        file_name: str,
+        file_path: str,
+        db: PostgresDB,
+        batcher: MicroBatcher | None = None,
+        ledger: IngestionLedger | None = None,
+        retry: RetryScheduler | None = None,
+        spool: Spool | None = None,
+        parser: ParallelParser | None = None
+):
     """
     Load data from the file into the database based on the file prefix.
 
+    With a spool, files that can be validated in memory are validated here and their rows
+    appended to the spool, whose drainer loads them into the database and reports the outcome.
+    If the spool cannot be written, e.g. because the disk is full, the file is loaded directly.
+
+    With a batcher, files up to the batcher's byte limit are validated here and their rows
+    handed to the batcher, which writes them together with other files' rows and reports the
+    outcome itself. Larger files are always loaded directly.
+
+    With a ledger, files whose content was already loaded are skipped, and every file is
+    recorded in the ledger in the same transaction as its rows.
+
+    With a retry scheduler, failed files are retried later or quarantined.
+
+    With a parallel parser, large uncompressed files are parsed and validated on several cores.
+
     :param file_name: Name of the file to check.
     :param file_path: Path to the file to be loaded.
     :param db: Instance of PostgresDB to handle database operations.
+    :param batcher: Optional MicroBatcher coalescing small files into shared transactions.
+    :param ledger: Optional IngestionLedger making loads idempotent.
+    :param retry: Optional RetryScheduler handling failed files.
+    :param spool: Optional Spool buffering validated rows on disk, see file_processing.spool.
+    :param parser: Optional ParallelParser for large files, see file_processing.parallel_parser.
     """
     prefix = get_prefix(file_name=file_name)
     load_func = LOAD_FUNCS.get(prefix)
     if not load_func:
         logger.warning(f"No load function found for file name: {file_name}")
         return
+    record = None
     try:
-        load_func(file_path=file_path, db=db)
-        logger.info(f"Successfully loaded file: {file_path}")
+        if ledger:
+            record = fingerprint_file(file_path)
+            if ledger.is_loaded(record.content_hash):
+                file_events.info('skipped', "Skipping already loaded file: %s", file_path)
+                record_file(file_path=file_path, prefix=prefix, outcome=OUTCOME_SKIPPED)
+                if retry:
+                    retry.on_result(file_path=file_path, error=None)
+                return
+        # Size of the decompressed content, None if a compressed file does not record it
+        size = decoded_size(file_path)
+        if spool and size is not None and size <= FAST_PATH_MAX_BYTES and _spool_file(
+                file_path=file_path, prefix=prefix, spool=spool, record=record
+        ):
+            return  # The drainer reports the outcome once the rows are committed
+        if batcher and size is not None and size < batcher.max_bytes:
+            data_source = DATA_SOURCES[prefix]
+            rows = read_validated_rows(file_path=file_path, data_source=data_source)
+            batcher.add(
+                file_path=file_path, model=data_source.db_model, rows=rows, size_bytes=size, record=record, prefix=prefix
+            )
+            return
+        with db.transaction():
+            if parser and parser.accepts(file_path):
+                row_count = parser.load(file_path=file_path, db=db, data_source=DATA_SOURCES[prefix])
+            else:
+                row_count = load_func(file_path=file_path, db=db)
+            if record:
+                ledger.record_loaded(record=record, row_count=row_count)
+        file_events.info('loaded', "Successfully loaded file: %s", file_path)
+        record_file(file_path=file_path, prefix=prefix, outcome=OUTCOME_LOADED, row_count=row_count)
+        if retry:
+            retry.on_result(file_path=file_path, error=None)
+    except DuplicateFileError:
+        file_events.info('skipped', "Skipping already loaded file: %s", file_path)
+        record_file(file_path=file_path, prefix=prefix, outcome=OUTCOME_SKIPPED)
+        if retry:
+            retry.on_result(file_path=file_path, error=None)
     except JSONDecodeError as e:
         logger.error(f"JSON decode error for file {file_path}: {e}")
+        _handle_failure(file_path=file_path, prefix=prefix, error=e, ledger=ledger, record=record, retry=retry)
     except ValidationError as e:
         logger.error(f"Validation error for file {file_path}: {e}")
+        _handle_failure(file_path=file_path, prefix=prefix, error=e, ledger=ledger, record=record, retry=retry)
     except SQLAlchemyError as e:
         logger.error(f"Database error for file {file_path}: {e}")
+        _handle_failure(file_path=file_path, prefix=prefix, error=e, ledger=ledger, record=record, retry=retry)
+    except UnsupportedFormatError as e:
+        logger.error(f"Unsupported format for file {file_path}: {e}")
+        _handle_failure(file_path=file_path, prefix=prefix, error=e, ledger=ledger, record=record, retry=retry)
+    except BrokenProcessPool as e:
+        logger.error(f"Parser processes failed for file {file_path}: {e}")
+        _handle_failure(file_path=file_path, prefix=prefix, error=e, ledger=ledger, record=record, retry=retry)
+
+
+def _spool_file(file_path: str, prefix: str, spool: Spool, record: FileRecord | None) -> bool:
+    """
+    Validate the file and append its rows to the spool.
+
+    :return: True if the rows were spooled, False if the spool could not be written.
+    """
+    data_source = DATA_SOURCES[prefix]
+    rows = read_validated_rows(file_path=file_path, data_source=data_source)
+    try:
+        spool.append_rows(file_path=file_path, data_source=data_source, rows=rows, record=record, prefix=prefix)
+    except OSError as e:
+        logger.error(f"Could not spool file {file_path}, loading it directly: {e}")
+        return False
+    file_events.info('spooled', "Spooled file: %s", file_path)
+    return True
+
+
+def _handle_failure(
+        file_path: str,
+        prefix: str,
+        error: Exception,
+        ledger: IngestionLedger | None,
+        record: FileRecord | None,
+        retry: RetryScheduler | None
+):
+    record_file(file_path=file_path, prefix=prefix, outcome=OUTCOME_FAILED)
+    if ledger and record:
+        ledger.record_failed(record=record, error=error)
+    if retry:
+        retry.on_result(file_path=file_path, error=error)
 
 
 class NewFileHandler(FileSystemEventHandler):
     """
-    Event handler for monitoring new file creation in the directory.
+    Event handler for monitoring new file creation in the directory. When a worker pool
+    is given, files are queued to it instead of being loaded on the observer thread.
     """
 
-    def __init__(self, db: PostgresDB):
+    def __init__(
+            self,
+            db: PostgresDB,
+            pool: IngestionWorkerPool | None = None,
+            batcher: MicroBatcher | None = None,
+            ledger: IngestionLedger | None = None,
+            retry: RetryScheduler | None = None,
+            max_claims: int = DEFAULT_MAX_CLAIMS,
+            spool: Spool | None = None,
+            file_claims: FileClaims | None = None,
+            parser: ParallelParser | None = None
+    ):
         self.db = db
+        self.pool = pool
+        self.batcher = batcher
+        self.ledger = ledger
+        self.retry = retry
+        self.spool = spool
+        self.file_claims = file_claims
+        self.parser = parser
+        self.max_claims = max_claims
+        # LRU of absolute path -> inode of the files dispatched so far
+        self._claims: OrderedDict[str, int] = OrderedDict()
+        self._claims_lock = threading.Lock()
 
     def on_created(self, event):
         """
@@ -77,6 +254,71 @@ class NewFileHandler(FileSystemEventHandler):
             return  # Ignore directory creation events
 
         file_path = event.src_path
-        logger.info(f"Detected new file: {file_path}")
+        file_events.info('detected', "Detected new file: %s", file_path)
+        self.submit_file(file_path=file_path)
+
+    def submit_file(self, file_path: str):
+        """
+        Load the file, or queue it to the worker pool. Files already dispatched, e.g. found by
+        the startup scan and then reported by an event as well, are skipped. With file claims,
+        the file is first claimed from the shared directory and loaded from the worker's
+        directory, and files claimed by another worker are skipped.
+
+        :param file_path: Path to the file to be loaded.
+        """
+        if not self.claim(file_path=file_path):
+            file_events.info('already_dispatched', "Skipping already dispatched file: %s", file_path)
+            return
         file_name = os.path.basename(file_path)
-        load_file(file_name=file_name, file_path=file_path, db=self.db)
+        if self.file_claims and get_prefix(file_name=file_name):
+            claimed_path = self.file_claims.claim(file_path=file_path)
+            if claimed_path is None:
+                # The file keeps its inode if its worker dies and it is recovered, so it must be dispatched again then
+                self.release(file_path=file_path)
+                file_events.info('claimed_elsewhere', "Skipping file claimed by another worker: %s", file_path)
+                return
+            file_path = claimed_path
+        if self.pool:
+            self.pool.submit(file_name=file_name, file_path=file_path)
+        else:
+            load_file(
+                file_name=file_name,
+                file_path=file_path,
+                db=self.db,
+                batcher=self.batcher,
+                ledger=self.ledger,
+                retry=self.retry,
+                spool=self.spool,
+                parser=self.parser
+            )
+
+    def claim(self, file_path: str) -> bool:
+        """
+        Mark the file as dispatched. A file is identified by its path and inode, so a file
+        re-created under the same name can be claimed again.
+
+        :param file_path: Path to the file.
+        :return: True if the file was not dispatched before (or no longer exists).
+        """
+        try:
+            inode = os.stat(file_path).st_ino
+        except OSError:
+            return True  # Let the loader report the missing file
+        key = os.path.abspath(file_path)
+        with self._claims_lock:
+            if self._claims.get(key) == inode:
+                return False
+            self._claims[key] = inode
+            self._claims.move_to_end(key)
+            if len(self._claims) > self.max_claims:
+                self._claims.popitem(last=False)
+        return True
+
+    def release(self, file_path: str):
+        """
+        Forget that the file was dispatched, so it can be claimed again.
+
+        :param file_path: Path to the file.
+        """
+        with self._claims_lock:
+            self._claims.pop(os.path.abspath(file_path), None)
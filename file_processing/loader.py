@@ -1,4 +1,8 @@
+import io
 import json
+import time
+from json.decoder import JSONDecodeError
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, TextIO
 
 from pydantic import BaseModel, ValidationError
 from sqlalchemy.exc import SQLAlchemyError
@@ -6,70 +10,337 @@ from sqlalchemy.exc import SQLAlchemyError
 from services.db.postgres_client import PostgresDB
 from models.db_models import ObjectsDetectionEvent, VehicleStatus, Base
 from models.source_models import SourceObjectsDetectionEvent, SourceVehicleStatus
+from models.row_types import get_envelope_adapter, get_row_adapter
+from file_processing.stream_parser import iter_json_array_items
+from file_processing.formats import (
+    FileFormat, detect_format, open_decoded, read_decoded, decoded_size, DECOMPRESSION_ERRORS
+)
+from services.metrics import STAGE_SECONDS
 
+# Number of validated items sent to the database per insert statement
+DEFAULT_BATCH_SIZE = 5000
+# Files up to this size are validated in a single pydantic-core call, larger files are streamed
+FAST_PATH_MAX_BYTES = 64 * 2 ** 20
 
-def load_objects_detection_events(file_path: str, db: PostgresDB):
+
+class DataSource(NamedTuple):
+    """
+    Description of an input file type.
+
+    Attributes:
+        source_model (BaseModel): Pydantic model used for validating the items.
+        db_model (Base): SQLAlchemy model the items are inserted into.
+        data_key (str): Key in the JSON file where the items are stored.
+    """
+    source_model: type[BaseModel]
+    db_model: type[Base]
+    data_key: str
+
+
+OBJECTS_DETECTION_SOURCE = DataSource(
+    source_model=SourceObjectsDetectionEvent,
+    db_model=ObjectsDetectionEvent,
+    data_key='objects_detection_events'
+)
+VEHICLE_STATUS_SOURCE = DataSource(
+    source_model=SourceVehicleStatus,
+    db_model=VehicleStatus,
+    data_key='vehicle_status'
+)
+
+
+def load_objects_detection_events(
+        file_path: str,
+        db: PostgresDB,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        atomic: bool = True
+):
     """
     Load objects detection events from a JSON file and insert them into the database.
 
     :param file_path: Path to the JSON file containing objects detection events.
     :param db: Instance of PostgresDB to handle database operations.
-    :return: None
+    :param batch_size: Number of items inserted per statement.
+    :param atomic: Whether the whole file is loaded in a single transaction.
+    :return: Number of rows loaded.
     """
-    _load_data(
+    return load_data(
         file_path=file_path,
         db=db,
-        source_model=SourceObjectsDetectionEvent,
-        db_model=ObjectsDetectionEvent,
-        data_key='objects_detection_events'
+        **OBJECTS_DETECTION_SOURCE._asdict(),
+        batch_size=batch_size,
+        atomic=atomic
     )
 
 
-def load_vehicle_status(file_path: str, db: PostgresDB):
+def load_vehicle_status(
+        file_path: str,
+        db: PostgresDB,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        atomic: bool = True
+):
     """
     Load vehicle status data from a JSON file and insert it into the database.
 
     :param file_path: Path to the JSON file containing vehicle status data.
     :param db: Instance of PostgresDB to handle database operations.
-    :return: None
+    :param batch_size: Number of items inserted per statement.
+    :param atomic: Whether the whole file is loaded in a single transaction.
+    :return: Number of rows loaded.
     """
-    _load_data(
+    return load_data(
         file_path=file_path,
         db=db,
-        source_model=SourceVehicleStatus,
-        db_model=VehicleStatus,
-        data_key='vehicle_status'
+        **VEHICLE_STATUS_SOURCE._asdict(),
+        batch_size=batch_size,
+        atomic=atomic
     )
 
 
-def _load_data(
+def load_data(
         file_path: str,
         db: PostgresDB,
         source_model: BaseModel,
         db_model: Base,
-        data_key: str
-):
+        data_key: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        atomic: bool = True
+) -> int:
     """
     General function to load data from a JSON file, validate it using a Pydantic model,
     and insert it into the database using a SQLAlchemy model.
 
-    :param file_path: Path to the JSON file containing the data.
+    Files whose decompressed content is up to FAST_PATH_MAX_BYTES are validated from their raw
+    bytes at once into row tuples (see `read_rows`). Larger files are decompressed and parsed
+    incrementally, so memory usage does not depend on the size of the file. Either way rows are inserted in chunks of `batch_size` items. With
+    `atomic` the chunks share a single transaction and the file is loaded all-or-nothing,
+    otherwise every chunk is committed as soon as it is inserted.
+
+    :param file_path: Path to the input file containing the data, in any format of `detect_format`.
     :param db: Instance of PostgresDB to handle database operations.
     :param source_model: Pydantic model used for validating the data.
     :param db_model: SQLAlchemy model used for inserting the data into the database.
     :param data_key: Key in the JSON file where the relevant data is stored.
+    :param batch_size: Number of items inserted per statement.
+    :param atomic: Whether the whole file is loaded in a single transaction.
+    :return: Number of rows loaded.
     """
     try:
-        # Open and load data from the JSON file
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-        # Validate and transform data using the source model
-        validated_data = [source_model(**item).model_dump() for item in data[data_key]]
-        # Insert validated data into the database
-        db.insert(model=db_model, data=validated_data)
+        file_format = detect_format(file_path)
+        if fits_fast_path(file_path=file_path, file_format=file_format):
+            rows = read_rows(file_path=file_path, source_model=source_model, data_key=data_key)
+            chunks = (rows[start:start + batch_size] for start in range(0, len(rows), batch_size))
+            return _insert_chunks(db=db, db_model=db_model, chunks=chunks, atomic=atomic)
+        with open_decoded(file_path, file_format) as file:
+            chunks = iter_file_chunks(
+                file=file, file_format=file_format, source_model=source_model, data_key=data_key, batch_size=batch_size
+            )
+            return _insert_chunks(db=db, db_model=db_model, chunks=chunks, atomic=atomic)
     except json.decoder.JSONDecodeError as e:
         raise e
     except ValidationError as e:
         raise e
     except SQLAlchemyError as e:
         raise e
+
+
+def _insert_chunks(db: PostgresDB, db_model: Base, chunks: Iterable[list], atomic: bool) -> int:
+    """
+    Insert the chunks of rows, in a single transaction if `atomic`.
+
+    :return: Number of rows inserted.
+    """
+    row_count = 0
+    if atomic:
+        with db.transaction():
+            for chunk in chunks:
+                db.insert(model=db_model, data=chunk)
+                row_count += len(chunk)
+    else:
+        for chunk in chunks:
+            db.insert(model=db_model, data=chunk)
+            row_count += len(chunk)
+    return row_count
+
+
+def read_validated_rows(file_path: str, data_source: DataSource) -> list[tuple]:
+    """
+    Read and validate all items of a file at once, e.g. to hand them to a MicroBatcher.
+
+    :param file_path: Path to the JSON file containing the data.
+    :param data_source: Description of the file's data.
+    :return: A list of validated row tuples.
+    """
+    return read_rows(file_path=file_path, source_model=data_source.source_model, data_key=data_source.data_key)
+
+
+def fits_fast_path(file_path: str, file_format: FileFormat | None = None) -> bool:
+    """
+    Whether a file is small enough to be validated in memory at once, see `read_rows`.
+
+    :param file_path: Path to the input file.
+    :param file_format: The file's format, detected if omitted.
+    :return: True if the decompressed content is known to be at most FAST_PATH_MAX_BYTES.
+    """
+    size = decoded_size(file_path, file_format)
+    return size is not None and size <= FAST_PATH_MAX_BYTES
+
+
+def read_rows(file_path: str, source_model: type[BaseModel], data_key: str) -> list[tuple]:
+    """
+    Read an input file and validate its items in pydantic-core, without building intermediate
+    dicts or model instances: a JSON document in a single call, newline-delimited JSON in one
+    call per line. Compressed files are decompressed in memory.
+
+    :param file_path: Path to the input file containing the data, in any format of `detect_format`.
+    :param source_model: Pydantic model describing the items.
+    :param data_key: Key in the JSON file where the relevant data is stored, unused for NDJSON.
+    :return: A list of validated row tuples, see models.row_types.
+    """
+    file_format = detect_format(file_path)
+    with STAGE_SECONDS.time(stage='read'):
+        content = read_decoded(file_path, file_format)
+    with STAGE_SECONDS.time(stage='parse_validate'):
+        if file_format.ndjson:
+            return validate_ndjson_rows(lines=content.splitlines(), source_model=source_model)
+        return validate_rows(content=content, source_model=source_model, data_key=data_key)
+
+
+def validate_rows(content: bytes, source_model: type[BaseModel], data_key: str) -> list[tuple]:
+    """
+    Validate a whole JSON document into row tuples. Malformed JSON is reported as a
+    JSONDecodeError, as with the streaming parser.
+
+    :param content: Raw JSON document.
+    :param source_model: Pydantic model describing the items.
+    :param data_key: Key in the JSON document where the relevant data is stored.
+    :return: A list of validated row tuples, see models.row_types.
+    """
+    try:
+        return get_envelope_adapter(source_model, data_key).validate_json(content)[data_key]
+    except ValidationError as e:
+        invalid_json = next((error for error in e.errors() if error['type'] == 'json_invalid'), None)
+        if invalid_json:
+            raise JSONDecodeError(invalid_json['msg'], '', 0) from e
+        raise
+
+
+def validate_ndjson_rows(lines: Iterable[bytes], source_model: type[BaseModel], first_line: int = 1) -> list[tuple]:
+    """
+    Validate newline-delimited JSON items into row tuples, skipping blank lines. Malformed
+    JSON is reported as a JSONDecodeError naming the line.
+
+    :param lines: Raw lines, one JSON item each.
+    :param source_model: Pydantic model describing the items.
+    :param first_line: Number of the first line, for error messages.
+    :return: A list of validated row tuples, see models.row_types.
+    """
+    adapter = get_row_adapter(source_model)
+    rows = []
+    for number, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+        try:
+            rows.append(adapter.validate_json(line))
+        except ValidationError as e:
+            invalid_json = next((error for error in e.errors() if error['type'] == 'json_invalid'), None)
+            if invalid_json:
+                raise JSONDecodeError(f"{invalid_json['msg']} (line {number})", '', 0) from e
+            raise
+    return rows
+
+
+def iter_file_chunks(
+        file: BinaryIO,
+        file_format: FileFormat,
+        source_model: type[BaseModel],
+        data_key: str,
+        batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[list]:
+    """
+    Stream the items of an input file of any format in lists of at most `batch_size` items.
+
+    :param file: Binary file object of the decompressed content, see formats.open_decoded.
+    :param file_format: The file's format.
+    :param source_model: Pydantic model used for validating the data.
+    :param data_key: Key in the JSON file where the relevant data is stored, unused for NDJSON.
+    :param batch_size: Maximum number of items per yielded list.
+    :return: Iterator over lists of validated row tuples, see models.row_types.
+    """
+    try:
+        if file_format.ndjson:
+            yield from iter_ndjson_chunks(file=file, source_model=source_model, batch_size=batch_size)
+        else:
+            yield from iter_validated_chunks(
+                file=io.TextIOWrapper(file, encoding='utf-8'),
+                source_model=source_model,
+                data_key=data_key,
+                batch_size=batch_size
+            )
+    except DECOMPRESSION_ERRORS as e:
+        raise JSONDecodeError(f"Corrupt or truncated {file_format.compression} data: {e}", '', 0) from e
+
+
+def iter_ndjson_chunks(
+        file: BinaryIO,
+        source_model: type[BaseModel],
+        batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[list[tuple]]:
+    """
+    Stream newline-delimited JSON items, validate them into row tuples and yield them in lists
+    of at most `batch_size` items.
+
+    :param file: Binary file object containing one JSON item per line.
+    :param source_model: Pydantic model used for validating the data.
+    :param batch_size: Maximum number of items per yielded list.
+    :return: Iterator over lists of validated row tuples.
+    """
+    lines = []
+    first_line = 1
+    started = time.perf_counter()
+    for line in file:
+        lines.append(line)
+        if len(lines) >= batch_size:
+            chunk = validate_ndjson_rows(lines=lines, source_model=source_model, first_line=first_line)
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='parse_validate')
+            if chunk:
+                yield chunk
+            first_line += len(lines)
+            lines = []
+            started = time.perf_counter()
+    chunk = validate_ndjson_rows(lines=lines, source_model=source_model, first_line=first_line)
+    if chunk:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage='parse_validate')
+        yield chunk
+
+
+def iter_validated_chunks(
+        file: TextIO,
+        source_model: BaseModel,
+        data_key: str,
+        batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[list[tuple]]:
+    """
+    Stream the items stored under `data_key`, validate them into row tuples and yield them
+    in lists of at most `batch_size` items.
+
+    :param file: Text file object containing the JSON data.
+    :param source_model: Pydantic model used for validating the data.
+    :param data_key: Key in the JSON file where the relevant data is stored.
+    :param batch_size: Maximum number of items per yielded list.
+    :return: Iterator over lists of validated row tuples, see models.row_types.
+    """
+    adapter = get_row_adapter(source_model)
+    chunk = []
+    started = time.perf_counter()
+    for item in iter_json_array_items(file=file, data_key=data_key):
+        chunk.append(adapter.validate_python(item))
+        if len(chunk) >= batch_size:
+            # Reading, parsing and validating are interleaved, the time to build a chunk covers all three
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='parse_validate')
+            yield chunk
+            chunk = []
+            started = time.perf_counter()
+    if chunk:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage='parse_validate')
+        yield chunk
@@ -0,0 +1,431 @@
+import gc
+import json
+import mmap
+import multiprocessing
+import os
+import pickle
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from functools import lru_cache
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from json.decoder import JSONDecodeError
+from typing import Iterator, get_args
+
+from pydantic import BaseModel, ValidationError
+
+from services.db.postgres_client import PostgresDB
+from models.row_types import get_row_type
+from file_processing.formats import detect_format, open_decoded
+from file_processing.loader import (
+    DataSource, DEFAULT_BATCH_SIZE, FAST_PATH_MAX_BYTES, validate_rows, validate_ndjson_rows, iter_file_chunks
+)
+from file_processing.stream_parser import find_item_start
+from services.metrics import STAGE_SECONDS
+from logger_config import get_logger
+
+# Number of parser processes
+DEFAULT_PROCESSES = os.cpu_count() or 1
+# Target size of the spans a file is split into, every span is validated by one process at a time
+DEFAULT_SPAN_BYTES = 16 * 2 ** 20
+# Bytes at the start and end of a JSON document searched for the array of items
+ENVELOPE_SEARCH_BYTES = 2 ** 16
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+class ParallelParser:
+    """
+    Parse and validate a single large file on several cores.
+
+    The file is memory-mapped and split into spans of about `span_bytes` at item boundaries,
+    which are validated by a pool of processes. Every task receives only the path and offsets of
+    its span and maps the file itself, and only the validated rows are sent back, as plain tuples
+    (see `_pack_rows`). The rows are yielded in file order, with at most twice as many spans in
+    flight as processes.
+
+    NDJSON files are split after a newline, which always ends an item. JSON documents of the form
+    {"<data_key>": [item, ...]}, with the array as the only key, are split before an object
+    opening with a key that only items have, e.g. `{"vehicle_id"` but not `{"object_type"`.
+    Such a guess is speculative: a span is only accepted if it starts where the previous accepted
+    span ended and validates as whole items, and JSON that is valid from an item boundary cannot
+    end anywhere but at one. When a guess turns out wrong, the items are walked in this process
+    from the last verified boundary to the next true boundary, and that stretch is validated here.
+
+    Compressed files cannot be mapped and are streamed, see `accepts`.
+
+    If a parser process dies, e.g. killed for memory, the pool is broken: it is replaced by a new
+    one, and the files being parsed fail with BrokenProcessPool, which the RetryScheduler retries.
+    """
+
+    def __init__(
+            self,
+            processes: int = DEFAULT_PROCESSES,
+            span_bytes: int = DEFAULT_SPAN_BYTES,
+            min_file_bytes: int = FAST_PATH_MAX_BYTES
+    ):
+        """
+        :param processes: Number of parser processes.
+        :param span_bytes: Target size of the spans a file is split into.
+        :param min_file_bytes: Files up to this size are left to the in-memory fast path of the loader.
+        """
+        self.processes = processes
+        self.span_bytes = span_bytes
+        self.min_file_bytes = min_file_bytes
+        self._executor: ProcessPoolExecutor | None = None
+        # Guards the replacement of the pool, shared by the threads loading files
+        self._executor_lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the process pool. Processes are spawned, so they do not inherit the database connections.
+        """
+        with self._executor_lock:
+            self._executor = self._new_executor()
+        logger.info(f"Started {self.processes} parser processes")
+
+    def stop(self):
+        """
+        Stop the process pool, cancelling the spans not started yet.
+        """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    def accepts(self, file_path: str) -> bool:
+        """
+        Whether a file is parsed by this parser: an uncompressed file above `min_file_bytes`.
+
+        :param file_path: Path to the input file.
+        """
+        return (
+            self._executor is not None
+            and os.path.getsize(file_path) > self.min_file_bytes
+            and detect_format(file_path).compression is None
+        )
+
+    def load(self, file_path: str, db: PostgresDB, data_source: DataSource, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Load a file into the database in a single transaction, parsing it in parallel.
+
+        :param file_path: Path to the input file.
+        :param db: Instance of PostgresDB to handle database operations.
+        :param data_source: Description of the file's data.
+        :param batch_size: Number of items inserted per statement.
+        :return: Number of rows loaded.
+        """
+        row_count = 0
+        with db.transaction():
+            for chunk in self.iter_chunks(file_path=file_path, data_source=data_source, batch_size=batch_size):
+                db.insert(model=data_source.db_model, data=chunk)
+                row_count += len(chunk)
+        return row_count
+
+    def iter_chunks(
+            self,
+            file_path: str,
+            data_source: DataSource,
+            batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[list[tuple]]:
+        """
+        Validate the items of a file in parallel and yield them in file order, in lists of at most
+        `batch_size` row tuples. Documents that cannot be split are streamed in this process.
+
+        :param file_path: Path to the input file.
+        :param data_source: Description of the file's data.
+        :param batch_size: Maximum number of items per yielded list.
+        :return: Iterator over lists of validated row tuples.
+        """
+        file_format = detect_format(file_path)
+        with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            spans = plan_spans(
+                view=view,
+                source_model=data_source.source_model,
+                data_key=data_source.data_key,
+                ndjson=file_format.ndjson,
+                span_bytes=self.span_bytes
+            )
+            if spans is None:
+                logger.info(f"Could not split {file_path}, parsing it sequentially")
+                with open_decoded(file_path, file_format) as stream:
+                    yield from iter_file_chunks(
+                        file=stream,
+                        file_format=file_format,
+                        source_model=data_source.source_model,
+                        data_key=data_source.data_key,
+                        batch_size=batch_size
+                    )
+                return
+            for rows in self._iter_span_rows(
+                    file_path=file_path, view=view, spans=spans, data_source=data_source, ndjson=file_format.ndjson
+            ):
+                for start in range(0, len(rows), batch_size):
+                    yield rows[start:start + batch_size]
+
+    def _iter_span_rows(
+            self,
+            file_path: str,
+            view: mmap.mmap,
+            spans: list[tuple[int, int]],
+            data_source: DataSource,
+            ndjson: bool
+    ) -> Iterator[list[tuple]]:
+        executor = self._executor
+        if executor is None:
+            raise BrokenProcessPool("The parser process pool is stopped")
+        pending: deque[tuple[tuple[int, int], Future]] = deque()
+        remaining = iter(spans)
+        # End of the rows yielded so far, always a true item boundary
+        position = spans[0][0]
+        resyncs = 0
+        try:
+            while True:
+                while len(pending) < 2 * self.processes and (span := next(remaining, None)):
+                    try:
+                        future = executor.submit(
+                            _validate_span_task, file_path, *span, data_source.source_model, data_source.data_key,
+                            ndjson
+                        )
+                    except OSError as e:
+                        # Submitted while the pool is torn down after a process died, before it is marked broken
+                        raise BrokenProcessPool(f"The parser process pool is broken: {e}") from e
+                    pending.append((span, future))
+                if not pending:
+                    break
+                (start, end), future = pending.popleft()
+                if end <= position:
+                    future.cancel()  # Covered by a resync
+                    continue
+                started = time.perf_counter()
+                rows = future.result() if start == position else None
+                if rows is None:
+                    # The span failed, or starts at a guessed boundary inside an item
+                    rows, end = _resync(view=view, position=position, end=end, data_source=data_source, ndjson=ndjson)
+                    resyncs += 1
+                else:
+                    rows = _unpack_rows(payload=rows, source_model=data_source.source_model)
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage='parse_validate')
+                position = end
+                yield rows
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            raise
+        finally:
+            for _, future in pending:
+                future.cancel()
+        logger.info(f"Parsed {file_path} in {len(spans)} spans on {self.processes} processes, {resyncs} resyncs")
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'))
+
+    def _replace_broken(self, executor: ProcessPoolExecutor):
+        """
+        Replace a broken pool, once: the other files parsed on it see it broken as well.
+        """
+        with self._executor_lock:
+            if self._executor is not executor:
+                return  # Replaced by another thread already, or stopped
+            self._executor = self._new_executor()
+        # A parser process died, e.g. killed for memory, the pool cannot be used anymore
+        logger.error("Parser process pool broke, restarted it")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def plan_spans(
+        view: mmap.mmap,
+        source_model: type[BaseModel],
+        data_key: str,
+        ndjson: bool,
+        span_bytes: int = DEFAULT_SPAN_BYTES
+) -> list[tuple[int, int]] | None:
+    """
+    Split a mapped input file into contiguous spans of whole items, see ParallelParser.
+
+    :param view: The mapped file.
+    :param source_model: Pydantic model describing the items.
+    :param data_key: Key in the JSON document where the items are stored.
+    :param ndjson: Whether the file is newline-delimited JSON.
+    :param span_bytes: Target size of the spans.
+    :return: (start, end) byte offsets of the spans, None if the array of items cannot be located.
+    """
+    if ndjson:
+        first, last = 0, len(view)
+        boundary = re.compile(rb'\n')
+    else:
+        envelope = re.match(rb'\s*\{\s*' + re.escape(json.dumps(data_key).encode()) + rb'\s*:\s*\[\s*', view)
+        tail_start = max(0, len(view) - ENVELOPE_SEARCH_BYTES)
+        closing = re.search(rb'\]\s*\}\s*\Z', view[tail_start:])
+        if not envelope or not closing or tail_start + closing.start() <= envelope.end():
+            return
+        first, last = envelope.end(), tail_start + closing.start()
+        keys = b'|'.join(re.escape(json.dumps(key).encode()) for key in _item_keys(source_model))
+        boundary = re.compile(rb',\s*(?=\{\s*(?:' + keys + rb'))')
+    starts = [first]
+    target = first + span_bytes
+    while target < last:
+        match = boundary.search(view, target, last)
+        if not match or match.end() >= last:
+            break
+        starts.append(match.end())
+        target = match.end() + span_bytes
+    return list(zip(starts, starts[1:] + [last]))
+
+
+def validate_span(
+        content: bytes,
+        source_model: type[BaseModel],
+        data_key: str,
+        ndjson: bool,
+        first_line: int = 1
+) -> list[tuple]:
+    """
+    Validate a span of whole items into row tuples.
+
+    :param content: The items, one per line for NDJSON, otherwise separated by commas.
+    :param source_model: Pydantic model describing the items.
+    :param data_key: Key in the JSON document where the items are stored.
+    :param ndjson: Whether the items are newline-delimited JSON.
+    :param first_line: Number of the span's first line in the file, for error messages.
+    :return: A list of validated row tuples, see models.row_types.
+    """
+    if ndjson:
+        return validate_ndjson_rows(lines=content.splitlines(), source_model=source_model, first_line=first_line)
+    content = content.rstrip()
+    if content.endswith(b','):
+        content = content[:-1]
+    document = b'{' + json.dumps(data_key).encode() + b': [' + content + b']}'
+    return validate_rows(content=document, source_model=source_model, data_key=data_key)
+
+
+def _validate_span_task(
+        file_path: str,
+        start: int,
+        end: int,
+        source_model: type[BaseModel],
+        data_key: str,
+        ndjson: bool
+) -> bytes | None:
+    """
+    Validate a span in a parser process.
+
+    :return: The pickled rows, see `_pack_rows`, None if the span is invalid. Only the parent
+             knows whether the span starts at a true boundary, and reports errors of the ones that do.
+    """
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        content = view[start:end]
+    try:
+        rows = validate_span(content=content, source_model=source_model, data_key=data_key, ndjson=ndjson)
+    except (JSONDecodeError, ValidationError):
+        return
+    return _pack_rows(rows=rows, source_model=source_model)
+
+
+def _pack_rows(rows: list[tuple], source_model: type[BaseModel]) -> bytes:
+    """
+    Pickle row tuples as plain tuples whose datetimes use the standard library's timezones,
+    which pickle about three times faster than named tuples and pydantic's TzInfo.
+    """
+    positions = _datetime_positions(source_model)
+    packed = []
+    for row in rows:
+        values = list(row)
+        for position in positions:
+            value = values[position]
+            if value is not None and value.tzinfo is not None:
+                values[position] = value.replace(tzinfo=timezone(value.utcoffset()))
+        packed.append(tuple(values))
+    return pickle.dumps(packed, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _unpack_rows(payload: bytes, source_model: type[BaseModel]) -> list[tuple]:
+    """
+    Unpickle the rows of `_pack_rows` into row tuples. The garbage collector is paused meanwhile,
+    it would otherwise scan the heap again and again as the new objects pile up, for no garbage.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return list(map(get_row_type(source_model)._make, pickle.loads(payload)))
+    finally:
+        if enabled:
+            gc.enable()
+
+
+@lru_cache(maxsize=None)
+def _datetime_positions(source_model: type[BaseModel]) -> tuple[int, ...]:
+    row_type = get_row_type(source_model)
+    return tuple(
+        position for position, name in enumerate(row_type._fields)
+        if datetime in (row_type.__annotations__[name], *get_args(row_type.__annotations__[name]))
+    )
+
+
+def _resync(
+        view: mmap.mmap,
+        position: int,
+        end: int,
+        data_source: DataSource,
+        ndjson: bool
+) -> tuple[list[tuple], int]:
+    """
+    Validate the items from the true boundary `position` to the first true boundary at or after
+    `end`, in this process, raising the errors of invalid items.
+
+    :return: The row tuples, and the end of the validated items.
+    """
+    if ndjson:
+        first_line = view[:position].count(b'\n') + 1
+    else:
+        first_line = 1
+        end = position + find_item_start(_MappedText(view=view, start=position), min_offset=end - position)
+    rows = validate_span(
+        content=view[position:end],
+        source_model=data_source.source_model,
+        data_key=data_source.data_key,
+        ndjson=ndjson,
+        first_line=first_line
+    )
+    return rows, end
+
+
+class _MappedText:
+    """
+    Text file object over a mapped file from an offset, decoded as latin-1 so that character
+    offsets are byte offsets. JSON structure is ASCII, so items are delimited correctly even
+    though multi-byte characters in strings are not decoded faithfully.
+    """
+
+    def __init__(self, view: mmap.mmap, start: int):
+        self._view = view
+        self._pos = start
+
+    def read(self, size: int) -> str:
+        chunk = self._view[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk.decode('latin-1')
+
+
+def _item_keys(source_model: type[BaseModel]) -> list[str]:
+    """
+    Keys marking the start of an item: the fields of the source model that no nested model has,
+    or all of its fields if every one of them is nested somewhere.
+    """
+    nested = set()
+    seen = set()
+    pending = [field.annotation for field in source_model.model_fields.values()]
+    while pending:
+        annotation = pending.pop()
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            if annotation not in seen:
+                seen.add(annotation)
+                nested.update(annotation.model_fields)
+                pending.extend(field.annotation for field in annotation.model_fields.values())
+        else:
+            pending.extend(get_args(annotation))
+    keys = set(source_model.model_fields)
+    return sorted(keys - nested or keys)
@@ -0,0 +1,227 @@
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from json.decoder import JSONDecodeError
+from typing import Callable
+
+from psycopg2 import OperationalError as DBAPIOperationalError, InterfaceError as DBAPIInterfaceError
+from sqlalchemy.exc import OperationalError, InterfaceError, DisconnectionError, TimeoutError as PoolTimeoutError
+
+from services.db.postgres_client import PostgresDB
+from services.db.ledger import DuplicateFileError
+from logger_config import get_logger
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+DEFAULT_NUM_THREADS = 2
+DEFAULT_QUARANTINE_DIR = 'quarantine/'
+MANIFEST_FILE_NAME = 'manifest.jsonl'
+
+RETRYABLE_ERRORS = (
+    JSONDecodeError,
+    BrokenProcessPool,
+    OperationalError,
+    InterfaceError,
+    DisconnectionError,
+    PoolTimeoutError,
+    DBAPIOperationalError,
+    DBAPIInterfaceError,
+)
+# Postgres error codes worth retrying: serialization failure, deadlock, too many connections, shutdown
+RETRYABLE_PGCODES = {'40001', '40P01', '53300', '57P01', '57P02', '57P03'}
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Decide whether a failed file may succeed later. Truncated JSON (usually a file that is
+    still being written), transient database errors and parser processes that died are
+    retryable, validation errors and other permanent problems are not.
+
+    :param error: The error the file failed with.
+    :return: True if the file should be retried.
+    """
+    while error is not None:
+        if isinstance(error, RETRYABLE_ERRORS):
+            return True
+        if getattr(error, 'pgcode', None) in RETRYABLE_PGCODES:
+            return True
+        error = error.__cause__
+    return False
+
+
+class RetryScheduler:
+    """
+    Retry failed files with exponential backoff and jitter, and quarantine the files that fail
+    permanently or run out of attempts.
+
+    Retries run on the scheduler's own threads, so they never hold up the ingestion workers.
+    Quarantined files are moved into the quarantine directory, and a JSON line describing the
+    failure is appended to its manifest.
+    """
+
+    def __init__(
+            self,
+            db: PostgresDB,
+            quarantine_dir: str = DEFAULT_QUARANTINE_DIR,
+            max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+            base_delay: float = DEFAULT_BASE_DELAY,
+            max_delay: float = DEFAULT_MAX_DELAY,
+            num_threads: int = DEFAULT_NUM_THREADS,
+            on_done: Callable[[str], None] | None = None
+    ):
+        """
+        :param db: Instance of PostgresDB to handle database operations.
+        :param quarantine_dir: Directory receiving permanently failed files and the manifest.
+        :param max_attempts: Maximum number of attempts per file, including the first one.
+        :param base_delay: Delay in seconds before the first retry, doubled for every further retry.
+        :param max_delay: Maximum delay in seconds between two attempts.
+        :param num_threads: Number of threads running retries.
+        :param on_done: Callable invoked with the path of every file loaded, or skipped as already loaded.
+        """
+        self.db = db
+        self.quarantine_dir = quarantine_dir
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.num_threads = num_threads
+        self.on_done = on_done
+        self._process = None
+        self._heap: list[tuple[float, int, str, str]] = []
+        self._sequence = itertools.count()
+        self._attempts: dict[str, int] = {}
+        self._condition = threading.Condition()
+        self._manifest_lock = threading.Lock()
+        self._stopped = False
+        self._threads: list[threading.Thread] = []
+
+    def start(self, process: Callable[..., None]):
+        """
+        Start the retry threads.
+
+        :param process: Callable invoked as process(file_name=..., file_path=..., db=...) to retry a file.
+        """
+        self._process = process
+        self._stopped = False
+        for index in range(self.num_threads):
+            thread = threading.Thread(target=self._run, name=f"retry-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Stop the retry threads. Pending retries are dropped, their files stay in place
+        and are picked up again by the next startup scan.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of files waiting for a retry.
+        """
+        with self._condition:
+            return len(self._heap)
+
+    def on_result(self, file_path: str, error: Exception | None):
+        """
+        Report the outcome of an attempt to load a file.
+
+        :param file_path: Path to the file.
+        :param error: The error the attempt failed with, None if it succeeded.
+        """
+        if error is None or isinstance(error, DuplicateFileError):
+            with self._condition:
+                self._attempts.pop(file_path, None)
+            if self.on_done:
+                self.on_done(file_path)
+            return
+        retryable = is_retryable(error)
+        with self._condition:
+            if retryable and self._stopped:
+                return  # Leave the file in place for the next startup scan
+            attempts = self._attempts.get(file_path, 0) + 1
+            retry = retryable and attempts < self.max_attempts
+            if retry:
+                self._attempts[file_path] = attempts
+                delay = self._backoff(attempts)
+                heapq.heappush(
+                    self._heap, (time.monotonic() + delay, next(self._sequence), os.path.basename(file_path), file_path)
+                )
+                self._condition.notify()
+            else:
+                self._attempts.pop(file_path, None)
+        if retry:
+            logger.info(f"Retrying file {file_path} in {delay:.1f}s (attempt {attempts + 1}/{self.max_attempts})")
+        else:
+            self.quarantine(file_path=file_path, error=error, attempts=attempts)
+
+    def quarantine(self, file_path: str, error: Exception, attempts: int = 1):
+        """
+        Move the file into the quarantine directory and record the failure in the manifest.
+
+        :param file_path: Path to the file.
+        :param error: The error the file failed with.
+        :param attempts: Number of attempts made.
+        """
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        file_name = os.path.basename(file_path)
+        target = os.path.join(self.quarantine_dir, file_name)
+        if os.path.exists(target):
+            target = os.path.join(self.quarantine_dir, f"{time.time_ns()}_{file_name}")
+        try:
+            os.replace(file_path, target)
+        except OSError as e:
+            logger.error(f"Could not quarantine file {file_path}: {e}")
+            target = None
+        entry = {
+            "file_name": file_name,
+            "source_path": file_path,
+            "quarantine_path": target,
+            "error_type": type(error).__name__,
+            "error": str(error),
+            "attempts": attempts,
+            "quarantined_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with self._manifest_lock:
+            with open(os.path.join(self.quarantine_dir, MANIFEST_FILE_NAME), 'a') as manifest:
+                manifest.write(json.dumps(entry) + '\n')
+        logger.warning(f"Quarantined file {file_path} after {attempts} attempt(s): {type(error).__name__}")
+
+    def _backoff(self, attempts: int) -> float:
+        """
+        Exponential backoff with jitter: a random delay between half and all of the nominal delay.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                        self._condition.wait(timeout=self._heap[0][0] - time.monotonic() if self._heap else None)
+                    if self._stopped:
+                        return
+                    _, _, file_name, file_path = heapq.heappop(self._heap)
+                try:
+                    self._process(file_name=file_name, file_path=file_path, db=self.db)
+                except Exception as e:
+                    logger.exception(f"Unexpected error retrying file {file_path}: {e}")
+        finally:
+            # Release this thread's session and connection
+            self.db.remove_session()
@@ -0,0 +1,600 @@
+import bisect
+import json
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from services.db.postgres_client import PostgresDB
+from services.db.ledger import IngestionLedger, DuplicateFileError, FileRecord
+from services.metrics import record_file, STAGE_SECONDS, OUTCOME_LOADED, OUTCOME_SKIPPED, OUTCOME_FAILED
+from models import Base
+from models.row_types import get_envelope_adapter
+from file_processing.loader import DataSource, OBJECTS_DETECTION_SOURCE, VEHICLE_STATUS_SOURCE
+from file_processing.batcher import group_by_model
+from file_processing.retry import RetryScheduler, is_retryable
+from logger_config import get_logger, get_event_log
+
+# Segments are rolled over once they reach this size
+DEFAULT_SEGMENT_MAX_BYTES = 64 * 2 ** 20
+# Spooled bytes loaded per drain transaction
+DEFAULT_DRAIN_MAX_BYTES = 32 * 2 ** 20
+# Seconds between two polls of an empty spool
+DEFAULT_POLL_INTERVAL = 0.2
+# Backoff in seconds between two drain attempts while the database is unavailable
+DEFAULT_BASE_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 30.0
+
+SEGMENT_SUFFIX = '.log'
+# Corrupt records are copied into files with this suffix, see Spool.set_aside
+CORRUPT_SUFFIX = '.corrupt'
+CHECKPOINT_FILE_NAME = 'checkpoint.json'
+# Record header: metadata length, body length, CRC32 of metadata and body
+RECORD_HEADER = struct.Struct('>III')
+
+# Data sources by the key of their items, which identifies the source of a spooled record
+SPOOLED_SOURCES: dict[str, DataSource] = {
+    source.data_key: source for source in (OBJECTS_DETECTION_SOURCE, VEHICLE_STATUS_SOURCE)
+}
+
+# Set up logging
+logger = get_logger(__name__)
+file_events = get_event_log(__name__)
+
+
+class SpoolCorruptError(Exception):
+    """
+    Raised when a record that was written completely fails its checksum.
+    """
+
+    def __init__(self, message: str, position: int, resume: int):
+        """
+        :param message: Description of the error.
+        :param position: Spool position of the corrupt record.
+        :param resume: Spool position where reading can resume, after the record, or after its
+                       segment if the record's lengths cannot be trusted.
+        """
+        super().__init__(message)
+        self.position = position
+        self.resume = resume
+
+
+class SpoolRecord(NamedTuple):
+    """
+    A record read from the spool.
+
+    Attributes:
+        end (int): Spool position right after the record, to be committed once the record is processed.
+        metadata (dict): The record's metadata.
+        body (bytes): The record's body.
+    """
+    end: int
+    metadata: dict
+    body: bytes
+
+
+class Spool:
+    """
+    Durable local write-ahead log of validated rows, absorbing bursts and database outages.
+
+    The spool is an append-only log split into segment files, each named after the position of
+    its first byte in the log. Every record is framed by its lengths and a CRC32, and appends
+    are fsynced before they return, with concurrent appenders sharing an fsync. Readers only
+    see fsynced records. The position up to which records were processed is committed to a
+    checkpoint file, atomically replaced, and segments entirely before the checkpoint are
+    deleted. On open, a torn record at the end of the log, left by a crash during an append,
+    is truncated away.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = DEFAULT_SEGMENT_MAX_BYTES, fsync: bool = True):
+        """
+        :param directory: Directory holding the segments and the checkpoint.
+        :param segment_max_bytes: Size in bytes from which a segment is rolled over.
+        :param fsync: Whether appends and checkpoints are fsynced, disabling it trades durability for speed.
+        """
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self._segments: list[int] = []
+        self._fd = None
+        self._end = 0
+        self._active_size = 0
+        self._synced = 0
+        self._checkpoint = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        """
+        Open the spool, recovering its state from the directory.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+        self._checkpoint = self._read_checkpoint()
+        if self._segments:
+            start = self._segments[-1]
+            self._active_size = self._recover_segment(start)
+            self._end = start + self._active_size
+            self._checkpoint = max(self._checkpoint, self._segments[0])
+        else:
+            self._segments = [self._checkpoint]
+            self._end = self._checkpoint
+            self._active_size = 0
+        if self._checkpoint > self._end:
+            logger.warning(f"Spool checkpoint {self._checkpoint} is past the end of the log {self._end}, resetting it")
+            self._checkpoint = self._end
+        self._fd = os.open(self._segment_path(self._segments[-1]), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._sync_directory()
+        self._synced = self._end
+        if self.pending_bytes:
+            logger.info(f"Spool {self.directory} holds {self.pending_bytes} bytes to drain")
+
+    def close(self):
+        """
+        Flush and close the active segment.
+        """
+        with self._sync_lock, self._lock:
+            if self._fd is not None:
+                if self.fsync:
+                    os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+
+    @property
+    def pending_bytes(self) -> int:
+        """
+        Number of spooled bytes not processed yet.
+        """
+        with self._lock:
+            return self._readable_end() - self._checkpoint
+
+    def append(self, metadata: dict, body: bytes) -> int:
+        """
+        Append a record, and return once it is durable.
+
+        :param metadata: JSON-serializable metadata of the record.
+        :param body: The record's body.
+        :return: Spool position right after the record.
+        """
+        payload = json.dumps(metadata).encode()
+        crc = zlib.crc32(body, zlib.crc32(payload))
+        data = RECORD_HEADER.pack(len(payload), len(body), crc) + payload + body
+        with self._lock:
+            full = self._active_size and self._active_size + len(data) > self.segment_max_bytes
+        if full:
+            with self._sync_lock, self._lock:
+                if self._active_size and self._active_size + len(data) > self.segment_max_bytes:
+                    self._roll()
+        with self._lock:
+            _write_all(self._fd, data)
+            self._end += len(data)
+            self._active_size += len(data)
+            end = self._end
+        if self.fsync:
+            self._sync(end)
+        return end
+
+    def append_rows(
+            self,
+            file_path: str,
+            data_source: DataSource,
+            rows: list[tuple],
+            record: FileRecord | None = None,
+            prefix: str | None = None
+    ) -> int:
+        """
+        Append the validated rows of a file, see SpoolDrainer.
+
+        :param file_path: Path of the file the rows were read from.
+        :param data_source: Description of the file's data.
+        :param rows: The validated row tuples.
+        :param record: The file's ledger record, if the file is tracked by the ledger.
+        :param prefix: Type of the file, used to label its metrics.
+        :return: Spool position right after the record.
+        """
+        adapter = get_envelope_adapter(data_source.source_model, data_source.data_key)
+        metadata = {
+            "file_path": file_path,
+            "prefix": prefix,
+            "data_key": data_source.data_key,
+            "record": _encode_record(record) if record else None,
+        }
+        with STAGE_SECONDS.time(stage='spool'):
+            return self.append(metadata=metadata, body=adapter.dump_json({data_source.data_key: rows}))
+
+    def read(self, max_bytes: int = DEFAULT_DRAIN_MAX_BYTES) -> list[SpoolRecord]:
+        """
+        Read the records following the checkpoint. At least one record is returned if any is
+        available, more while their total size stays within `max_bytes`.
+
+        :param max_bytes: Maximum total size in bytes of the records returned.
+        :return: The records, in log order.
+        :raises SpoolCorruptError: If the first record to return is corrupt, see `set_aside`.
+        """
+        with self._lock:
+            limit = self._readable_end()
+            segments = list(self._segments)
+            position = self._checkpoint
+        records = []
+        total = 0
+        index = bisect.bisect_right(segments, position) - 1
+        while position < limit and index < len(segments):
+            start = segments[index]
+            segment_end = segments[index + 1] if index + 1 < len(segments) else limit
+            with open(self._segment_path(start), 'rb') as file:
+                file.seek(position - start)
+                while position < min(segment_end, limit):
+                    metadata_length, body_length, crc = RECORD_HEADER.unpack(file.read(RECORD_HEADER.size))
+                    size = RECORD_HEADER.size + metadata_length + body_length
+                    if position + size > min(segment_end, limit):
+                        # The lengths are corrupt, the records after this one cannot be found in its segment
+                        if records:
+                            return records
+                        raise SpoolCorruptError(
+                            f"Corrupt spool record at position {position} in {self.directory}",
+                            position=position, resume=min(segment_end, limit)
+                        )
+                    if records and total + size > max_bytes:
+                        return records
+                    payload = file.read(metadata_length)
+                    body = file.read(body_length)
+                    if zlib.crc32(body, zlib.crc32(payload)) != crc:
+                        if records:
+                            return records
+                        raise SpoolCorruptError(
+                            f"Corrupt spool record at position {position} in {self.directory}",
+                            position=position, resume=position + size
+                        )
+                    position += size
+                    total += size
+                    records.append(SpoolRecord(end=position, metadata=json.loads(payload), body=body))
+            index += 1
+        return records
+
+    def commit(self, position: int):
+        """
+        Mark the records before a position as processed, and delete the segments holding only
+        processed records.
+
+        :param position: End position of the last processed record.
+        """
+        self._write_checkpoint(position)
+        with self._lock:
+            self._checkpoint = position
+            drained = []
+            while len(self._segments) > 1 and self._segments[1] <= position:
+                drained.append(self._segments.pop(0))
+        for start in drained:
+            os.remove(self._segment_path(start))
+
+    def set_aside(self, error: SpoolCorruptError) -> str:
+        """
+        Copy the bytes of a corrupt record into a file of the spool directory, for inspection,
+        and commit the checkpoint after them so that reading resumes with the next record.
+
+        :param error: The error raised by `read`.
+        :return: Path of the file holding the corrupt bytes.
+        """
+        with self._lock:
+            start = self._segments[bisect.bisect_right(self._segments, error.position) - 1]
+        path = os.path.join(self.directory, f"{error.position:020d}{CORRUPT_SUFFIX}")
+        with open(self._segment_path(start), 'rb') as segment, open(path, 'wb') as file:
+            segment.seek(error.position - start)
+            file.write(segment.read(error.resume - error.position))
+        self.commit(error.resume)
+        return path
+
+    def _readable_end(self) -> int:
+        return self._synced if self.fsync else self._end
+
+    def _sync(self, end: int):
+        # Group commit: a single fsync makes the records of every appender waiting here durable
+        with self._sync_lock:
+            if self._synced >= end:
+                return
+            with self._lock:
+                target, fd = self._end, self._fd
+            os.fsync(fd)
+            with self._lock:
+                self._synced = max(self._synced, target)
+
+    def _roll(self):
+        # Called holding both locks, so no append or fsync uses the segment meanwhile
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._synced = self._end
+        self._segments.append(self._end)
+        self._fd = os.open(self._segment_path(self._end), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._active_size = 0
+        self._sync_directory()
+
+    def _recover_segment(self, start: int) -> int:
+        """
+        Validate the records of a segment and truncate it after the last complete record.
+
+        :return: Size of the segment after recovery.
+        """
+        path = self._segment_path(start)
+        valid = 0
+        with open(path, 'rb') as file:
+            while True:
+                header = file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                metadata_length, body_length, crc = RECORD_HEADER.unpack(header)
+                payload = file.read(metadata_length)
+                body = file.read(body_length)
+                if len(payload) < metadata_length or len(body) < body_length:
+                    break
+                if zlib.crc32(body, zlib.crc32(payload)) != crc:
+                    break
+                valid += RECORD_HEADER.size + metadata_length + body_length
+        size = os.path.getsize(path)
+        if valid < size:
+            logger.warning(f"Truncating {size - valid} bytes of torn spool records from {path}")
+            with open(path, 'r+b') as file:
+                file.truncate(valid)
+                os.fsync(file.fileno())
+        return valid
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE_NAME)) as file:
+                return json.load(file)["position"]
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, position: int):
+        path = os.path.join(self.directory, CHECKPOINT_FILE_NAME)
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump({"position": position}, file)
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+        os.replace(temporary_path, path)
+        self._sync_directory()
+
+    def _sync_directory(self):
+        if not self.fsync:
+            return
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _segment_path(self, start: int) -> str:
+        return os.path.join(self.directory, f"{start:020d}{SEGMENT_SUFFIX}")
+
+
+class _SpooledFile(NamedTuple):
+    end: int
+    file_path: str
+    model: type[Base]
+    rows: list[tuple]
+    record: FileRecord | None
+    prefix: str | None
+
+
+class SpoolDrainer:
+    """
+    Background bulk loader of the spool into the database.
+
+    The records following the spool's checkpoint are written together in one transaction,
+    each file being recorded in the ledger in that transaction, and the checkpoint is committed
+    after the database commit. A crash between the two replays the records, which the ledger
+    then skips as duplicates, so the drainer must be given the ledger whenever the spooled
+    files are fingerprinted. While the database is unavailable the same records are retried
+    with exponential backoff, nothing is dropped. A file failing permanently, e.g. on a
+    constraint, is isolated by retrying the batch one file per transaction, and quarantined.
+    The outcome of a file is reported to the RetryScheduler only once its rows are committed,
+    so its claim is completed only then (see FileClaims).
+    """
+
+    def __init__(
+            self,
+            spool: Spool,
+            db: PostgresDB,
+            ledger: IngestionLedger | None = None,
+            retry: RetryScheduler | None = None,
+            max_bytes: int = DEFAULT_DRAIN_MAX_BYTES,
+            poll_interval: float = DEFAULT_POLL_INTERVAL,
+            base_backoff: float = DEFAULT_BASE_BACKOFF,
+            max_backoff: float = DEFAULT_MAX_BACKOFF
+    ):
+        """
+        :param spool: The spool to drain.
+        :param db: Instance of PostgresDB to handle database operations.
+        :param ledger: Optional IngestionLedger recording the drained files.
+        :param retry: Optional RetryScheduler receiving the outcome of every drained file.
+        :param max_bytes: Spooled bytes loaded per transaction.
+        :param poll_interval: Seconds between two polls of an empty spool.
+        :param base_backoff: Delay in seconds after the first failed attempt, doubled for every further one.
+        :param max_backoff: Maximum delay in seconds between two attempts.
+        """
+        self.spool = spool
+        self.db = db
+        self.ledger = ledger
+        self.retry = retry
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start draining on a background thread.
+        """
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="spool-drainer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop draining once the current transaction is done. Records not drained yet stay in the
+        spool and are drained after the next start.
+        """
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def drain_once(self) -> int:
+        """
+        Load the next records of the spool and commit the checkpoint after them. A corrupt record
+        is set aside and skipped (see Spool.set_aside), so it never blocks the records after it.
+
+        :return: Number of records drained.
+        :raises: The retryable error if the database is unavailable; the records written before it are committed.
+                 Files failing with any other error are reported as failed and skipped.
+        """
+        try:
+            records = self.spool.read(max_bytes=self.max_bytes)
+        except SpoolCorruptError as e:
+            path = self.spool.set_aside(e)
+            logger.error(f"{e}, skipped it and moved its bytes to {path}")
+            return 0
+        if not records:
+            return 0
+        files = [_decode(record) for record in records]
+        done, error = self._write(files)
+        if done:
+            self.spool.commit(files[done - 1].end)
+        if error:
+            raise error
+        return done
+
+    def _write(self, files: list[_SpooledFile]) -> tuple[int, Exception | None]:
+        """
+        :return: Number of leading files handled, and the retryable error that stopped the others.
+        """
+        try:
+            with self.db.transaction():
+                for model, rows in group_by_model(files).items():
+                    self.db.insert(model=model, data=rows)
+                for spooled_file in files:
+                    self._record_loaded(spooled_file)
+        except Exception as e:
+            # Not only database errors, e.g. a row the driver cannot encode: a file failing for good must
+            # be reported and skipped, or it would block every record behind it
+            if is_retryable(e):
+                return 0, e
+            logger.warning(f"Drain of {len(files)} spooled files failed, retrying files separately: {e}")
+            return self._write_separately(files)
+        for spooled_file in files:
+            self._report(spooled_file, None)
+        return len(files), None
+
+    def _write_separately(self, files: list[_SpooledFile]) -> tuple[int, Exception | None]:
+        for index, spooled_file in enumerate(files):
+            try:
+                with self.db.transaction():
+                    self.db.insert(model=spooled_file.model, data=spooled_file.rows)
+                    self._record_loaded(spooled_file)
+            except DuplicateFileError as e:
+                self._report(spooled_file, e)
+            except Exception as e:
+                if is_retryable(e):
+                    return index, e
+                if self.ledger and spooled_file.record:
+                    self.ledger.record_failed(record=spooled_file.record, error=e)
+                self._report(spooled_file, e)
+            else:
+                self._report(spooled_file, None)
+        return len(files), None
+
+    def _record_loaded(self, spooled_file: _SpooledFile):
+        if self.ledger and spooled_file.record:
+            self.ledger.record_loaded(record=spooled_file.record, row_count=len(spooled_file.rows))
+
+    def _report(self, spooled_file: _SpooledFile, error: Exception | None):
+        file_path = spooled_file.file_path
+        if isinstance(error, DuplicateFileError):
+            file_events.info('skipped', "Skipping already loaded file: %s", file_path)
+            outcome = OUTCOME_SKIPPED
+        elif isinstance(error, SQLAlchemyError):
+            logger.error(f"Database error for spooled file {file_path}: {error}")
+            outcome = OUTCOME_FAILED
+        elif error:
+            logger.error(f"Error loading spooled file {file_path}: {error!r}")
+            outcome = OUTCOME_FAILED
+        else:
+            file_events.info('loaded', "Successfully loaded file: %s", file_path)
+            outcome = OUTCOME_LOADED
+        record_file(file_path=file_path, prefix=spooled_file.prefix, outcome=outcome, row_count=len(spooled_file.rows))
+        if self.retry:
+            self.retry.on_result(file_path=file_path, error=error)
+
+    def _run(self):
+        failures = 0
+        try:
+            while not self._stopped.is_set():
+                try:
+                    drained = self.drain_once()
+                except Exception as e:
+                    if not is_retryable(e):
+                        logger.exception(f"Unexpected error draining the spool: {e}")
+                        self._stopped.wait(self.poll_interval)
+                        continue
+                    failures += 1
+                    delay = min(self.max_backoff, self.base_backoff * 2 ** (failures - 1))
+                    logger.warning(
+                        f"Database unavailable, {self.spool.pending_bytes} spooled bytes waiting, "
+                        f"retrying in {delay:.1f}s: {e}"
+                    )
+                    self._stopped.wait(delay)
+                    continue
+                if failures:
+                    logger.info("Database available again, draining the spool")
+                    failures = 0
+                if not drained:
+                    self._stopped.wait(self.poll_interval)
+        finally:
+            # Release this thread's session and connection
+            self.db.remove_session()
+
+
+def _decode(record: SpoolRecord) -> _SpooledFile:
+    metadata = record.metadata
+    data_source = SPOOLED_SOURCES[metadata["data_key"]]
+    adapter = get_envelope_adapter(data_source.source_model, data_source.data_key)
+    rows = adapter.validate_json(record.body)[data_source.data_key]
+    file_record = metadata["record"]
+    if file_record:
+        file_record = FileRecord(**{**file_record, "started_at": datetime.fromisoformat(file_record["started_at"])})
+    return _SpooledFile(
+        end=record.end,
+        file_path=metadata["file_path"],
+        model=data_source.db_model,
+        rows=rows,
+        record=file_record,
+        prefix=metadata["prefix"]
+    )
+
+
+def _encode_record(record: FileRecord) -> dict:
+    return {**record._asdict(), "started_at": record.started_at.isoformat()}
+
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
@@ -0,0 +1,157 @@
+import json
+from json.decoder import JSONDecodeError
+from typing import Iterator, TextIO
+
+from pydantic import ValidationError
+
+DEFAULT_READ_SIZE = 2 ** 16
+
+_WHITESPACE = ' \t\n\r'
+_decoder = json.JSONDecoder()
+
+
+class _Buffer:
+    """
+    Sliding text window over a file object. Only the unconsumed tail of the file
+    is kept in memory, so memory usage is bounded by the largest single JSON value.
+    """
+
+    def __init__(self, file: TextIO, read_size: int):
+        self._file = file
+        self._read_size = read_size
+        self._text = ''
+        self._pos = 0
+        self._consumed = 0
+        self.eof = False
+
+    @property
+    def position(self) -> int:
+        """
+        Offset of the next unconsumed character from the start of the file.
+        """
+        return self._consumed + self._pos
+
+    def fill(self) -> bool:
+        """
+        Read the next chunk from the file, discarding the consumed prefix of the window.
+
+        :return: False if the end of the file was reached, True otherwise.
+        """
+        if self.eof:
+            return False
+        chunk = self._file.read(self._read_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self._consumed += self._pos
+        self._text = self._text[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Skip whitespace and return the next significant character without consuming it.
+
+        :return: The next character, or an empty string at the end of the file.
+        """
+        while True:
+            while self._pos < len(self._text) and self._text[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char: str):
+        """
+        Consume the next significant character, which must be `char`.
+
+        :param char: The expected character.
+        """
+        if self.peek() != char:
+            raise JSONDecodeError(f"Expecting '{char}'", self._text, self._pos)
+        self._pos += 1
+
+    def decode(self):
+        """
+        Decode the next complete JSON value, reading more of the file as needed.
+
+        :return: The decoded Python object.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._text, self._pos)
+            except JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A value ending exactly at the window edge may be a truncated number or literal
+            if end == len(self._text) and self.fill():
+                continue
+            self._pos = end
+            return value
+
+
+def iter_json_array_items(file: TextIO, data_key: str, read_size: int = DEFAULT_READ_SIZE) -> Iterator:
+    """
+    Incrementally parse a JSON document of the form {"<data_key>": [item, item, ...], ...}
+    and yield the items of the array one at a time.
+
+    :param file: Text file object positioned at the start of the document.
+    :param data_key: Top level key holding the array of items.
+    :param read_size: Number of characters to read from the file at a time.
+    :return: Iterator over the decoded array items.
+    :raises ValidationError: If the document has no `data_key`, like validating the whole document would.
+    """
+    buffer = _Buffer(file=file, read_size=read_size)
+    buffer.expect('{')
+    keys = []
+    if buffer.peek() == '}':
+        raise _missing_key_error(data_key=data_key, keys=keys)
+    while True:
+        key = buffer.decode()
+        buffer.expect(':')
+        if key != data_key:
+            keys.append(key)
+            buffer.decode()  # Skip values of unrelated keys
+        else:
+            buffer.expect('[')
+            if buffer.peek() == ']':
+                return
+            while True:
+                yield buffer.decode()
+                if buffer.peek() == ']':
+                    return
+                buffer.expect(',')
+        if buffer.peek() == '}':
+            raise _missing_key_error(data_key=data_key, keys=keys)
+        buffer.expect(',')
+
+
+def _missing_key_error(data_key: str, keys: list[str]) -> ValidationError:
+    # The values of the skipped keys are not kept, so the input shows their names only
+    return ValidationError.from_exception_data(
+        title='document', line_errors=[{'type': 'missing', 'loc': (data_key,), 'input': dict.fromkeys(keys)}]
+    )
+
+
+def find_item_start(file: TextIO, min_offset: int, read_size: int = DEFAULT_READ_SIZE) -> int:
+    """
+    Skip the items of a JSON array, from a file positioned at the start of an item, up to the
+    first item starting at or after `min_offset`.
+
+    :param file: Text file object positioned at the start of an array item.
+    :param min_offset: Offset from the file's position, in characters, to skip to.
+    :param read_size: Number of characters to read from the file at a time.
+    :return: Offset of that item from the file's position, or of the closing bracket if the array ends first.
+    """
+    buffer = _Buffer(file=file, read_size=read_size)
+    while True:
+        buffer.decode()
+        if buffer.peek() == ']':
+            return buffer.position
+        buffer.expect(',')
+        buffer.peek()
+        if buffer.position >= min_offset:
+            return buffer.position
@@ -0,0 +1,148 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable
+
+from services.db.postgres_client import PostgresDB
+from logger_config import get_logger
+
+DEFAULT_NUM_WORKERS = os.cpu_count() or 1
+# Pending files per worker before submit() starts blocking the producer
+DEFAULT_QUEUE_SIZE_PER_WORKER = 64
+
+_STOP = object()
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+class IngestionWorkerPool:
+    """
+    Fixed pool of ingestion threads draining a bounded queue of files.
+
+    Every worker thread gets its own session from PostgresDB's scoped_session, so workers
+    load files concurrently on separate database connections. When the queue is full,
+    `submit` blocks, which pushes back on the producer (e.g. the watchdog dispatch thread).
+    """
+
+    def __init__(
+            self,
+            db: PostgresDB,
+            process: Callable[..., None],
+            num_workers: int = DEFAULT_NUM_WORKERS,
+            max_queue_size: int | None = None
+    ):
+        """
+        :param db: Instance of PostgresDB to handle database operations.
+        :param process: Callable invoked as process(file_name=..., file_path=..., db=...) for every file.
+        :param num_workers: Number of worker threads.
+        :param max_queue_size: Maximum number of pending files, defaults to a multiple of num_workers.
+        """
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self.db = db
+        self.num_workers = num_workers
+        self._process = process
+        self._queue = queue.Queue(maxsize=max_queue_size or num_workers * DEFAULT_QUEUE_SIZE_PER_WORKER)
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._busy_time = 0.0
+        self._processed = 0
+        self._started_at = None
+
+    def start(self):
+        """
+        Start the worker threads.
+        """
+        self._started_at = time.monotonic()
+        for index in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"ingestion-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.num_workers} ingestion workers")
+
+    def submit(self, file_name: str, file_path: str, timeout: float | None = None):
+        """
+        Queue a file for ingestion, blocking while the queue is full.
+
+        :param file_name: Name of the file.
+        :param file_path: Path to the file.
+        :param timeout: Maximum number of seconds to wait for a free slot, None waits forever.
+        :raises queue.Full: If no slot became available within the timeout.
+        """
+        self._queue.put((file_name, file_path), timeout=timeout)
+
+    def stop(self):
+        """
+        Process the files already queued, then stop the worker threads.
+        """
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        logger.info(f"Ingestion workers stopped: {self.stats()}")
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Number of files waiting for a worker.
+        """
+        return self._queue.qsize()
+
+    @property
+    def busy_workers(self) -> int:
+        """
+        Number of workers currently processing a file.
+        """
+        return self._busy
+
+    def stats(self) -> dict:
+        """
+        Snapshot of the pool state. Utilisation is the fraction of worker time spent
+        processing files since the pool was started.
+
+        :return: A dictionary of pool statistics.
+        """
+        with self._lock:
+            busy_time = self._busy_time
+            processed = self._processed
+            busy = self._busy
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        capacity = elapsed * self.num_workers
+        return {
+            "workers": self.num_workers,
+            "busy_workers": busy,
+            "queue_depth": self.queue_depth,
+            "queue_capacity": self._queue.maxsize,
+            "processed_files": processed,
+            "utilisation": round(busy_time / capacity, 3) if capacity else 0.0,
+        }
+
+    def _run(self):
+        """
+        Worker loop: take files from the queue and process them until stopped.
+        """
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                file_name, file_path = item
+                with self._lock:
+                    self._busy += 1
+                started = time.monotonic()
+                try:
+                    self._process(file_name=file_name, file_path=file_path, db=self.db)
+                except Exception as e:
+                    logger.exception(f"Unexpected error processing file {file_path}: {e}")
+                finally:
+                    with self._lock:
+                        self._busy -= 1
+                        self._busy_time += time.monotonic() - started
+                        self._processed += 1
+        finally:
+            # Release this thread's session and connection
+            self.db.remove_session()
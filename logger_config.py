@@ -1,14 +1,63 @@
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
 from functools import lru_cache
-from logging import Logger, StreamHandler, FileHandler, Handler, Formatter
+from logging import Logger, LogRecord, StreamHandler, Handler, Formatter
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 from typing import Type
 
+# File receiving the logs besides the console, None logs to the console only
+LOG_FILE: str | None = os.environ.get('LOG_FILE', 'app.log')
+# Output format, 'text' or 'json' (one JSON object per line)
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+# LOG_FILE is rotated once it reaches this size, keeping LOG_BACKUP_COUNT rotated files
+LOG_MAX_BYTES = 100 * 2 ** 20
+LOG_BACKUP_COUNT = 5
+# Rotate LOG_FILE at this time interval instead of by size, e.g. 'midnight' or 'H' (see TimedRotatingFileHandler)
+LOG_ROTATE_WHEN: str | None = os.environ.get('LOG_ROTATE_WHEN')
+# Records waiting for the listener thread, further records are dropped and counted
+LOG_QUEUE_SIZE = 100_000
+# Per-file messages of an EventLog: the first LOG_EVENT_BURST of every event are logged per
+# LOG_SUMMARY_INTERVAL seconds, and a summary of the counts is logged once per interval
+LOG_EVENT_BURST = 20
+LOG_SUMMARY_INTERVAL = 60.0
+# Seconds between checks of the listener thread for EventLog summaries due, logged even if no further event happens
+LOG_SUMMARY_CHECK_INTERVAL = 1.0
+
+JSON_FORMAT = 'json'
+TEXT_FORMAT = 'text'
+if LOG_FORMAT not in (TEXT_FORMAT, JSON_FORMAT):
+    raise ValueError(f"Unknown LOG_FORMAT: {LOG_FORMAT}")
+
+# Attributes of every LogRecord, anything else was passed with `extra` and is a field of JSON output
+_RECORD_ATTRIBUTES = frozenset(vars(LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_settings = {
+    'log_file': LOG_FILE,
+    'log_format': LOG_FORMAT,
+    'max_bytes': LOG_MAX_BYTES,
+    'backup_count': LOG_BACKUP_COUNT,
+    'rotate_when': LOG_ROTATE_WHEN,
+}
+_listener: '_Listener | None' = None
+_listener_lock = threading.Lock()
+
 
 @lru_cache(maxsize=2 ** 12)
 def get_logger(name: str | None = None) -> Logger:
     """
     Get a logger instance with the given name. This function caches logger instances to avoid reconfiguring them.
 
+    Loggers only put their records on a queue, the console and file handlers run on a
+    background listener thread (see configure_logging), so logging never waits for I/O.
+
     :param name: The name of the logger. Defaults to None.
     :return: A logger instance.
     """
@@ -16,37 +65,311 @@ def get_logger(name: str | None = None) -> Logger:
     if not logger.handlers:
         # Set the logging level
         logger.setLevel(logging.INFO)
-
-        # Create and add handlers
-        stream_handler = setup_handler(StreamHandler)
-        file_handler = setup_handler(FileHandler, filename='app.log')
-        logger.addHandler(stream_handler)
-        logger.addHandler(file_handler)
+        logger.addHandler(_queue_handler)
 
     logger.propagate = False
     return logger
 
 
+@lru_cache(maxsize=2 ** 12)
+def get_event_log(name: str | None = None) -> 'EventLog':
+    """
+    Get the EventLog of the logger with the given name, for messages logged once per file.
+
+    :param name: The name of the logger. Defaults to None.
+    :return: An EventLog instance.
+    """
+    return EventLog(get_logger(name))
+
+
+def configure_logging(
+        log_file: str | None = LOG_FILE,
+        log_format: str = LOG_FORMAT,
+        max_bytes: int = LOG_MAX_BYTES,
+        backup_count: int = LOG_BACKUP_COUNT,
+        rotate_when: str | None = LOG_ROTATE_WHEN
+):
+    """
+    Change the handlers of the listener thread. The records queued so far are written with the
+    previous handlers. Processes sharing a directory should log to different files, since
+    rotation is not coordinated across processes.
+
+    :param log_file: File receiving the logs besides the console, None logs to the console only.
+    :param log_format: 'text' or 'json'.
+    :param max_bytes: Size at which the file is rotated.
+    :param backup_count: Number of rotated files kept.
+    :param rotate_when: Time interval at which the file is rotated instead, see TimedRotatingFileHandler.
+    """
+    if log_format not in (TEXT_FORMAT, JSON_FORMAT):
+        raise ValueError(f"Unknown log format: {log_format}")
+    with _listener_lock:
+        _stop_listener()
+        _settings.update(
+            log_file=log_file, log_format=log_format, max_bytes=max_bytes, backup_count=backup_count,
+            rotate_when=rotate_when
+        )
+
+
+def stop_logging():
+    """
+    Log the pending event summaries and write the queued records. Registered to run at exit,
+    logging resumes if records are logged afterwards.
+    """
+    for event_log in list(_event_logs):
+        event_log.flush()
+    with _listener_lock:
+        _stop_listener()
+
+
 def setup_handler(handler_cls: Type[Handler], level: int = logging.INFO, **kwargs) -> Handler:
     """
     General function to set up a logging handler with a specific level and formatter.
 
-    :param handler_cls: The handler class to be instantiated (e.g., StreamHandler, FileHandler).
+    :param handler_cls: The handler class to be instantiated (e.g., StreamHandler, RotatingFileHandler).
     :param level: The logging level for the handler.
-    :param kwargs: Additional keyword arguments for the handler (e.g., filename for FileHandler).
+    :param kwargs: Additional keyword arguments for the handler (e.g., filename for RotatingFileHandler).
     :return: Configured logging handler.
     """
     handler = handler_cls(**kwargs)
     handler.setLevel(level)
-    formatter = get_formatter()
+    formatter = get_formatter(_settings['log_format'])
     handler.setFormatter(formatter)
     return handler
 
 
-def get_formatter() -> Formatter:
+def get_formatter(log_format: str = TEXT_FORMAT) -> Formatter:
     """
     Create and return a formatter for logging.
 
+    :param log_format: 'text' or 'json'.
     :return: Configured formatter.
     """
+    if log_format == JSON_FORMAT:
+        return JsonFormatter()
     return Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+class JsonFormatter(Formatter):
+    """
+    Format records as one JSON object per line, with the `extra` fields of the record as keys.
+    """
+
+    def format(self, record: LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items()
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_')
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class EventLog:
+    """
+    Rate-limited INFO messages for events happening once per file, e.g. a loaded file.
+
+    The first `burst` messages of every event are logged in each `interval`, the others are only
+    counted, and the counts of the interval are logged as one summary line. The summary is logged
+    with the first event of the next interval, by the listener thread once the interval ended, or
+    by `flush`. Messages take %-style arguments, so suppressed messages are never formatted.
+    """
+
+    def __init__(self, logger: Logger, burst: int = LOG_EVENT_BURST, interval: float = LOG_SUMMARY_INTERVAL):
+        """
+        :param logger: Logger receiving the messages and summaries.
+        :param burst: Number of messages logged per event and interval.
+        :param interval: Length of an interval in seconds.
+        """
+        self.logger = logger
+        self.burst = burst
+        self.interval = interval
+        self._counts: dict[str, int] = {}
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        _event_logs.append(self)
+
+    def info(self, event: str, msg: str, *args):
+        """
+        Count an event and log its message unless the event exceeded its burst in this interval.
+
+        :param event: Name of the event in the summary, e.g. loaded.
+        :param msg: Message, formatted with `args` only if it is logged.
+        :param args: Arguments of the message.
+        """
+        now = time.monotonic()
+        with self._lock:
+            summary = self._take_summary(now) if now - self._started >= self.interval else None
+            count = self._counts[event] = self._counts.get(event, 0) + 1
+        if summary:
+            self._log_summary(*summary)
+        if count <= self.burst:
+            self.logger.info(msg, *args, extra={'event': event})
+
+    def flush(self):
+        """
+        Log the summary of the current interval, if any event happened, and start a new interval.
+        """
+        with self._lock:
+            summary = self._take_summary(time.monotonic())
+        if summary:
+            self._log_summary(*summary)
+
+    def flush_due(self, now: float):
+        """
+        Log the summary of the current interval if it ended, called by the listener thread.
+
+        :param now: Current time.monotonic().
+        """
+        with self._lock:
+            summary = self._take_summary(now) if now - self._started >= self.interval else None
+        if summary:
+            self._log_summary(*summary)
+
+    def _take_summary(self, now: float) -> tuple[dict, float] | None:
+        counts, seconds = self._counts, now - self._started
+        self._counts = {}
+        self._started = now
+        return (counts, seconds) if counts else None
+
+    def _log_summary(self, counts: dict, seconds: float):
+        suppressed = sum(max(0, count - self.burst) for count in counts.values())
+        self.logger.info(
+            f"Events in the last {seconds:.0f}s: {', '.join(f'{event}={count}' for event, count in counts.items())}"
+            f" ({suppressed} messages suppressed)",
+            extra={'events': counts, 'suppressed': suppressed}
+        )
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """
+    Put records on the bounded queue of the listener thread, dropping them when it is full.
+    The message is merged with its arguments here, since they may change later, but applying
+    the formatter is left to the listener's handlers.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: LogRecord):
+        if _listener is None:
+            _start_listener()
+        try:
+            if self.dropped:
+                self._put_dropped_warning()
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _put_dropped_warning(self):
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if not dropped:
+            return
+        try:
+            self.queue.put_nowait(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"Dropped {dropped} log records, the log queue was full"
+            }))
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += dropped
+            raise
+
+
+class _StderrHandler(StreamHandler):
+    """
+    StreamHandler writing to the current sys.stderr, which may be replaced after the listener started.
+    """
+
+    def __init__(self):
+        Handler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+
+class _Listener(QueueListener):
+    """
+    QueueListener waiting for room in the queue to stop, rather than failing when it is full,
+    and logging the EventLog summaries due every LOG_SUMMARY_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._next_summary_check = time.monotonic() + LOG_SUMMARY_CHECK_INTERVAL
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+    def dequeue(self, block: bool) -> LogRecord:
+        while True:
+            now = time.monotonic()
+            if now >= self._next_summary_check:
+                self._next_summary_check = now + LOG_SUMMARY_CHECK_INTERVAL
+                for event_log in list(_event_logs):
+                    event_log.flush_due(now)
+            try:
+                return self.queue.get(block, timeout=self._next_summary_check - now)
+            except queue.Empty:
+                if not block:
+                    raise
+
+
+def _start_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        handlers = [setup_handler(_StderrHandler)]
+        log_file = _settings['log_file']
+        if log_file and _settings['rotate_when']:
+            handlers.append(setup_handler(
+                TimedRotatingFileHandler, filename=log_file, when=_settings['rotate_when'],
+                backupCount=_settings['backup_count'], delay=True
+            ))
+        elif log_file:
+            handlers.append(setup_handler(
+                RotatingFileHandler, filename=log_file, maxBytes=_settings['max_bytes'],
+                backupCount=_settings['backup_count'], delay=True
+            ))
+        _listener = _Listener(_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def _stop_listener():
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+_EXCEPTION_FORMATTER = Formatter()
+_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_queue_handler = _DroppingQueueHandler(_queue)
+_queue_handler.setLevel(logging.INFO)
+_event_logs: list[EventLog] = []
+atexit.register(stop_logging)
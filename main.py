@@ -1,23 +1,235 @@
+import os
+import threading
 import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.exc import SQLAlchemyError
 
 from services.db.config import get_connection_details
 from services.db.postgres_client import PostgresDB
+from services.db.ledger import IngestionLedger
+from services.db.partitions import PartitionManager
+from services.metrics import REGISTRY, MetricsServer, DEFAULT_METRICS_HOST, DEFAULT_METRICS_PORT
+from services.fleet_status import FleetStatusIndex, FleetStatusServer, DEFAULT_STATUS_HOST, DEFAULT_STATUS_PORT
+from models.db_models import ObjectsDetectionEvent, Detection, VehicleStatus, PARTITIONED, PARTITION_INTERVAL
 from services.observer.observer_client import DirectoryObserver
+from file_processing.worker_pool import DEFAULT_NUM_WORKERS
+from file_processing.batcher import MicroBatcher
+from file_processing.retry import RetryScheduler
+from file_processing.spool import Spool, SpoolDrainer
+from file_processing.claims import FileClaims
+from file_processing.parallel_parser import ParallelParser
+from logger_config import get_logger
 
 # Directory to monitor
 DIRECTORY_TO_WATCH = 'input/'
+# Poll DIRECTORY_TO_WATCH with os.scandir instead of relying on inotify, required on NFS and SMB mounts
+POLL_DIRECTORY = False
+# Also ingest the files in subdirectories of DIRECTORY_TO_WATCH, e.g. input/2024/07/21/
+RECURSIVE = False
+# Directory receiving files that failed permanently
+QUARANTINE_DIRECTORY = 'quarantine/'
+# Number of concurrent ingestion workers, each one holds its own database connection
+NUM_WORKERS = DEFAULT_NUM_WORKERS
+# Thresholds for flushing rows of small files in a shared transaction
+BATCH_MAX_ROWS = 50_000
+BATCH_MAX_BYTES = 16 * 2 ** 20
+BATCH_MAX_LATENCY = 0.5
+# Directory of the local write-ahead spool buffering validated rows while the database is slow or down,
+# None loads files straight into the database
+SPOOL_DIRECTORY: str | None = 'spool/'
+# Processes parsing a single large uncompressed file in parallel, 1 parses it on the ingestion thread
+PARSE_PROCESSES = os.cpu_count() or 1
+# Per-worker directories of claimed files, when several processes share DIRECTORY_TO_WATCH (see main_multiprocess.py)
+PROCESSING_DIRECTORY = 'processing/'
+# Directory receiving the files loaded by such worker processes, None deletes them
+DONE_DIRECTORY: str | None = 'done/'
+# Interval in seconds between worker pool statistics log lines
+STATS_LOG_INTERVAL = 60
+# Local endpoint serving the Prometheus metrics, None disables it
+METRICS_HOST = DEFAULT_METRICS_HOST
+METRICS_PORT: int | None = DEFAULT_METRICS_PORT
+# Local endpoint serving the latest status of every vehicle from memory, None disables the in-memory index
+STATUS_HOST = DEFAULT_STATUS_HOST
+STATUS_PORT: int | None = DEFAULT_STATUS_PORT
+# Interval in seconds between reloads of the fleet status index from vehicle_status, picking up the statuses
+# written by other processes such as main_backfill.py, None only loads it at startup
+STATUS_REFRESH_INTERVAL: float | None = 300
+# Interval in seconds between partition maintenance runs, when the detection tables are partitioned
+PARTITION_MAINTENANCE_INTERVAL = 3600
+# Partitions older than this are detached (or dropped with PARTITION_RETENTION_DROP), None keeps everything
+PARTITION_RETENTION: timedelta | None = None
+PARTITION_RETENTION_DROP = False
+
+# Set up logging
+logger = get_logger(__name__)
+
 
+def main(
+        worker_id: str | None = None,
+        num_workers: int = NUM_WORKERS,
+        metrics_port: int | None = METRICS_PORT,
+        stop: threading.Event | None = None,
+        parse_processes: int = PARSE_PROCESSES,
+        status_port: int | None = STATUS_PORT
+):
+    """
+    Run the ingestion pipeline until interrupted, or until `stop` is set.
 
-def main():
-    with PostgresDB(connection_details=get_connection_details()) as db:
+    :param worker_id: ID of this worker process when several processes share the input directory,
+                      files are then claimed before being loaded, see FileClaims.
+    :param num_workers: Number of ingestion worker threads.
+    :param metrics_port: Port serving the Prometheus metrics, None disables it.
+    :param stop: Optional event stopping the pipeline.
+    :param parse_processes: Number of processes parsing large files, see ParallelParser.
+    :param status_port: Port serving the fleet status index, None disables it. Statuses written by other
+                        processes, e.g. main_backfill.py, are picked up every STATUS_REFRESH_INTERVAL.
+    """
+    stop = stop or threading.Event()
+    with PostgresDB(connection_details=get_connection_details(), pool_size=num_workers) as db:
         db.initialize()  # Initialize the database schema if needed
-        observer = DirectoryObserver(directory_path=DIRECTORY_TO_WATCH, db=db)
+        partitions = None
+        if PARTITIONED:
+            partitions = PartitionManager(
+                db=db, tables=[ObjectsDetectionEvent.__table__, Detection.__table__], interval=PARTITION_INTERVAL
+            )
+            partitions.preload()
+            db.partitions = partitions
+        ledger = IngestionLedger(db=db)
+        ledger.preload()
+        file_claims = FileClaims(
+            input_dir=DIRECTORY_TO_WATCH, worker_id=worker_id, processing_dir=PROCESSING_DIRECTORY, done_dir=DONE_DIRECTORY
+        ) if worker_id else None
+        retry = RetryScheduler(
+            db=db, quarantine_dir=QUARANTINE_DIRECTORY, on_done=file_claims.complete if file_claims else None
+        )
+        batcher = MicroBatcher(
+            db=db,
+            max_rows=BATCH_MAX_ROWS,
+            max_bytes=BATCH_MAX_BYTES,
+            max_latency=BATCH_MAX_LATENCY,
+            on_result=retry.on_result,
+            ledger=ledger
+        )
+        spool = drainer = None
+        if SPOOL_DIRECTORY:
+            # Worker processes keep their own spool, found again by the restarted worker
+            spool = Spool(directory=os.path.join(SPOOL_DIRECTORY, worker_id) if worker_id else SPOOL_DIRECTORY)
+            spool.open()
+            drainer = SpoolDrainer(spool=spool, db=db, ledger=ledger, retry=retry)
+        parser = ParallelParser(processes=parse_processes) if parse_processes > 1 else None
+        observer = DirectoryObserver(
+            directory_path=DIRECTORY_TO_WATCH,
+            db=db,
+            num_workers=num_workers,
+            batcher=batcher,
+            ledger=ledger,
+            retry=retry,
+            spool=spool,
+            file_claims=file_claims,
+            polling=POLL_DIRECTORY,
+            recursive=RECURSIVE,
+            parser=parser
+        )
+        register_gauges(db=db, observer=observer, retry=retry, spool=spool)
+        metrics_server = MetricsServer(registry=REGISTRY, host=METRICS_HOST, port=metrics_port) if metrics_port else None
+        status_server = None
+        if status_port:
+            VehicleStatus.status_index = FleetStatusIndex()
+            status_server = FleetStatusServer(index=VehicleStatus.status_index, host=STATUS_HOST, port=status_port)
+        try:
+            if metrics_server:
+                metrics_server.start()
+            if status_server:
+                # Warmed before any file is loaded, later statuses are added as they are committed
+                VehicleStatus.status_index.warm(db)
+                status_server.start()
+            if partitions:
+                maintain_partitions(partitions)
+            if drainer:
+                drainer.start()
+            if parser:
+                parser.start()
+            observer.start_observer()
+            last_stats = last_maintenance = last_refresh = time.monotonic()
+            while not stop.wait(1):
+                if time.monotonic() - last_stats >= STATS_LOG_INTERVAL:
+                    logger.info(f"Worker pool stats: {observer.pool.stats()}")
+                    last_stats = time.monotonic()
+                if partitions and time.monotonic() - last_maintenance >= PARTITION_MAINTENANCE_INTERVAL:
+                    maintain_partitions(partitions)
+                    last_maintenance = time.monotonic()
+                if status_server and STATUS_REFRESH_INTERVAL and (
+                        time.monotonic() - last_refresh >= STATUS_REFRESH_INTERVAL
+                ):
+                    refresh_status_index(index=VehicleStatus.status_index, db=db)
+                    last_refresh = time.monotonic()
+            observer.stop_observer()
+        except KeyboardInterrupt:
+            observer.stop_observer()
+        finally:
+            if parser:
+                parser.stop()
+            if drainer:
+                drainer.stop()
+                spool.close()
+            if metrics_server:
+                metrics_server.stop()
+            if status_server:
+                status_server.stop()
+                VehicleStatus.status_index = None
+
+
+def register_gauges(db: PostgresDB, observer: DirectoryObserver, retry: RetryScheduler, spool: Spool | None = None):
+    """
+    Expose the state of the pipeline components as gauges, read whenever the metrics are collected.
+
+    :param db: Instance of PostgresDB whose connection pool is reported.
+    :param observer: The DirectoryObserver whose worker pool is reported.
+    :param retry: The RetryScheduler whose pending retries are reported.
+    :param spool: The Spool whose backlog is reported, if any.
+    """
+    if observer.pool:
+        REGISTRY.gauge('ingest_queue_depth', 'Files waiting for an ingestion worker').set_function(
+            lambda: observer.pool.queue_depth
+        )
+        REGISTRY.gauge('ingest_busy_workers', 'Ingestion workers processing a file').set_function(
+            lambda: observer.pool.busy_workers
+        )
+    REGISTRY.gauge('ingest_pending_retries', 'Failed files waiting for a retry').set_function(lambda: retry.pending)
+    if spool:
+        REGISTRY.gauge('ingest_spool_pending_bytes', 'Spooled bytes waiting to be drained').set_function(
+            lambda: spool.pending_bytes
+        )
+    connections = REGISTRY.gauge('db_pool_connections', 'Database connection pool state', labels=('state',))
+    for state in ('size', 'checked_out', 'overflow'):
+        connections.set_function(lambda state=state: db.pool_stats()[state], state=state)
+
+
+def maintain_partitions(partitions: PartitionManager):
+    """
+    Create the upcoming partitions and retire the expired ones.
+
+    :param partitions: PartitionManager of the detection tables.
+    """
+    partitions.premake_partitions()
+    if PARTITION_RETENTION is not None:
+        before = datetime.now(timezone.utc) - PARTITION_RETENTION
+        partitions.retire_partitions(before=before, drop=PARTITION_RETENTION_DROP)
+
+
+def refresh_status_index(index: FleetStatusIndex, db: PostgresDB):
+    """
+    Reload the fleet status index from the vehicle_status table. Failures are logged, the index
+    keeps serving the statuses it has.
+
+    :param index: The FleetStatusIndex served by this process.
+    :param db: Instance of PostgresDB to read the table from.
+    """
     try:
-        observer.start_observer()
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        observer.stop_observer()
+        index.warm(db)
+    except SQLAlchemyError as e:
+        logger.error(f"Could not refresh the fleet status index: {e}")
 
 
 if __name__ == "__main__":
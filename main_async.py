@@ -0,0 +1,50 @@
+import asyncio
+
+from watchdog.observers import Observer
+
+from services.db.config import get_connection_details
+from services.db.async_postgres_client import AsyncPostgresDB
+from file_processing.async_handler import AsyncFileHandler, consume_files, DEFAULT_MAX_IN_FLIGHT
+from logger_config import get_logger
+
+# Directory to monitor
+DIRECTORY_TO_WATCH = 'input/'
+# Number of files loaded concurrently by the event loop
+MAX_IN_FLIGHT = DEFAULT_MAX_IN_FLIGHT
+# Database connections shared by the files in flight
+DB_POOL_SIZE = 20
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+async def main():
+    async with AsyncPostgresDB(connection_details=get_connection_details(), pool_size=DB_POOL_SIZE) as db:
+        await db.initialize()  # Initialize the database schema if needed
+        file_queue = asyncio.Queue(maxsize=MAX_IN_FLIGHT * 4)
+        observer = Observer()
+        observer.schedule(
+            AsyncFileHandler(loop=asyncio.get_running_loop(), file_queue=file_queue), DIRECTORY_TO_WATCH, recursive=False
+        )
+        observer.start()
+        logger.info(f"Started monitoring directory: {DIRECTORY_TO_WATCH}")
+        consumer = asyncio.create_task(consume_files(file_queue=file_queue, db=db, max_in_flight=MAX_IN_FLIGHT))
+        try:
+            await consumer
+        finally:
+            observer.stop()
+            # The observer thread may be blocked handing a file to the loop, keep the loop running while joining it
+            await asyncio.to_thread(observer.join)
+            if consumer.done():
+                # Cancelled with this task, e.g. on Ctrl+C: load the queued files with a fresh consumer
+                consumer = asyncio.create_task(consume_files(file_queue=file_queue, db=db, max_in_flight=MAX_IN_FLIGHT))
+            await file_queue.join()
+            consumer.cancel()
+            logger.info("Observer stopped.")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
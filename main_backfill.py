@@ -0,0 +1,74 @@
+"""
+One-shot historical backfill.
+
+    python main_backfill.py archive/2024/ --defer-indexes
+    python main_backfill.py --files-from files.txt
+
+Loads every input file under the given files and directories through UNLOGGED staging tables
+and set-based merges (see file_processing.backfill.Backfill), bypassing the observer, the
+spool and the micro-batcher. Files already loaded by the pipeline are skipped, so the
+backfill can run while the pipeline ingests new files. Interrupted backfills resume when run
+again with the same files. Prints the counters and throughput of every phase as JSON.
+"""
+import argparse
+import json
+
+from services.db.config import get_connection_details
+from services.db.postgres_client import PostgresDB
+from services.db.partitions import PartitionManager
+from models.db_models import ObjectsDetectionEvent, Detection, PARTITIONED, PARTITION_INTERVAL
+from file_processing.backfill import Backfill, find_input_files, DEFAULT_MERGE_BATCH_ROWS
+from file_processing.parallel_parser import ParallelParser
+from main import PARSE_PROCESSES
+from logger_config import get_logger
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+def main_backfill():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs='*', help="Input files and directories, walked recursively")
+    parser.add_argument("--files-from", help="File listing one input path per line")
+    parser.add_argument(
+        "--defer-indexes", action='store_true', help="Drop the secondary indexes during the merge and build them afterwards"
+    )
+    parser.add_argument(
+        "--merge-batch-rows", type=int, default=DEFAULT_MERGE_BATCH_ROWS, help="Staged rows merged per transaction"
+    )
+    parser.add_argument(
+        "--parse-processes", type=int, default=PARSE_PROCESSES, help="Processes parsing large files, 1 disables it"
+    )
+    args = parser.parse_args()
+    paths = list(args.paths)
+    if args.files_from:
+        with open(args.files_from) as file:
+            paths.extend(line.strip() for line in file if line.strip())
+    if not paths:
+        parser.error("no input files or directories given")
+
+    file_paths = find_input_files(paths)
+    logger.info(f"Backfilling {len(file_paths)} files")
+    with PostgresDB(connection_details=get_connection_details(), pool_size=1) as db:
+        db.initialize()
+        if PARTITIONED:
+            db.partitions = PartitionManager(
+                db=db, tables=[ObjectsDetectionEvent.__table__, Detection.__table__], interval=PARTITION_INTERVAL
+            )
+            db.partitions.preload()
+        file_parser = ParallelParser(processes=args.parse_processes) if args.parse_processes > 1 else None
+        if file_parser:
+            file_parser.start()
+        try:
+            backfill = Backfill(
+                db=db, parser=file_parser, merge_batch_rows=args.merge_batch_rows, defer_indexes=args.defer_indexes
+            )
+            summary = backfill.run(file_paths)
+        finally:
+            if file_parser:
+                file_parser.stop()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main_backfill()
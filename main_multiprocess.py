@@ -0,0 +1,59 @@
+import os
+import signal
+import socket
+
+import main
+from services.db.config import get_connection_details
+from services.db.postgres_client import PostgresDB
+from services.metrics import REGISTRY
+from services.supervisor import WorkerSupervisor
+from logger_config import get_logger, configure_logging, LOG_FILE
+
+# Number of worker processes, each one parsing and validating files on its own core
+NUM_PROCESSES = os.cpu_count() or 1
+# Ingestion threads per worker process, overlapping file reads with database round-trips
+THREADS_PER_PROCESS = 2
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+def run_worker(index: int, stop, results):
+    """
+    Run the pipeline of main.py as worker `index`, claiming files from the shared input directory.
+    The worker ID combines the host name and the index, so a restarted worker resumes the files
+    and spool of its previous run, and workers on other hosts sharing the directory do not collide.
+
+    :param index: Index of the worker on this host.
+    :param stop: multiprocessing Event set by the supervisor to stop the worker.
+    :param results: multiprocessing Queue receiving the worker's counters when it exits.
+    """
+    # Ctrl-C reaches the whole process group, let the supervisor stop the workers through `stop`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Log files are rotated by the process writing them, so every worker writes its own, e.g. app-0.log
+    if LOG_FILE:
+        root, extension = os.path.splitext(LOG_FILE)
+        configure_logging(log_file=f"{root}-{index}{extension}")
+    metrics_port = main.METRICS_PORT + 1 + index if main.METRICS_PORT else None
+    try:
+        main.main(
+            worker_id=f"{socket.gethostname()}-{index}",
+            num_workers=THREADS_PER_PROCESS,
+            metrics_port=metrics_port,
+            stop=stop,
+            parse_processes=1,  # The worker processes already occupy the cores
+            status_port=None  # Each worker only sees the statuses it writes itself
+        )
+    finally:
+        results.put((index, REGISTRY.counters()))
+
+
+def main_multiprocess():
+    # Create the schema once, rather than letting the workers race to create it
+    with PostgresDB(connection_details=get_connection_details(), pool_size=1) as db:
+        db.initialize()
+    WorkerSupervisor(target=run_worker, num_processes=NUM_PROCESSES).run()
+
+
+if __name__ == "__main__":
+    main_multiprocess()
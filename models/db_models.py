@@ -1,16 +1,235 @@
-from sqlalchemy import Column, Integer, String, JSON, TIMESTAMP
-from sqlalchemy.dialects.postgresql import insert
+from datetime import timezone
+
+from sqlalchemy import Column, Integer, BigInteger, String, Text, JSON, TIMESTAMP, Index, or_
+from sqlalchemy.dialects.postgresql import insert, JSONB
 from services.db.postgres_client import PostgresDB
+from services.db.bulk import VALUES, COPY, COPY_MERGE
+from services.db.config import get_schema_options, JSONB_COLUMN, NO_PARTITIONING
+from services.db.last_seen_cache import LastSeenCache
 from models import Base
 
+SCHEMA_OPTIONS = get_schema_options()
+USE_JSONB_DETECTIONS = SCHEMA_OPTIONS['detections_column_type'] == JSONB_COLUMN
+PARTITION_INTERVAL = SCHEMA_OPTIONS['partition_interval']
+PARTITIONED = PARTITION_INTERVAL != NO_PARTITIONING
+# Partitioned tables are range partitioned by detection_time, which must be part of their primary key
+_PARTITION_OPTIONS = {'postgresql_partition_by': 'RANGE (detection_time)'} if PARTITIONED else {}
+
+
+class Detection(Base):
+    """
+    SQLAlchemy model for the detections table, one row per object of an objects detection event.
+
+    The table is written together with objects_detection_events (see
+    ObjectsDetectionEvent.related_rows), so aggregates by vehicle, object type and time can be
+    answered from its indexes instead of parsing the events' JSON. There is no foreign key to the
+    events table, which keeps both tables free to be partitioned (see services.db.partitions).
+
+    Attributes:
+        id (int): Primary key of the table.
+        event_id (int): ID of the objects detection event the detection belongs to.
+        vehicle_id (str): The ID of the vehicle that detected the object.
+        detection_time (TIMESTAMP): The timestamp when the detection occurred.
+        object_type (str): The type of object detected (e.g., car, pedestrian).
+        object_value (int): The value associated with the detected object.
+    """
+    __tablename__ = 'detections'
+    __table_args__ = (
+        Index('ix_detections_vehicle_id_detection_time', 'vehicle_id', 'detection_time'),
+        Index('ix_detections_object_type_detection_time', 'object_type', 'detection_time'),
+        _PARTITION_OPTIONS,
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    event_id = Column(Integer, nullable=False, index=True)
+    vehicle_id = Column(String, nullable=False)
+    detection_time = Column(TIMESTAMP(timezone=True), nullable=False, primary_key=PARTITIONED)
+    object_type = Column(String, nullable=False)
+    object_value = Column(Integer, nullable=False)
+
+    # Strategy used by PostgresDB.insert, see services.db.bulk
+    bulk_strategy = COPY
+
+
+class DetectionHourlyRollup(Base):
+    """
+    SQLAlchemy model for the detection_hourly_rollups table, the detections aggregated per
+    vehicle, hour and object type.
+
+    Every batch of events is aggregated in memory and added to the stored totals in the
+    transaction writing the events, so the rollups always match the raw rows. The aggregates of
+    a transaction are combined and written once, just before the commit, so the rollup rows are
+    locked in a single statement, in key order, for as short as possible.
+
+    Attributes:
+        vehicle_id (str): The ID of the vehicle that detected the objects.
+        hour (TIMESTAMP): Start of the hour, in UTC.
+        object_type (str): The type of object detected (e.g., car, pedestrian).
+        detection_count (int): Number of detections.
+        object_value_sum (int): Sum of the detections' object_value.
+    """
+    __tablename__ = 'detection_hourly_rollups'
+    __table_args__ = (
+        Index('ix_detection_hourly_rollups_hour', 'hour'),
+    )
+
+    vehicle_id = Column(String, primary_key=True)
+    hour = Column(TIMESTAMP(timezone=True), primary_key=True)
+    object_type = Column(String, primary_key=True)
+    detection_count = Column(BigInteger, nullable=False)
+    object_value_sum = Column(BigInteger, nullable=False)
+
+    # Strategy used by PostgresDB.insert, see services.db.bulk
+    bulk_strategy = VALUES
+    # Rows are buffered and written by PostgresDB right before the transaction commits
+    write_at_commit = True
+
+    @staticmethod
+    def insert_data(db: PostgresDB, data: list[dict]):
+        """
+        Add the aggregates to the detection_hourly_rollups table.
+
+        :param db: Instance of PostgresDB to handle database operations.
+        :param data: A list of dictionaries representing the aggregates, at most one per key.
+        """
+        db.execute(DetectionHourlyRollup.insert_statement(data))
+
+    @staticmethod
+    def insert_statement(data: list[dict]):
+        """
+        Build the additive upsert statement for the detection_hourly_rollups table. Rows are
+        written in key order, so concurrent transactions lock shared rows in the same order
+        and cannot deadlock on them.
+
+        :param data: A list of dictionaries representing the aggregates, at most one per key.
+        :return: The INSERT ... ON CONFLICT DO UPDATE statement.
+        """
+        rows = sorted(data, key=lambda row: (row['vehicle_id'], row['hour'], row['object_type']))
+        stmt = insert(DetectionHourlyRollup).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=['vehicle_id', 'hour', 'object_type'],
+            set_={
+                'detection_count': DetectionHourlyRollup.detection_count + stmt.excluded.detection_count,
+                'object_value_sum': DetectionHourlyRollup.object_value_sum + stmt.excluded.object_value_sum,
+            }
+        )
+
+    @staticmethod
+    def combine(data: list[dict]) -> list[dict]:
+        """
+        Hook called by PostgresDB before the buffered aggregates are written: sum the aggregates
+        sharing a key.
+
+        :param data: A list of dictionaries representing aggregates.
+        :return: One aggregate row per key.
+        """
+        totals = {}
+        for row in data:
+            key = (row['vehicle_id'], row['hour'], row['object_type'])
+            total = totals.get(key)
+            if total is None:
+                totals[key] = dict(row)
+            else:
+                total['detection_count'] += row['detection_count']
+                total['object_value_sum'] += row['object_value_sum']
+        return list(totals.values())
+
+    @staticmethod
+    def aggregate(detections: list[dict]) -> list[dict]:
+        """
+        Aggregate detections rows per vehicle, hour and object type.
+
+        :param detections: A list of dictionaries representing rows of the detections table.
+        :return: One aggregate row per key.
+        """
+        totals = {}
+        for detection in detections:
+            hour = detection['detection_time'].astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+            key = (detection['vehicle_id'], hour, detection['object_type'])
+            total = totals.get(key)
+            if total is None:
+                totals[key] = [1, detection['object_value']]
+            else:
+                total[0] += 1
+                total[1] += detection['object_value']
+        return [
+            {
+                'vehicle_id': vehicle_id,
+                'hour': hour,
+                'object_type': object_type,
+                'detection_count': count,
+                'object_value_sum': value_sum,
+            }
+            for (vehicle_id, hour, object_type), (count, value_sum) in totals.items()
+        ]
+
 
 class ObjectsDetectionEvent(Base):
+    """
+    SQLAlchemy model for the objects_detection_events table.
+
+    The detections are stored twice: as JSON (or JSONB with a GIN index, see
+    services.db.config.get_schema_options) in the `detections` column, and normalized into the
+    detections table in the same write.
+
+    Attributes:
+        id (int): Primary key of the table.
+        vehicle_id (str): The ID of the vehicle that detected the objects.
+        detection_time (TIMESTAMP): The timestamp when the detection occurred.
+        detections (JSON): The detected objects.
+    """
     __tablename__ = 'objects_detection_events'
+    __table_args__ = (
+        Index('ix_objects_detection_events_vehicle_id_detection_time', 'vehicle_id', 'detection_time'),
+        # Key of the keyset pagination used by exports, see PostgresDB.iter_keyset
+        Index('ix_objects_detection_events_detection_time_id', 'detection_time', 'id'),
+        *([Index(
+            'ix_objects_detection_events_detections', 'detections',
+            postgresql_using='gin', postgresql_ops={'detections': 'jsonb_path_ops'}
+        )] if USE_JSONB_DETECTIONS else []),
+        _PARTITION_OPTIONS,
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     vehicle_id = Column(String, index=True)
-    detection_time = Column(TIMESTAMP(timezone=True))
-    detections = Column(JSON)
+    detection_time = Column(TIMESTAMP(timezone=True), primary_key=PARTITIONED)
+    detections = Column(JSONB if USE_JSONB_DETECTIONS else JSON)
+
+    # Strategy used by PostgresDB.insert, see services.db.bulk
+    bulk_strategy = COPY
+    # Ids are drawn from the sequence before the write, so the related detections can reference them
+    preassign_ids = True
+    # Column whose values must have a partition before the rows are written, see services.db.partitions
+    partition_column = 'detection_time'
+
+    @staticmethod
+    def related_rows(data: list[dict]) -> dict:
+        """
+        Hook called by PostgresDB.insert: normalize the detections of the events, whose ids are set,
+        and aggregate them into hourly rollups.
+
+        :param data: A list of dictionaries or named tuples representing the events.
+        :return: The detections and rollup rows to write with the events, keyed by model.
+        """
+        detections = []
+        for row in data:
+            if isinstance(row, dict):
+                event_id, vehicle_id, detection_time, items = (
+                    row['id'], row['vehicle_id'], row['detection_time'], row['detections']
+                )
+            else:
+                event_id, vehicle_id, detection_time, items = (
+                    row.id, row.vehicle_id, row.detection_time, row.detections
+                )
+            for item in items:
+                detections.append({
+                    'event_id': event_id,
+                    'vehicle_id': vehicle_id,
+                    'detection_time': detection_time,
+                    'object_type': item['object_type'],
+                    'object_value': item['object_value'],
+                })
+        return {Detection: detections, DetectionHourlyRollup: DetectionHourlyRollup.aggregate(detections)}
 
     @staticmethod
     def insert_data(db: PostgresDB, data: list[dict]):
@@ -20,14 +239,28 @@ class ObjectsDetectionEvent(Base):
         :param db: Instance of PostgresDB to handle database operations.
         :param data: A list of dictionaries representing the data to be inserted.
         """
-        query = ObjectsDetectionEvent.__table__.insert().values(data)
-        db.execute(query)
+        db.execute(ObjectsDetectionEvent.insert_statement(data))
+
+    @staticmethod
+    def insert_statement(data: list[dict]):
+        """
+        Build the INSERT statement for the objects_detection_events table.
+
+        :param data: A list of dictionaries representing the data to be inserted.
+        :return: The insert statement.
+        """
+        return ObjectsDetectionEvent.__table__.insert().values(data)
 
 
 class VehicleStatus(Base):
     """
     SQLAlchemy model for the vehicle_status table.
 
+    Rows are upserted newest-wins: a stored status is only replaced by one with a later
+    report_time. `last_applied(db)` remembers the latest report_time written per vehicle so that
+    stale rows are dropped before reaching the database. A report_time without a UTC offset is
+    taken as UTC.
+
     Attributes:
         vehicle_id (str): Primary key of the table. The ID of the vehicle.
         report_time (TIMESTAMP): The timestamp when the status was reported.
@@ -39,6 +272,16 @@ class VehicleStatus(Base):
     report_time = Column(TIMESTAMP(timezone=True))
     status = Column(String)
 
+    # Strategy used by PostgresDB.insert, see services.db.bulk
+    bulk_strategy = COPY_MERGE
+    # Rows with a newer value of this column win on conflict
+    version_column = 'report_time'
+    # Rows of a transaction are buffered and upserted in one statement, in vehicle_id order, right before
+    # it commits, so concurrent transactions lock the rows of overlapping vehicles in the same order
+    write_at_commit = True
+    # Optional services.fleet_status.FleetStatusIndex receiving the committed statuses
+    status_index = None
+
     @staticmethod
     def insert_data(db: PostgresDB, data: list[dict]):
         """
@@ -47,10 +290,110 @@ class VehicleStatus(Base):
         :param db: Instance of PostgresDB to handle database operations.
         :param data: A list of dictionaries representing the data to be inserted or updated.
         """
-        stmt = insert(VehicleStatus).values(data)
+        db.execute(VehicleStatus.insert_statement(data))
+
+    @staticmethod
+    def insert_statement(data: list[dict]):
+        """
+        Build the upsert statement for the vehicles_status table.
+
+        :param data: A list of dictionaries representing the data to be inserted or updated.
+        :return: The INSERT ... ON CONFLICT DO UPDATE statement.
+        """
+        # Rows are upserted, and their row locks taken, in vehicle_id order
+        rows = sorted(VehicleStatus.latest_per_vehicle(data), key=lambda row: row['vehicle_id'])
+        stmt = insert(VehicleStatus).values(rows)
         update_dict = {c.name: c for c in stmt.excluded if c.name != 'vehicle_id'}
-        on_conflict_stmt = stmt.on_conflict_do_update(
+        return stmt.on_conflict_do_update(
             index_elements=['vehicle_id'],
-            set_=update_dict
+            set_=update_dict,
+            where=or_(VehicleStatus.report_time.is_(None), VehicleStatus.report_time < stmt.excluded.report_time)
         )
-        db.execute(on_conflict_stmt)
+
+    @staticmethod
+    def latest_per_vehicle(data: list[dict]) -> list[dict]:
+        """
+        Collapse the rows to the one with the latest report_time per vehicle. Report times
+        without a UTC offset are taken as UTC, so they compare with the others.
+
+        :param data: A list of dictionaries representing vehicle statuses.
+        :return: A list with at most one row per vehicle_id, with timezone-aware report times.
+        """
+        latest = {}
+        for row in data:
+            report_time = row['report_time']
+            if report_time is not None and report_time.tzinfo is None:
+                row = {**row, 'report_time': report_time.replace(tzinfo=timezone.utc)}
+            current = latest.get(row['vehicle_id'])
+            if current is None or row['report_time'] > current['report_time']:
+                latest[row['vehicle_id']] = row
+        return list(latest.values())
+
+    @staticmethod
+    def last_applied(db) -> LastSeenCache:
+        """
+        Get the LRU of vehicle_id -> latest report_time committed through the database instance.
+
+        :param db: Instance of PostgresDB or AsyncPostgresDB.
+        :return: The cache, created on first use.
+        """
+        cache = db.model_state.get(VehicleStatus)
+        if cache is None:
+            cache = db.model_state.setdefault(VehicleStatus, LastSeenCache())
+        return cache
+
+    @staticmethod
+    def prepare_data(db, data: list[dict]) -> list[dict]:
+        """
+        Hook called by PostgresDB.insert: dedupe the rows and drop those not newer than
+        the status last written for their vehicle.
+
+        :param db: Instance of PostgresDB or AsyncPostgresDB writing the rows.
+        :param data: A list of dictionaries representing vehicle statuses.
+        :return: The rows still worth writing.
+        """
+        last_applied = VehicleStatus.last_applied(db)
+        return [
+            row for row in VehicleStatus.latest_per_vehicle(data)
+            if not last_applied.is_stale(row['vehicle_id'], row['report_time'])
+        ]
+
+    @staticmethod
+    def on_committed(db, data: list[dict]):
+        """
+        Hook called by PostgresDB.insert once the rows are committed.
+
+        :param db: Instance of PostgresDB or AsyncPostgresDB that wrote the rows.
+        :param data: The rows that were written.
+        """
+        VehicleStatus.last_applied(db).update((row['vehicle_id'], row['report_time']) for row in data)
+        if VehicleStatus.status_index is not None:
+            VehicleStatus.status_index.update(data)
+
+
+class IngestedFile(Base):
+    """
+    SQLAlchemy model for the ingested_files table, the ledger of processed input files.
+
+    Attributes:
+        id (int): Primary key of the table.
+        file_name (str): Name of the file.
+        file_size (int): Size of the file in bytes.
+        content_hash (str): SHA-256 of the file content, unique per loaded file.
+        row_count (int): Number of rows loaded from the file.
+        status (str): Outcome of the ingestion (loaded, failed).
+        error (str): Error message of a failed ingestion.
+        started_at (TIMESTAMP): When processing of the file started.
+        finished_at (TIMESTAMP): When the file was loaded or failed.
+    """
+    __tablename__ = 'ingested_files'
+
+    id = Column(Integer, primary_key=True)
+    file_name = Column(String, nullable=False)
+    file_size = Column(BigInteger, nullable=False)
+    content_hash = Column(String(64), nullable=False, unique=True)
+    row_count = Column(Integer)
+    status = Column(String, nullable=False)
+    error = Column(Text)
+    started_at = Column(TIMESTAMP(timezone=True))
+    finished_at = Column(TIMESTAMP(timezone=True), index=True)
@@ -0,0 +1,65 @@
+from functools import lru_cache
+from typing import NamedTuple, get_args, get_origin
+
+from pydantic import BaseModel, TypeAdapter
+from typing_extensions import TypedDict
+
+
+@lru_cache(maxsize=None)
+def get_row_type(source_model: type[BaseModel]) -> type[tuple]:
+    """
+    Build a NamedTuple with the fields of a Pydantic source model, in declaration order.
+    Nested models become TypedDicts, so nested values are validated into plain dicts that
+    can be stored as JSON.
+
+    Only field types are carried over, the source models must not rely on custom validators.
+
+    :param source_model: Pydantic model describing one item of an input file.
+    :return: The NamedTuple type of the validated rows.
+    """
+    fields = [(name, _plain_type(field.annotation)) for name, field in source_model.model_fields.items()]
+    return NamedTuple(f"{source_model.__name__}Row", fields)
+
+
+@lru_cache(maxsize=None)
+def get_envelope_adapter(source_model: type[BaseModel], data_key: str) -> TypeAdapter:
+    """
+    Get a cached TypeAdapter validating a whole input document, {data_key: [item, ...]},
+    straight from its JSON bytes into a list of row tuples in a single pydantic-core call.
+
+    :param source_model: Pydantic model describing one item of an input file.
+    :param data_key: Key in the JSON document where the items are stored.
+    :return: TypeAdapter whose validate_json returns {data_key: [row, ...]}.
+    """
+    envelope = TypedDict(f"{source_model.__name__}Envelope", {data_key: list[get_row_type(source_model)]})
+    return TypeAdapter(envelope)
+
+
+@lru_cache(maxsize=None)
+def get_row_adapter(source_model: type[BaseModel]) -> TypeAdapter:
+    """
+    Get a cached TypeAdapter validating a single item, e.g. a line of a newline-delimited JSON
+    file, straight from its JSON bytes into a row tuple.
+
+    :param source_model: Pydantic model describing one item of an input file.
+    :return: TypeAdapter whose validate_json returns a row tuple.
+    """
+    return TypeAdapter(get_row_type(source_model))
+
+
+def _plain_type(annotation):
+    """
+    Replace the Pydantic models nested in a type annotation with equivalent TypedDicts.
+    """
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _get_typed_dict(annotation)
+    args = get_args(annotation)
+    if args:
+        return get_origin(annotation)[tuple(_plain_type(arg) for arg in args)]
+    return annotation
+
+
+@lru_cache(maxsize=None)
+def _get_typed_dict(model: type[BaseModel]) -> type:
+    fields = {name: _plain_type(field.annotation) for name, field in model.model_fields.items()}
+    return TypedDict(f"{model.__name__}Dict", fields)
@@ -0,0 +1,154 @@
+import json
+from contextlib import asynccontextmanager
+from functools import partial
+
+from asyncpg import PostgresError
+from sqlalchemy import JSON
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from models import Base
+from services.db.bulk import VALUES, COPY, reserve_ids_statement, with_ids
+from services.db.postgres_client import _generate_connection_string
+
+
+class AsyncPostgresDB:
+    """
+    Asynchronous counterpart of PostgresDB, backed by an asyncpg engine and connection pool.
+    """
+
+    def __init__(self, connection_details: dict, **engine_options):
+        """
+        Initialize the AsyncPostgresDB instance with the provided connection details.
+
+        :param connection_details: A dictionary containing connection details for the database.
+        :param engine_options: Optional keyword arguments for create_async_engine (e.g. pool_size).
+        """
+        connection_string = _generate_connection_string(connection_details=connection_details)
+        connection_string = connection_string.replace("postgresql://", "postgresql+asyncpg://", 1)
+        try:
+            self._engine = create_async_engine(connection_string, **engine_options)
+            self._session_factory = async_sessionmaker(bind=self._engine, expire_on_commit=False)
+        except SQLAlchemyError as e:
+            raise e
+        # State kept by the models' hooks for this database, keyed by model, see PostgresDB.model_state
+        self.model_state: dict = {}
+
+    async def __aenter__(self):
+        """
+        Enter the context of the AsyncPostgresDB instance.
+        """
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """
+        Exit the context of the AsyncPostgresDB instance, disposing of the engine.
+        """
+        await self.close()
+
+    async def initialize(self):
+        """
+        Create all tables defined in the SQLAlchemy models if they do not exist.
+        """
+        try:
+            async with self._engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
+        except SQLAlchemyError as e:
+            raise SQLAlchemyError(f"Error initializing the database: {e}") from e
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Open a session and a transaction, committed when the block exits or rolled back if it raises.
+        Callbacks appended to session.info['after_commit'] run once the transaction is committed.
+        Rows of related models with `write_at_commit` are written just before the commit.
+        """
+        async with self._session_factory() as session:
+            session.info['after_commit'] = []
+            session.info['deferred'] = {}
+            async with session.begin():
+                yield session
+                deferred = session.info['deferred']
+                # In table name order, so concurrent transactions lock the deferred tables in the same order
+                for model, rows in sorted(deferred.items(), key=lambda item: item[0].__tablename__):
+                    combine = getattr(model, 'combine', None)
+                    await self._write(session, model, combine(rows) if combine else rows)
+            for callback in session.info['after_commit']:
+                callback()
+
+    async def insert(self, model: Base, data: list[dict], session: AsyncSession | None = None):
+        """
+        Insert data into the specified model's table. Models using the COPY bulk strategy are
+        loaded with asyncpg's binary COPY, all others through the model's insert statement.
+        The model's `prepare_data`, `on_committed` and `related_rows` hooks, `preassign_ids` and
+        `write_at_commit` are honoured as in PostgresDB.insert.
+
+        :param model: The SQLAlchemy model to insert data into.
+        :param data: A list of dictionaries or row tuples (see models.row_types) to be inserted.
+        :param session: Session of an enclosing `transaction()`, a new transaction is used if omitted.
+        """
+        if data and isinstance(data[0], tuple):
+            data = [row._asdict() for row in data]
+        prepare_data = getattr(model, 'prepare_data', None)
+        if data and prepare_data:
+            data = prepare_data(self, data)
+        if not data:
+            return
+        try:
+            if session is None:
+                async with self.transaction() as session:
+                    await self._write(session, model, data)
+            else:
+                await self._write(session, model, data)
+        except (SQLAlchemyError, PostgresError) as e:
+            raise SQLAlchemyError(f"Error inserting data: {e}") from e
+
+    async def execute(self, query):
+        """
+        Execute a SQL query in its own transaction.
+
+        :param query: The SQL query to execute
+        :return: The result of the query
+        """
+        try:
+            async with self.transaction() as session:
+                return await session.execute(query)
+        except SQLAlchemyError as e:
+            raise SQLAlchemyError(f"Error executing query: {e}") from e
+
+    async def close(self):
+        """
+        Dispose of the engine and its connection pool.
+        """
+        await self._engine.dispose()
+
+    async def _write(self, session: AsyncSession, model: Base, data: list[dict]):
+        on_committed = getattr(model, 'on_committed', None)
+        if on_committed:
+            session.info['after_commit'].append(partial(on_committed, self, data))
+        if getattr(model, 'preassign_ids', False):
+            ids = (await session.execute(reserve_ids_statement(model.__table__, len(data)))).scalars().all()
+            data = with_ids(data, ids)
+        related_rows = getattr(model, 'related_rows', None)
+        for related_model, rows in (related_rows(data) if related_rows else {}).items():
+            if rows and getattr(related_model, 'write_at_commit', False):
+                session.info['deferred'].setdefault(related_model, []).extend(rows)
+            elif rows:
+                await self._write(session, related_model, rows)
+        if getattr(model, 'bulk_strategy', VALUES) != COPY:
+            await session.execute(model.insert_statement(data))
+            return
+        table = model.__table__
+        keys = data[0].keys()
+        columns = [column for column in table.columns if column.name in keys]
+        encoders = [json.dumps if isinstance(column.type, JSON) else None for column in columns]
+        records = [
+            tuple(encode(row[column.name]) if encode and row[column.name] is not None else row[column.name]
+                  for column, encode in zip(columns, encoders))
+            for row in data
+        ]
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            table.name, records=records, columns=[column.name for column in columns]
+        )
@@ -0,0 +1,211 @@
+import io
+import json
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import JSON, Table, text
+
+# Names of the available bulk write strategies
+VALUES = 'values'
+COPY = 'copy'
+COPY_MERGE = 'copy_merge'
+
+_NULL = r'\N'
+
+
+class BulkWriter(ABC):
+    """
+    Base class for the strategies used by PostgresDB to write a batch of rows into a table.
+    Writers run inside the current session transaction and never commit themselves.
+    Rows are dictionaries or named tuples keyed by column name.
+    """
+
+    @abstractmethod
+    def write(self, db, model, data: list[dict]):
+        """
+        Write the rows into the model's table.
+
+        :param db: Instance of PostgresDB to handle database operations.
+        :param model: The SQLAlchemy model whose table receives the rows.
+        :param data: A list of dictionaries representing the rows to be written.
+        """
+
+
+class ValuesWriter(BulkWriter):
+    """
+    Write rows through the model's own `insert_data`, i.e. a multi-row INSERT ... VALUES statement.
+    """
+
+    def write(self, db, model, data: list[dict]):
+        model.insert_data(db, data)
+
+
+class CopyWriter(BulkWriter):
+    """
+    Stream rows into the table with COPY FROM STDIN.
+    """
+
+    def write(self, db, model, data: list[dict]):
+        table = model.__table__
+        columns = _get_columns(table, data)
+        with db.cursor() as cursor:
+            _copy(cursor, _quote(table.name), columns, data)
+
+
+class CopyMergeWriter(BulkWriter):
+    """
+    COPY rows into a temporary staging table and merge them into the target table
+    with INSERT ... ON CONFLICT DO UPDATE on its primary key.
+
+    If the model defines a `version_column`, only the newest staged row per key is merged
+    and existing rows are only updated by rows with a newer version.
+    """
+
+    def write(self, db, model, data: list[dict]):
+        table = model.__table__
+        columns = _get_columns(table, data)
+        version_column = getattr(model, 'version_column', None)
+        stage = _quote(f"_stage_{table.name}")
+        with db.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {_quote(table.name)} INCLUDING DEFAULTS) "
+                f"ON COMMIT DELETE ROWS"
+            )
+            _copy(cursor, stage, columns, data)
+            cursor.execute(_merge_statement(table, stage, columns, version_column))
+            cursor.execute(f"TRUNCATE {stage}")
+
+
+BULK_WRITERS: dict[str, BulkWriter] = {
+    VALUES: ValuesWriter(),
+    COPY: CopyWriter(),
+    COPY_MERGE: CopyMergeWriter(),
+}
+
+
+def get_bulk_writer(strategy: str) -> BulkWriter:
+    """
+    Get the bulk writer registered under the given strategy name.
+
+    :param strategy: Name of the strategy, one of VALUES, COPY or COPY_MERGE.
+    :return: The matching bulk writer.
+    """
+    try:
+        return BULK_WRITERS[strategy]
+    except KeyError:
+        raise ValueError(f"Unknown bulk write strategy: {strategy}") from None
+
+
+def reserve_ids_statement(table: Table, count: int):
+    """
+    Build the statement drawing `count` values from the sequence of the table's `id` column,
+    so that rows written with COPY can be referenced before they are written.
+
+    :param table: Table whose id sequence is used.
+    :param count: Number of ids to reserve.
+    :return: A statement returning one id per row.
+    """
+    return text(
+        "SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"
+    ).bindparams(table=table.name, count=count)
+
+
+def with_ids(data: list[dict], ids: list[int]) -> list[dict]:
+    """
+    Set the `id` of every row, keeping dictionaries as dictionaries and named tuples as named tuples.
+
+    :param data: A list of dictionaries or named tuples representing the rows.
+    :param ids: One id per row.
+    :return: The rows with their ids.
+    """
+    if isinstance(data[0], dict):
+        return [{**row, 'id': row_id} for row, row_id in zip(data, ids)]
+    row_type = _with_id_type(type(data[0]))
+    return [row_type(row_id, *row) for row, row_id in zip(data, ids)]
+
+
+@lru_cache(maxsize=None)
+def _with_id_type(row_type: type[tuple]) -> type[tuple]:
+    return namedtuple(row_type.__name__, ('id',) + row_type._fields)
+
+
+def _get_columns(table: Table, data: list[dict]) -> list:
+    """
+    Get the table columns present in the rows, in table order.
+    """
+    keys = _row_keys(data[0])
+    return [column for column in table.columns if column.name in keys]
+
+
+def _copy(cursor, target: str, columns: list, data: list[dict]):
+    """
+    Send the rows to the target table using COPY FROM STDIN in CSV format.
+    """
+    column_names = ', '.join(_quote(column.name) for column in columns)
+    is_json = [isinstance(column.type, JSON) for column in columns]
+    names = [column.name for column in columns]
+
+    positions = {}
+    buffer = io.StringIO()
+    for row in data:
+        if isinstance(row, dict):
+            values = [row[name] for name in names]
+        else:
+            row_type = type(row)
+            if row_type not in positions:
+                positions[row_type] = [row._fields.index(name) for name in names]
+            values = [row[position] for position in positions[row_type]]
+        buffer.write(','.join(_encode(value, json_value) for value, json_value in zip(values, is_json)))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {target} ({column_names}) FROM STDIN WITH (FORMAT csv, NULL '{_NULL}')", buffer)
+
+
+def _merge_statement(table: Table, stage: str, columns: list, version_column: str | None = None) -> str:
+    """
+    Build the INSERT ... SELECT ... ON CONFLICT statement merging the staging table into the table.
+    """
+    target = _quote(table.name)
+    keys = ', '.join(_quote(column.name) for column in table.primary_key.columns)
+    key_names = [column.name for column in table.primary_key.columns]
+    column_names = ', '.join(_quote(column.name) for column in columns)
+    updates = ', '.join(
+        f"{_quote(column.name)} = EXCLUDED.{_quote(column.name)}"
+        for column in columns if column.name not in key_names
+    )
+    if version_column:
+        # Keep the newest row per key, a key may only be affected once per statement. Either way rows
+        # are merged, and their row locks taken, in key order, so concurrent merges cannot deadlock
+        version = _quote(version_column)
+        select = f"SELECT DISTINCT ON ({keys}) {column_names} FROM {stage} ORDER BY {keys}, {version} DESC"
+        condition = f" WHERE {target}.{version} IS NULL OR {target}.{version} < EXCLUDED.{version}"
+    else:
+        select = f"SELECT {column_names} FROM {stage} ORDER BY {keys}"
+        condition = ""
+    statement = f"INSERT INTO {target} ({column_names}) {select} ON CONFLICT ({keys}) "
+    return statement + (f"DO UPDATE SET {updates}{condition}" if updates else "DO NOTHING")
+
+
+def _encode(value, json_value: bool) -> str:
+    """
+    Encode a single value as a quoted CSV field. Quoted fields are never read as NULL.
+    """
+    if value is None:
+        return _NULL
+    if json_value:
+        value = json.dumps(value)
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _row_keys(row) -> tuple:
+    return tuple(row.keys()) if isinstance(row, dict) else row._fields
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
@@ -1,3 +1,14 @@
+import os
+
+JSON_COLUMN = 'json'
+JSONB_COLUMN = 'jsonb'
+
+# Partition intervals of the detection tables
+NO_PARTITIONING = 'none'
+DAILY = 'day'
+MONTHLY = 'month'
+
+
 def get_connection_details() -> dict:
     """
     Returns the database connection details.
@@ -12,3 +23,25 @@ def get_connection_details() -> dict:
         "database": "postgres_db",
     }
 
+
+def get_schema_options() -> dict:
+    """
+    Returns the options shaping the database schema, read from the environment when the models are imported.
+
+    - DETECTIONS_COLUMN_TYPE: Type of objects_detection_events.detections, `json` (default) or `jsonb`.
+      With `jsonb` the column gets a GIN index for containment queries.
+    - DETECTIONS_PARTITION_INTERVAL: Range partitioning of objects_detection_events and detections
+      by detection_time, `none` (default), `day` or `month`. See services.db.partitions.
+
+    :return: A dictionary containing the schema options.
+    """
+    detections_column_type = os.environ.get("DETECTIONS_COLUMN_TYPE", JSON_COLUMN).lower()
+    if detections_column_type not in (JSON_COLUMN, JSONB_COLUMN):
+        raise ValueError(f"Unknown DETECTIONS_COLUMN_TYPE: {detections_column_type}")
+    partition_interval = os.environ.get("DETECTIONS_PARTITION_INTERVAL", NO_PARTITIONING).lower()
+    if partition_interval not in (NO_PARTITIONING, DAILY, MONTHLY):
+        raise ValueError(f"Unknown DETECTIONS_PARTITION_INTERVAL: {partition_interval}")
+    return {
+        "detections_column_type": detections_column_type,
+        "partition_interval": partition_interval,
+    }
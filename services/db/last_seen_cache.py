@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable
+
+DEFAULT_MAX_SIZE = 100_000
+
+
+class LastSeenCache:
+    """
+    Thread-safe LRU mapping of keys to the newest version (e.g. a timestamp) applied to the
+    database. Evicted keys are simply unknown again, so the cache can only ever let redundant
+    rows through, never drop a row that is newer than the stored one.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAX_SIZE):
+        """
+        :param maxsize: Maximum number of keys kept in the cache.
+        """
+        self.maxsize = maxsize
+        self._versions: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def get(self, key: Hashable):
+        """
+        Get the last applied version of a key.
+
+        :param key: The key to look up.
+        :return: The version, or None if the key is unknown.
+        """
+        with self._lock:
+            return self._versions.get(key)
+
+    def is_stale(self, key: Hashable, version) -> bool:
+        """
+        Check whether a version is not newer than the last applied version of the key.
+
+        :param key: The key to check.
+        :param version: The incoming version.
+        :return: True if applying the version would not change the stored row.
+        """
+        with self._lock:
+            applied = self._versions.get(key)
+            if applied is None:
+                return False
+            self._versions.move_to_end(key)
+            return version <= applied
+
+    def update(self, items: Iterable[tuple[Hashable, Any]]):
+        """
+        Record applied versions, keeping the newest version per key.
+
+        :param items: Iterable of (key, version) pairs.
+        """
+        with self._lock:
+            for key, version in items:
+                applied = self._versions.get(key)
+                if applied is None or version > applied:
+                    self._versions[key] = version
+                self._versions.move_to_end(key)
+            while len(self._versions) > self.maxsize:
+                self._versions.popitem(last=False)
+
+    def clear(self):
+        """
+        Forget all keys.
+        """
+        with self._lock:
+            self._versions.clear()
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from services.db.postgres_client import PostgresDB
+from models.db_models import IngestedFile
+
+LOADED = 'loaded'
+FAILED = 'failed'
+
+DEFAULT_MAX_INDEX_SIZE = 2 ** 20
+_HASH_READ_SIZE = 2 ** 20
+
+
+class DuplicateFileError(Exception):
+    """
+    Raised when a file with the same content has already been loaded.
+    """
+
+
+class FileRecord(NamedTuple):
+    """
+    Identity of an input file for the ledger.
+
+    Attributes:
+        file_name (str): Name of the file.
+        file_size (int): Size of the file in bytes.
+        content_hash (str): SHA-256 hex digest of the file content.
+        started_at (datetime): When processing of the file started.
+    """
+    file_name: str
+    file_size: int
+    content_hash: str
+    started_at: datetime
+
+
+def fingerprint_file(file_path: str) -> FileRecord:
+    """
+    Hash the content of a file for the ledger.
+
+    :param file_path: Path to the file.
+    :return: The file's ledger record.
+    """
+    started_at = datetime.now(timezone.utc)
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(_HASH_READ_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    return FileRecord(
+        file_name=os.path.basename(file_path), file_size=size, content_hash=digest.hexdigest(), started_at=started_at
+    )
+
+
+class IngestionLedger:
+    """
+    Manager of the ingested_files table, making file processing idempotent.
+
+    A file is identified by the hash of its content. Loaded files are recorded in the same
+    transaction as their rows, and a unique constraint on the hash rejects a second load of the
+    same content even across processes. The hashes of recently loaded files are also kept in a
+    bounded in-memory index, preloaded at startup, so duplicates are usually detected without
+    a database round-trip.
+    """
+
+    def __init__(self, db: PostgresDB, max_index_size: int = DEFAULT_MAX_INDEX_SIZE):
+        """
+        :param db: Instance of PostgresDB to handle database operations.
+        :param max_index_size: Maximum number of hashes kept in memory.
+        """
+        self.db = db
+        self.max_index_size = max_index_size
+        self._index: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def preload(self):
+        """
+        Fill the in-memory index with the hashes of the most recently loaded files.
+        """
+        query = (
+            select(IngestedFile.content_hash)
+            .where(IngestedFile.status == LOADED)
+            .order_by(IngestedFile.finished_at.desc())
+            .limit(self.max_index_size)
+        )
+        hashes = self.db.execute(query).scalars().all()
+        self._add_to_index(reversed(hashes))
+
+    def is_loaded(self, content_hash: str) -> bool:
+        """
+        Check the in-memory index for an already loaded file content.
+
+        :param content_hash: SHA-256 hex digest of the file content.
+        :return: True if the content is known to be loaded.
+        """
+        with self._lock:
+            return content_hash in self._index
+
+    def record_loaded(self, record: FileRecord, row_count: int):
+        """
+        Record a loaded file. Must be called inside the transaction writing the file's rows,
+        which is thereby rolled back if the same content was loaded concurrently.
+
+        :param record: The file's ledger record.
+        :param row_count: Number of rows loaded from the file.
+        :raises DuplicateFileError: If a file with the same content is already loaded.
+        """
+        query = self._upsert(record, status=LOADED, row_count=row_count).returning(IngestedFile.id)
+        if self.db.execute(query).scalar() is None:
+            raise DuplicateFileError(f"File content already loaded: {record.content_hash}")
+        self.db.after_commit(lambda: self._add_to_index([record.content_hash]))
+
+    def record_failed(self, record: FileRecord, error: Exception):
+        """
+        Record a failed file in its own transaction, unless the content was loaded meanwhile.
+        Failures to write the record are ignored, the ledger must not mask the original error.
+
+        :param record: The file's ledger record.
+        :param error: The error that made the file fail.
+        """
+        try:
+            self.db.execute(self._upsert(record, status=FAILED, error=str(error)))
+        except SQLAlchemyError:
+            pass
+
+    @staticmethod
+    def _upsert(record: FileRecord, status: str, row_count: int | None = None, error: str | None = None):
+        values = {
+            **record._asdict(),
+            'row_count': row_count,
+            'status': status,
+            'error': error,
+            'finished_at': datetime.now(timezone.utc),
+        }
+        stmt = insert(IngestedFile).values(values)
+        # Only failed attempts may be overwritten, a loaded file stays loaded
+        return stmt.on_conflict_do_update(
+            index_elements=['content_hash'],
+            set_={key: stmt.excluded[key] for key in values if key != 'content_hash'},
+            where=IngestedFile.status != LOADED
+        )
+
+    def _add_to_index(self, hashes):
+        with self._lock:
+            for content_hash in hashes:
+                self._index[content_hash] = None
+                self._index.move_to_end(content_hash)
+            while len(self._index) > self.max_index_size:
+                self._index.popitem(last=False)
@@ -0,0 +1,219 @@
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
+
+from sqlalchemy import Connection, Table, text
+
+from services.db.postgres_client import PostgresDB
+from services.db.bulk import _quote
+from services.db.config import DAILY, MONTHLY
+from logger_config import get_logger
+
+# Number of intervals after the current one whose partitions are created in advance
+DEFAULT_PREMAKE = 2
+
+_NAME_FORMATS = {DAILY: '%Y%m%d', MONTHLY: '%Y%m'}
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+def partition_start(timestamp: datetime, interval: str) -> datetime:
+    """
+    Get the lower bound of the partition holding a timestamp.
+
+    :param timestamp: A timezone-aware timestamp, naive timestamps are taken as UTC.
+    :param interval: Partition interval, DAILY or MONTHLY.
+    :return: Start of the partition, in UTC.
+    """
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    timestamp = timestamp.astimezone(timezone.utc)
+    if interval == DAILY:
+        return datetime(timestamp.year, timestamp.month, timestamp.day, tzinfo=timezone.utc)
+    if interval == MONTHLY:
+        return datetime(timestamp.year, timestamp.month, 1, tzinfo=timezone.utc)
+    raise ValueError(f"Unknown partition interval: {interval}")
+
+
+def next_partition_start(start: datetime, interval: str) -> datetime:
+    """
+    Get the upper bound of the partition starting at `start`, i.e. the start of the next one.
+
+    :param start: Start of a partition.
+    :param interval: Partition interval, DAILY or MONTHLY.
+    :return: Start of the next partition.
+    """
+    if interval == DAILY:
+        return start + timedelta(days=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(table: Table, start: datetime, interval: str) -> str:
+    """
+    Get the name of the partition of a table starting at `start`, e.g. detections_p20240721.
+
+    :param table: The partitioned table.
+    :param start: Start of the partition.
+    :param interval: Partition interval, DAILY or MONTHLY.
+    :return: The partition's table name.
+    """
+    return f"{table.name}_p{start.strftime(_NAME_FORMATS[interval])}"
+
+
+class PartitionManager:
+    """
+    Create and retire the range partitions of tables partitioned by a timestamp column.
+
+    Partitions are created ahead of time by `premake`, and on demand by PostgresDB.insert for
+    rows of models with a `partition_column` (see ensure_rows), so inserts always find their
+    partition. Missing partitions are created in a short transaction on a separate connection,
+    so the ingest transaction that needs them does not hold the locks of their creation until
+    it commits, and creation is serialized across processes with an advisory lock. A partition
+    is created as a plain table and then attached, since attaching, unlike creating it with
+    PARTITION OF, does not wait for the transactions writing into the parent table, including
+    the caller's. The partitions known to exist are cached, so the check costs no round-trip
+    once a partition has been seen.
+    """
+
+    def __init__(self, db: PostgresDB, tables: Iterable[Table], interval: str, premake: int = DEFAULT_PREMAKE):
+        """
+        :param db: Instance of PostgresDB to handle database operations.
+        :param tables: The partitioned tables, all partitioned with the same interval.
+        :param interval: Partition interval, DAILY or MONTHLY.
+        :param premake: Number of intervals after the current one whose partitions `premake` creates.
+        """
+        if interval not in _NAME_FORMATS:
+            raise ValueError(f"Unknown partition interval: {interval}")
+        self.db = db
+        self.tables = list(tables)
+        self.interval = interval
+        self.premake = premake
+        self._known: set[datetime] = set()
+        self._lock = threading.Lock()
+
+    def preload(self):
+        """
+        Fill the cache with the partitions already present in all tables.
+        """
+        starts = None
+        for table in self.tables:
+            table_starts = set(self.list_partitions(table))
+            starts = table_starts if starts is None else starts & table_starts
+        with self._lock:
+            self._known.update(starts or ())
+
+    def premake_partitions(self, now: datetime | None = None):
+        """
+        Create the partitions of the current interval and of the next `premake` intervals.
+
+        :param now: Reference time, the current time if omitted.
+        """
+        start = partition_start(now or datetime.now(timezone.utc), self.interval)
+        starts = [start]
+        for _ in range(self.premake):
+            starts.append(next_partition_start(starts[-1], self.interval))
+        self.ensure_partitions(starts)
+
+    def ensure_rows(self, data: list[dict], column: str):
+        """
+        Make sure the partitions receiving the rows exist.
+
+        :param data: A list of dictionaries or named tuples representing the rows.
+        :param column: Name of the partitioning column in the rows.
+        """
+        if isinstance(data[0], dict):
+            timestamps = {row[column] for row in data}
+        else:
+            position = data[0]._fields.index(column)
+            timestamps = {row[position] for row in data}
+        self.ensure_partitions({partition_start(timestamp, self.interval) for timestamp in timestamps})
+
+    def ensure_partitions(self, starts: Iterable[datetime]):
+        """
+        Create the partitions starting at the given bounds in all tables, unless they exist.
+
+        :param starts: Partition lower bounds, as returned by partition_start.
+        """
+        with self._lock:
+            missing = sorted(set(starts) - self._known)
+        if not missing:
+            return
+        for start in missing:
+            end = next_partition_start(start, self.interval)
+            with self.db.separate_transaction() as connection:
+                for table in self.tables:
+                    self._create_partition(connection, table, start, end)
+        self._add_known(missing)
+
+    def list_partitions(self, table: Table) -> list[datetime]:
+        """
+        List the partitions of a table created by the manager.
+
+        :param table: The partitioned table.
+        :return: The start of every partition, in ascending order.
+        """
+        query = text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+        ).bindparams(table=table.name)
+        pattern = re.compile(rf"{re.escape(table.name)}_p(\d+)")
+        starts = []
+        for name in self.db.execute(query).scalars():
+            match = pattern.fullmatch(name)
+            if match:
+                try:
+                    start = datetime.strptime(match.group(1), _NAME_FORMATS[self.interval])
+                except ValueError:
+                    continue
+                starts.append(start.replace(tzinfo=timezone.utc))
+        return sorted(starts)
+
+    def retire_partitions(self, before: datetime, drop: bool = False) -> list[str]:
+        """
+        Detach, and optionally drop, the partitions whose rows are all older than `before`.
+        Detached partitions remain as plain tables, e.g. to be archived.
+
+        :param before: Partitions ending at or before this time are retired.
+        :param drop: Whether to drop the detached partitions.
+        :return: Names of the retired partitions.
+        """
+        retired = []
+        for table in self.tables:
+            for start in self.list_partitions(table):
+                if next_partition_start(start, self.interval) > before:
+                    continue
+                name = partition_name(table, start, self.interval)
+                with self.db.transaction():
+                    self.db.execute(text(f'ALTER TABLE {_quote(table.name)} DETACH PARTITION {_quote(name)}'))
+                    if drop:
+                        self.db.execute(text(f'DROP TABLE {_quote(name)}'))
+                retired.append(name)
+                with self._lock:
+                    self._known.discard(start)
+        if retired:
+            logger.info(f"{'Dropped' if drop else 'Detached'} partitions: {', '.join(retired)}")
+        return retired
+
+    def _create_partition(self, connection: Connection, table: Table, start: datetime, end: datetime):
+        name = partition_name(table, start, self.interval)
+        # Serialize creators of the same partition, IF NOT EXISTS alone does not guard against concurrent creation
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))").bindparams(name=name))
+        if connection.execute(text("SELECT to_regclass(:name)").bindparams(name=name)).scalar() is not None:
+            return
+        connection.execute(text(
+            f"CREATE TABLE {_quote(name)} (LIKE {_quote(table.name)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        ))
+        connection.execute(text(
+            f"ALTER TABLE {_quote(table.name)} ATTACH PARTITION {_quote(name)} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+
+    def _add_known(self, starts: list[datetime]):
+        with self._lock:
+            self._known.update(starts)
+        logger.info(f"Partitions ready: {', '.join(start.date().isoformat() for start in starts)}")
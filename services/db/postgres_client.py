@@ -1,25 +1,43 @@
-from sqlalchemy import create_engine, Column
+import threading
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Iterator, Sequence
+
+from sqlalchemy import create_engine, select, tuple_, Column, Row, Table
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy_utils import database_exists, create_database, drop_database
 
 from models import Base
+from services.db.bulk import VALUES, get_bulk_writer, reserve_ids_statement, with_ids
+from services.metrics import STAGE_SECONDS
+
+# Number of rows fetched per round-trip by the streaming reads
+DEFAULT_CHUNK_SIZE = 10_000
 
 
 class PostgresDB:
-    def __init__(self, connection_details: dict):
+    def __init__(self, connection_details: dict, **engine_options):
         """
         Initialize the PostgresDB instance with the provided connection details.
 
         :param connection_details: A dictionary containing connection details for the database.
+        :param engine_options: Optional keyword arguments for create_engine (e.g. pool_size).
         """
         connection_string = _generate_connection_string(connection_details=connection_details)
         try:
-            self._engine = create_engine(connection_string)
+            self._engine = create_engine(connection_string, **engine_options)
             session_factory = sessionmaker(bind=self._engine)
             self._session = scoped_session(session_factory=session_factory)
         except SQLAlchemyError as e:
             raise e
+        # Per-thread transaction nesting depth, after-commit callbacks and rows written at commit,
+        # sessions are thread-local as well
+        self._local = threading.local()
+        # Optional PartitionManager creating the partitions of models with a `partition_column` on insert
+        self.partitions = None
+        # State kept by the models' hooks for this database, keyed by model, e.g. VehicleStatus.last_applied
+        self.model_state: dict = {}
 
     def __enter__(self):
         """
@@ -42,32 +60,191 @@ class PostgresDB:
         except SQLAlchemyError as e:
             raise SQLAlchemyError(f"Error initializing the database: {e}") from e
 
-    def insert(self, model: Base, data: list[dict]):
+    def insert(self, model: Base, data: list[dict], strategy: str | None = None):
         """
         Insert data into the specified model's table.
 
+        The rows are written with the model's `bulk_strategy` (see services.db.bulk) unless
+        another strategy is given, and committed immediately unless the call runs inside a
+        `transaction()` block. Models may define a `prepare_data(db, data)` hook filtering the rows
+        before they are written, and an `on_committed(db, data)` hook called with the written rows
+        once the transaction has been committed. Hooks keep their state in `model_state`.
+
+        Models with `preassign_ids` get the ids of their rows drawn from the table's sequence before
+        the write, and may define a `related_rows(data)` hook returning rows of other models, keyed
+        by model, which are written with the rows in the same transaction. Related models with
+        `write_at_commit` have their rows buffered until the end of the transaction, merged by
+        their `combine(rows)` hook and written once just before the commit, in table name order. Inside a
+        `transaction()` block, rows inserted into a model with `write_at_commit` are buffered the
+        same way, unless a strategy is given, and written with the model's hooks. For models with a
+        `partition_column`, missing partitions are created first when `partitions` is set.
+
+        Rows may be named tuples (see models.row_types) instead of dictionaries. COPY writers
+        consume them as they are, they are converted to dictionaries for models with hooks and
+        for the VALUES strategy.
+
         :param model: The SQLAlchemy model to insert data into.
-        :param data: A list of dictionaries representing the data to be inserted.
+        :param data: A list of dictionaries or named tuples representing the data to be inserted.
+        :param strategy: Optional name of the bulk write strategy overriding the model's default.
         """
+        if not data:
+            return
+        if (
+                getattr(model, 'write_at_commit', False) and strategy is None and self.in_transaction
+                and not getattr(self._local, 'writing_deferred', False)
+        ):
+            if isinstance(data[0], tuple):
+                data = [row._asdict() for row in data]
+            self._local.deferred.setdefault(model, []).extend(data)
+            return
+        strategy = strategy or getattr(model, 'bulk_strategy', VALUES)
+        prepare_data = getattr(model, 'prepare_data', None)
+        on_committed = getattr(model, 'on_committed', None)
+        if isinstance(data[0], tuple) and (prepare_data or on_committed or strategy == VALUES):
+            data = [row._asdict() for row in data]
+        if prepare_data:
+            data = prepare_data(self, data)
+        if not data:
+            return
+        writer = get_bulk_writer(strategy)
+        related_rows = getattr(model, 'related_rows', None)
+        partition_column = getattr(model, 'partition_column', None)
         try:
-            model.insert_data(self, data)
+            # The rows and their related rows are committed together
+            with self.transaction(), STAGE_SECONDS.time(stage='write'):
+                if self.partitions and partition_column:
+                    self.partitions.ensure_rows(data, partition_column)
+                if getattr(model, 'preassign_ids', False):
+                    ids = self.session.execute(reserve_ids_statement(model.__table__, len(data))).scalars().all()
+                    data = with_ids(data, ids)
+                writer.write(self, model, data)
+                for related_model, rows in (related_rows(data) if related_rows else {}).items():
+                    if rows and getattr(related_model, 'write_at_commit', False):
+                        self._local.deferred.setdefault(related_model, []).extend(rows)
+                    elif rows:
+                        related_writer = get_bulk_writer(getattr(related_model, 'bulk_strategy', VALUES))
+                        related_writer.write(self, related_model, rows)
+                if on_committed:
+                    self.after_commit(partial(on_committed, self, data))
         except SQLAlchemyError as e:
-            self.session.rollback()
+            self._rollback()
             raise SQLAlchemyError(f"Error inserting data: {e}") from e
 
+    @contextmanager
+    def cursor(self):
+        """
+        Get a raw DBAPI cursor bound to the current session transaction, e.g. for COPY.
+        Database errors raised by the driver are re-raised as SQLAlchemyError.
+        """
+        cursor = self.session.connection().connection.cursor()
+        try:
+            yield cursor
+        except self._engine.dialect.loaded_dbapi.Error as e:
+            raise SQLAlchemyError(f"Error executing bulk operation: {e}") from e
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group several operations into a single transaction. Statements executed inside
+        the block are committed together when it exits, or rolled back if it raises.
+        Nested blocks join the outermost transaction.
+        """
+        depth = self._transaction_depth
+        self._local.depth = depth + 1
+        if depth == 0:
+            self._local.deferred = {}
+        try:
+            yield self
+            if depth == 0:
+                self._write_deferred()
+                self._commit()
+        except Exception:
+            if depth == 0:
+                self._rollback()
+            raise
+        finally:
+            self._local.depth = depth
+
+    @contextmanager
+    def separate_transaction(self):
+        """
+        Run statements in a short transaction on a connection of its own, committed when the
+        block exits whether or not the current thread is inside a `transaction()` block, so its
+        locks are not held until a long transaction commits.
+
+        :return: The connection, whose `execute` runs the statements.
+        """
+        try:
+            with self._engine.begin() as connection:
+                yield connection
+        except SQLAlchemyError as e:
+            raise SQLAlchemyError(f"Error executing query: {e}") from e
+
+    def after_commit(self, callback: Callable[[], None]):
+        """
+        Register a callback to run once the current thread's transaction is committed.
+        Callbacks are discarded if the transaction is rolled back.
+
+        :param callback: Callable taking no arguments.
+        """
+        if not hasattr(self._local, 'after_commit'):
+            self._local.after_commit = []
+        self._local.after_commit.append(callback)
+
+    def _commit(self):
+        with STAGE_SECONDS.time(stage='commit'):
+            self.session.commit()
+        callbacks = getattr(self._local, 'after_commit', None)
+        self._local.after_commit = []
+        for callback in callbacks or ():
+            callback()
+
+    def _write_deferred(self):
+        deferred = self._local.deferred
+        self._local.deferred = {}
+        self._local.writing_deferred = True
+        try:
+            # In table name order, so concurrent transactions lock the deferred tables in the same order
+            for model, rows in sorted(deferred.items(), key=lambda item: item[0].__tablename__):
+                combine = getattr(model, 'combine', None)
+                self.insert(model=model, data=combine(rows) if combine else rows)
+        finally:
+            self._local.writing_deferred = False
+
+    def _rollback(self):
+        self._local.after_commit = []
+        self._local.deferred = {}
+        self.session.rollback()
+
+    @property
+    def in_transaction(self) -> bool:
+        """
+        Whether the current thread is inside a `transaction()` block.
+        """
+        return self._transaction_depth > 0
+
+    @property
+    def _transaction_depth(self) -> int:
+        return getattr(self._local, 'depth', 0)
+
     def execute(self, query):
         """
-        Execute a SQL query.
+        Execute a SQL query. The query is committed immediately unless it runs inside a
+        `transaction()` block.
 
         :param query: The SQL query to execute
         :return: The result of the query
         """
         try:
-            result = self.session.execute(query)
-            self.session.commit()
+            with STAGE_SECONDS.time(stage='execute'):
+                result = self.session.execute(query)
+            if not self.in_transaction:
+                self._commit()
             return result
         except SQLAlchemyError as e:
-            self.session.rollback()
+            self._rollback()
             raise SQLAlchemyError(f"Error executing query: {e}") from e
 
     def select(self, model: Base, columns: list = None, distinct_column: Column = None, **kwargs):
@@ -90,6 +267,88 @@ class PostgresDB:
 
         return query.all()
 
+    def stream(
+            self,
+            model: Base | Table,
+            columns: list[str] | None = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            **kwargs
+    ) -> Iterator[list[Row]]:
+        """
+        Stream the records of a table through a server-side cursor, in chunks of column tuples,
+        so memory usage does not depend on the size of the result.
+
+        The query runs on a dedicated connection, held in a single read transaction until the
+        iterator is exhausted or closed. For long exports prefer `iter_keyset`, which does not
+        keep a transaction open.
+
+        :param model: The SQLAlchemy model or table to select records from.
+        :param columns: Names of the columns to retrieve, all columns if omitted.
+        :param chunk_size: Number of rows fetched per round-trip and yielded per chunk.
+        :param kwargs: Optional keyword arguments for filtering records.
+        :return: Iterator over lists of rows.
+        """
+        query = _select_columns(model, columns).filter_by(**kwargs)
+        try:
+            with self._engine.connect() as connection:
+                result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+                for partition in result.partitions():
+                    yield partition
+        except SQLAlchemyError as e:
+            raise SQLAlchemyError(f"Error streaming query: {e}") from e
+
+    def iter_keyset(
+            self,
+            model: Base | Table,
+            key_columns: Sequence[str] = ('detection_time', 'id'),
+            columns: list[str] | None = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            after: tuple | None = None,
+            **kwargs
+    ) -> Iterator[list[Row]]:
+        """
+        Page through the records of a table in key order with keyset pagination: every page is a
+        short query for the rows following the last key of the previous page, so exports of any
+        size run with constant memory and without a long-running transaction, and can be resumed
+        from the last key seen. Rows with a NULL key are skipped.
+
+        :param model: The SQLAlchemy model or table to select records from.
+        :param key_columns: Names of the columns forming a unique key, backed by an index in this order.
+        :param columns: Names of the columns to retrieve, all columns if omitted. Key columns
+            missing from the list are added at the end.
+        :param chunk_size: Number of rows per page.
+        :param after: Key of the last row already read, to resume an export.
+        :param kwargs: Optional keyword arguments for filtering records.
+        :return: Iterator over lists of rows.
+        """
+        if columns is not None:
+            columns = list(columns) + [name for name in key_columns if name not in columns]
+        query = _select_columns(model, columns).filter_by(**kwargs)
+        keys = [query.selected_columns[name] for name in key_columns]
+        query = query.where(*(key.is_not(None) for key in keys)).order_by(*keys).limit(chunk_size)
+        while True:
+            page_query = query.where(tuple_(*keys) > tuple_(*after)) if after is not None else query
+            page = self.execute(page_query).all()
+            if not page:
+                return
+            yield page
+            if len(page) < chunk_size:
+                return
+            after = tuple(page[-1]._mapping[key] for key in keys)
+
+    def pool_stats(self) -> dict:
+        """
+        Get the state of the connection pool.
+
+        :return: A dictionary with the pool size, and the checked out and overflow connections.
+        """
+        pool = self._engine.pool
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
+
     @property
     def session(self):
         """
@@ -97,6 +356,12 @@ class PostgresDB:
         """
         return self._session()
 
+    def remove_session(self):
+        """
+        Close and discard the current thread's session, returning its connection to the pool.
+        """
+        self._session.remove()
+
     def close(self):
         """
         Close the database session and dispose of the engine.
@@ -127,6 +392,14 @@ class PostgresDB:
             drop_database(connection_string)
 
 
+def _select_columns(model: Base | Table, columns: list[str] | None = None):
+    """
+    Build a Core SELECT of the given columns, or of all columns, of a model's table.
+    """
+    table = getattr(model, '__table__', model)
+    return select(*[table.c[name] for name in columns]) if columns else select(table)
+
+
 def _generate_connection_string(connection_details: dict) -> str:
     """
     Generate the connection string for the PostgreSQL database.
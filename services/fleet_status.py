@@ -0,0 +1,199 @@
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, NamedTuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from models.db_models import VehicleStatus
+from services.db.postgres_client import PostgresDB
+from logger_config import get_logger
+
+DEFAULT_STATUS_HOST = '127.0.0.1'
+DEFAULT_STATUS_PORT = 9109
+# Rows fetched per round-trip when warming the index
+WARM_CHUNK_SIZE = 10_000
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+class VehicleState(NamedTuple):
+    """
+    Latest status of a vehicle.
+
+    Attributes:
+        vehicle_id (str): The ID of the vehicle.
+        report_time (datetime): The timestamp when the status was reported.
+        status (str): The status of the vehicle (e.g., driving, parking).
+    """
+    vehicle_id: str
+    report_time: datetime | None
+    status: str | None
+
+    def as_json(self) -> dict:
+        return {
+            'vehicle_id': self.vehicle_id,
+            'report_time': self.report_time.isoformat() if self.report_time else None,
+            'status': self.status,
+        }
+
+
+class FleetStatusIndex:
+    """
+    Thread-safe in-memory copy of the vehicle_status table: the latest status per vehicle, and
+    the vehicles per status.
+
+    The index is warmed from the table at startup and then updated with the statuses committed by
+    this process (see VehicleStatus.on_committed), newest-wins like the table itself. Statuses
+    written by other processes, e.g. merged by main_backfill.py, are only picked up when the index
+    is warmed again, which main.py does every STATUS_REFRESH_INTERVAL.
+    """
+
+    def __init__(self):
+        self._latest: dict[str, VehicleState] = {}
+        self._by_status: dict[str | None, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._latest)
+
+    def warm(self, db: PostgresDB, chunk_size: int = WARM_CHUNK_SIZE) -> int:
+        """
+        Load the statuses stored in the vehicle_status table. Calling it again applies the statuses
+        written since by other processes, newest-wins, while the index keeps serving queries.
+
+        :param db: Instance of PostgresDB to read the table from.
+        :param chunk_size: Number of rows fetched per round-trip.
+        :return: Number of vehicles in the index.
+        """
+        for chunk in db.stream(model=VehicleStatus, columns=list(VehicleState._fields), chunk_size=chunk_size):
+            self.update(VehicleState(*row) for row in chunk)
+        logger.info(f"Fleet status index warmed with {len(self)} vehicles")
+        return len(self)
+
+    def update(self, rows: Iterable):
+        """
+        Apply statuses, keeping the one with the latest report_time per vehicle.
+
+        :param rows: Dictionaries or named tuples with vehicle_id, report_time and status.
+        """
+        with self._lock:
+            for row in rows:
+                if isinstance(row, dict):
+                    state = VehicleState(row['vehicle_id'], row['report_time'], row['status'])
+                else:
+                    state = VehicleState(*row)
+                current = self._latest.get(state.vehicle_id)
+                if current is not None:
+                    if current.report_time is not None and (
+                            state.report_time is None or state.report_time <= current.report_time
+                    ):
+                        continue
+                    vehicles = self._by_status[current.status]
+                    vehicles.discard(state.vehicle_id)
+                    if not vehicles:
+                        del self._by_status[current.status]
+                self._latest[state.vehicle_id] = state
+                self._by_status.setdefault(state.status, set()).add(state.vehicle_id)
+
+    def get(self, vehicle_id: str) -> VehicleState | None:
+        """
+        Get the latest status of a vehicle.
+
+        :param vehicle_id: The ID of the vehicle.
+        :return: Its status, or None if the vehicle is unknown.
+        """
+        return self._latest.get(vehicle_id)
+
+    def with_status(self, status: str) -> list[VehicleState]:
+        """
+        Get the vehicles whose latest status is the given one.
+
+        :param status: The status, e.g. accident.
+        :return: The states of the vehicles, in no particular order.
+        """
+        with self._lock:
+            return [self._latest[vehicle_id] for vehicle_id in self._by_status.get(status, ())]
+
+    def status_counts(self) -> dict[str | None, int]:
+        """
+        :return: The number of vehicles per latest status.
+        """
+        with self._lock:
+            return {status: len(vehicles) for status, vehicles in self._by_status.items()}
+
+
+class FleetStatusServer:
+    """
+    Local HTTP server answering fleet status queries from a FleetStatusIndex, on a daemon thread:
+
+    - GET /vehicles/<vehicle_id>: the latest status of a vehicle, 404 if unknown.
+    - GET /vehicles?status=<status>: the vehicles whose latest status is the given one.
+    - GET /statuses: the number of vehicles per status.
+    """
+
+    def __init__(self, index: FleetStatusIndex, host: str = DEFAULT_STATUS_HOST, port: int = DEFAULT_STATUS_PORT):
+        """
+        :param index: The index to serve.
+        :param host: Interface to listen on, local only by default.
+        :param port: Port to listen on, 0 picks a free port.
+        """
+        self.index = index
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """
+        Start serving the index.
+        """
+        index = self.index
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path.startswith('/vehicles/'):
+                    state = index.get(unquote(url.path[len('/vehicles/'):]))
+                    if state is None:
+                        self.send_error(404)
+                        return
+                    self._send(state.as_json())
+                elif url.path == '/vehicles':
+                    statuses = parse_qs(url.query).get('status')
+                    if not statuses:
+                        self.send_error(400, "Missing status parameter")
+                        return
+                    self._send([state.as_json() for state in index.with_status(statuses[0])])
+                elif url.path == '/statuses':
+                    self._send(index.status_counts())
+                else:
+                    self.send_error(404)
+
+            def _send(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Polls are not worth a log line
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fleet-status-server", daemon=True)
+        self._thread.start()
+        logger.info(f"Serving fleet status on http://{self.host}:{self.port}/vehicles")
+
+    def stop(self):
+        """
+        Stop serving the index.
+        """
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
@@ -0,0 +1,395 @@
+import bisect
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from logger_config import get_logger
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+DEFAULT_METRICS_HOST = '127.0.0.1'
+DEFAULT_METRICS_PORT = 9108
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Outcomes of processed input files
+OUTCOME_LOADED = 'loaded'
+OUTCOME_SKIPPED = 'skipped'
+OUTCOME_FAILED = 'failed'
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+class _Metric(ABC):
+    """
+    Base class of the metrics: a family of values keyed by the values of its labels.
+    """
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labels):
+            raise ValueError(f"Metric {self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _format_labels(self, key: tuple, extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    @abstractmethod
+    def samples(self) -> dict:
+        """
+        :return: A snapshot of the values, keyed by the values of the labels.
+        """
+
+    @abstractmethod
+    def render(self) -> list[str]:
+        """
+        :return: The sample lines of the metric in the Prometheus text format.
+        """
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count, e.g. of processed files.
+    """
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Increase the counter.
+
+        :param amount: Amount added to the counter.
+        :param labels: Values of the counter's labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{self._format_labels(key)} {_number(value)}" for key, value in self.samples().items()]
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down, either set explicitly or read from a function when collected.
+    """
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+        self._functions: dict[tuple, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        """
+        Set the gauge.
+
+        :param value: The current value.
+        :param labels: Values of the gauge's labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """
+        Read the gauge from a function whenever the metrics are collected.
+
+        :param function: Callable taking no arguments and returning the current value.
+        :param labels: Values of the gauge's labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def samples(self) -> dict:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception as e:
+                logger.warning(f"Could not collect gauge {self.name}: {e}")
+        return values
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{self._format_labels(key)} {_number(value)}" for key, value in self.samples().items()]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, e.g. latencies, counted in cumulative buckets.
+    """
+    type_name = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label key: [count per bucket (the last one is +Inf), sum of the observed values]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        """
+        Record an observed value.
+
+        :param value: The observed value.
+        :param labels: Values of the histogram's labels.
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration in seconds of the block, also when it raises.
+
+        :param labels: Values of the histogram's labels.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> dict:
+        """
+        :return: Per label key, the observation count, sum and cumulative count per bucket upper bound.
+        """
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        samples = {}
+        for key, (counts, total) in values.items():
+            cumulative = []
+            running = 0
+            for count in counts:
+                running += count
+                cumulative.append(running)
+            samples[key] = {
+                'count': running,
+                'sum': total,
+                'buckets': dict(zip(self.buckets + (float('inf'),), cumulative)),
+            }
+        return samples
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, sample in self.samples().items():
+            for bound, count in sample['buckets'].items():
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                bucket_labels = self._format_labels(key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(sample['sum'])}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {sample['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics, rendered together in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        """
+        Get or create a counter.
+        """
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Gauge:
+        """
+        Get or create a gauge.
+        """
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            labels: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS
+    ) -> Histogram:
+        """
+        Get or create a histogram.
+        """
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def snapshot(self) -> dict:
+        """
+        Get the current value of every metric, e.g. for tests.
+
+        :return: Metric name -> label values tuple -> value (a dict of count, sum and buckets for histograms).
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.samples() for metric in metrics}
+
+    def counters(self) -> dict:
+        """
+        Get the current value of every counter, e.g. to report them from a worker process.
+
+        :return: Counter name -> label values tuple -> value.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.samples() for metric in metrics if isinstance(metric, Counter)}
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labels != metric.labels:
+                    raise ValueError(f"Metric {metric.name} is already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+
+class MetricsServer:
+    """
+    Local HTTP server exposing a registry on /metrics for Prometheus, on a daemon thread.
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str = DEFAULT_METRICS_HOST, port: int = DEFAULT_METRICS_PORT):
+        """
+        :param registry: The registry to expose.
+        :param host: Interface to listen on, local only by default.
+        :param port: Port to listen on, 0 picks a free port.
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """
+        Start serving the metrics.
+        """
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes are not worth a log line
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        """
+        Stop serving the metrics.
+        """
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Registry of the ingestion pipeline metrics
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'ingest_stage_seconds',
+    'Latency of the ingestion stages (read, parse_validate, spool, write, execute, commit)',
+    labels=('stage',)
+)
+FILES_TOTAL = REGISTRY.counter('ingest_files_total', 'Input files processed, by outcome', labels=('prefix', 'outcome'))
+ROWS_TOTAL = REGISTRY.counter('ingest_rows_total', 'Rows loaded from input files', labels=('prefix',))
+COMMIT_LAG_SECONDS = REGISTRY.histogram(
+    'ingest_event_to_commit_seconds',
+    "Time from an input file's last modification to the commit of its rows",
+    buckets=LAG_BUCKETS
+)
+
+
+def record_file(file_path: str, prefix: str | None, outcome: str, row_count: int = 0):
+    """
+    Count a processed input file. Loaded files also count their rows and their event-to-commit
+    lag, measured from the file's modification time, so this is called after the commit.
+
+    :param file_path: Path to the file.
+    :param prefix: Type of the file, see file_processing.handler.get_prefix.
+    :param outcome: One of OUTCOME_LOADED, OUTCOME_SKIPPED or OUTCOME_FAILED.
+    :param row_count: Number of rows loaded from the file.
+    """
+    FILES_TOTAL.inc(prefix=prefix, outcome=outcome)
+    if outcome != OUTCOME_LOADED:
+        return
+    ROWS_TOTAL.inc(row_count, prefix=prefix)
+    try:
+        COMMIT_LAG_SECONDS.observe(max(0.0, time.time() - os.path.getmtime(file_path)))
+    except OSError:
+        pass  # The file was moved away meanwhile
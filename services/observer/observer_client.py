@@ -1,33 +1,182 @@
+import os
+import threading
+from functools import partial
+
 from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver
 from services.db.postgres_client import PostgresDB
-from file_processing.handler import NewFileHandler
+from services.db.ledger import IngestionLedger
+from file_processing.handler import NewFileHandler, load_file
+from file_processing.worker_pool import IngestionWorkerPool, DEFAULT_NUM_WORKERS
+from file_processing.batcher import MicroBatcher
+from file_processing.retry import RetryScheduler
+from file_processing.spool import Spool
+from file_processing.claims import FileClaims
+from file_processing.parallel_parser import ParallelParser
+from services.observer.scanner import ScandirEmitter, backlog_order
 from logger_config import get_logger
 
 
+# Seconds between two passes of the polling scanner
+DEFAULT_POLL_INTERVAL = 1.0
+
 # Set up logging
 logger = get_logger(__name__)
 
 
-class DirectoryObserver(Observer):
-    def __init__(self, directory_path: str, db: PostgresDB):
-        super().__init__()
+def create_observer(polling: bool = False, poll_interval: float = DEFAULT_POLL_INTERVAL) -> BaseObserver:
+    """
+    Create the watchdog observer delivering the file events.
+
+    :param polling: Whether to poll with a ScandirEmitter instead of using inotify, e.g. on NFS or SMB mounts.
+    :param poll_interval: Seconds between two passes of the polling scanner.
+    :return: The observer, not started yet.
+    """
+    if polling:
+        return BaseObserver(emitter_class=ScandirEmitter, timeout=poll_interval)
+    return Observer()
+
+
+class DirectoryObserver:
+    """
+    Watch a directory with a watchdog observer and dispatch its new and existing files for loading.
+    """
+
+    def __init__(
+            self,
+            directory_path: str,
+            db: PostgresDB,
+            num_workers: int = DEFAULT_NUM_WORKERS,
+            max_queue_size: int | None = None,
+            batcher: MicroBatcher | None = None,
+            ledger: IngestionLedger | None = None,
+            retry: RetryScheduler | None = None,
+            spool: Spool | None = None,
+            file_claims: FileClaims | None = None,
+            polling: bool = False,
+            recursive: bool = False,
+            poll_interval: float = DEFAULT_POLL_INTERVAL,
+            parser: ParallelParser | None = None
+    ):
+        """
+        :param directory_path: Directory to monitor.
+        :param db: Instance of PostgresDB to handle database operations.
+        :param num_workers: Number of ingestion workers, 0 loads files on the observer thread.
+        :param max_queue_size: Maximum number of files waiting for a worker.
+        :param batcher: Optional MicroBatcher coalescing small files into shared transactions.
+        :param ledger: Optional IngestionLedger making loads idempotent.
+        :param retry: Optional RetryScheduler retrying or quarantining failed files.
+        :param spool: Optional Spool buffering validated rows on disk, drained by a SpoolDrainer.
+        :param file_claims: Optional FileClaims sharing the directory with other worker processes.
+        :param polling: Whether to poll the directory with a ScandirEmitter instead of using inotify,
+                        e.g. on NFS or SMB mounts.
+        :param recursive: Whether to also watch the subdirectories, e.g. date-partitioned ones.
+        :param poll_interval: Seconds between two passes of the polling scanner.
+        :param parser: Optional ParallelParser parsing large files on several cores, started by the caller.
+        """
+        self.observer = create_observer(polling=polling, poll_interval=poll_interval)
         self.directory_path = directory_path
+        self.polling = polling
+        self.recursive = recursive
         self.db = db
+        self.batcher = batcher
+        self.retry = retry
+        self.file_claims = file_claims
+        self._process = partial(
+            load_file, batcher=batcher, ledger=ledger, retry=retry, spool=spool, parser=parser
+        )
+        self.pool = IngestionWorkerPool(
+            db=db,
+            process=self._process,
+            num_workers=num_workers,
+            max_queue_size=max_queue_size
+        ) if num_workers else None
+        self.event_handler = NewFileHandler(
+            db=self.db, pool=self.pool, batcher=self.batcher, ledger=ledger, retry=retry, spool=spool,
+            file_claims=file_claims, parser=parser
+        )
+        self._backlog_thread = None
+        self._backlog_stop = threading.Event()
 
-    def start_observer(self):
+    def start_observer(self, scan_backlog: bool = True):
         """
         Start the observer to monitor the specified directory for new files.
+
+        :param scan_backlog: Whether to also load the files already in the directory, see `scan_backlog`.
         """
-        event_handler = NewFileHandler(db=self.db)
-        self.schedule(event_handler, self.directory_path, recursive=False)
-        self.start()
+        if self.batcher:
+            self.batcher.start()
+        if self.retry:
+            self.retry.start(process=self._process)
+        if self.pool:
+            self.pool.start()
+        if self.file_claims:
+            self.file_claims.start(on_recovered=self.event_handler.submit_file)
+        self.observer.schedule(self.event_handler, self.directory_path, recursive=self.recursive)
+        self.observer.start()
         logger.info(f"Started monitoring directory: {self.directory_path}")
+        if scan_backlog:
+            # Scan after watching has started so that no file falls between the two
+            self._backlog_stop.clear()
+            self._backlog_thread = threading.Thread(target=self.scan_backlog, name="backlog-scan", daemon=True)
+            self._backlog_thread.start()
+
+    def scan_backlog(self):
+        """
+        Dispatch the files already present in the directory, e.g. files that arrived while the
+        service was down, oldest first according to the timestamp in their names, including the
+        files of the subdirectories when watching recursively. The files are
+        loaded by the worker pool alongside live events, and files also reported by an event
+        are dispatched only once. In polling mode, the first pass of the scanner does this.
+        """
+        if self.file_claims:
+            # Resume the files this worker claimed before a restart
+            for file_path in self.file_claims.claimed_files():
+                self.event_handler.submit_file(file_path=file_path)
+        if self.polling:
+            return  # The scanner's first pass dispatches the existing files
+        file_paths = _list_files(self.directory_path, recursive=self.recursive)
+        file_paths.sort(key=lambda file_path: (backlog_order(os.path.basename(file_path)), file_path))
+        logger.info(f"Found {len(file_paths)} existing files in {self.directory_path}")
+        for file_path in file_paths:
+            if self._backlog_stop.is_set():
+                logger.info("Backlog scan interrupted.")
+                return
+            self.event_handler.submit_file(file_path=file_path)
+        logger.info(f"Dispatched backlog of {len(file_paths)} files from {self.directory_path}")
 
     def stop_observer(self):
         """
         Stop the observer.
         """
-        self.stop()
+        self._backlog_stop.set()
+        if self._backlog_thread:
+            self._backlog_thread.join()
+            self._backlog_thread = None
+        self.observer.stop()
         logger.info("Observer stopped by user.")
-        self.join()
+        self.observer.join()
         logger.info("Observer thread has finished.")
+        if self.file_claims:
+            self.file_claims.stop()
+        if self.pool:
+            self.pool.stop()
+        if self.batcher:
+            self.batcher.stop()
+        if self.retry:
+            self.retry.stop()
+
+
+def _list_files(directory: str, recursive: bool) -> list[str]:
+    """
+    List the paths of the files of a directory, and of its subdirectories if `recursive`,
+    skipping the subdirectories whose names start with a dot as the polling scanner does.
+    """
+    file_paths = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file():
+                file_paths.append(entry.path)
+            elif recursive and entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'):
+                file_paths.extend(_list_files(entry.path, recursive=True))
+    return file_paths
@@ -0,0 +1,151 @@
+import os
+import time
+from datetime import datetime
+
+from watchdog.events import FileCreatedEvent
+from watchdog.observers.api import EventEmitter, DEFAULT_EMITTER_TIMEOUT
+
+from file_processing.handler import get_file_timestamp
+from logger_config import get_logger
+
+# Files modified within this many seconds are only dispatched once their size and mtime stop changing
+DEFAULT_SETTLE_TIME = 2.0
+# A directory listing is only trusted for the next pass if the directory was last modified this many
+# seconds before the listing, since a file added within the mtime granularity would not change the mtime
+MTIME_SLACK = 2.0
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+class ScandirEmitter(EventEmitter):
+    """
+    Watchdog emitter polling a directory tree with os.scandir, for filesystems without inotify
+    (NFS, SMB) and for directories too large for watchdog's polling emitter, which stats every
+    file on every pass. Only FileCreatedEvent is emitted, for files not emitted before.
+
+    The cursor of a directory is its mtime at its last complete listing, since adding, removing
+    or renaming an entry changes it: an unchanged directory is not listed again, so old
+    date-partitioned subdirectories cost a single stat per pass. A changed directory is listed,
+    but only its files whose name and inode were not emitted before are stat'ed. A file is
+    emitted once it is settled: last modified more than `settle_time` seconds ago, or with the
+    same size and mtime as on the previous pass, so files still being written are not loaded
+    early. The first pass emits the files already present. Names starting with a dot are
+    ignored, e.g. uploaders' temporary files.
+    """
+
+    def __init__(
+            self,
+            event_queue,
+            watch,
+            timeout: float = DEFAULT_EMITTER_TIMEOUT,
+            event_filter=None,
+            settle_time: float = DEFAULT_SETTLE_TIME
+    ):
+        super().__init__(event_queue, watch, timeout, event_filter)
+        self.settle_time = settle_time
+        # Directory -> its mtime_ns at its last complete listing
+        self._cursors: dict[str, int] = {}
+        # Directory -> name -> inode of the files emitted so far
+        self._emitted: dict[str, dict[str, int]] = {}
+        # Directory -> its subdirectories at its last listing
+        self._subdirs: dict[str, list[str]] = {}
+        # Path -> (size, mtime_ns) of the files not settled yet
+        self._unsettled: dict[str, tuple[int, int]] = {}
+        self._next_unsettled: dict[str, tuple[int, int]] = {}
+        self._passes = 0
+
+    def queue_events(self, timeout: float):
+        # The timeout is the interval between passes, the first pass runs immediately
+        if self._passes and self.stopped_event.wait(timeout):
+            return
+        started = time.monotonic()
+        emitted = self.scan()
+        self._passes += 1
+        if emitted:
+            logger.info(f"Scan of {self.watch.path} found {emitted} new files in {time.monotonic() - started:.3f}s")
+
+    def scan(self) -> int:
+        """
+        Emit the new settled files of the watched tree.
+
+        :return: Number of files emitted.
+        """
+        now = time.time()
+        self._next_unsettled = {}
+        visited = set()
+        emitted = 0
+        pending = [self.watch.path]
+        while pending and self.should_keep_running():
+            directory = pending.pop()
+            visited.add(directory)
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if self._cursors.get(directory) != mtime_ns:
+                emitted += self._scan_directory(directory=directory, mtime_ns=mtime_ns, now=now)
+            if self.watch.is_recursive:
+                pending.extend(self._subdirs.get(directory, ()))
+        self._unsettled = self._next_unsettled
+        # Forget the directories that disappeared
+        for cache in (self._cursors, self._emitted, self._subdirs):
+            for directory in cache.keys() - visited:
+                del cache[directory]
+        return emitted
+
+    def _scan_directory(self, directory: str, mtime_ns: int, now: float) -> int:
+        emitted = self._emitted.get(directory, {})
+        present = {}
+        subdirs = []
+        new_files = []
+        settled = True
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                    inode = entry.inode()
+                    if emitted.get(entry.name) == inode:
+                        present[entry.name] = inode
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    if not self._is_settled(path=entry.path, stat=stat, now=now):
+                        settled = False
+                        continue
+                    present[entry.name] = inode
+                    new_files.append(entry.name)
+        except FileNotFoundError:
+            return 0
+        self._emitted[directory] = present
+        self._subdirs[directory] = subdirs
+        if settled and mtime_ns < (now - MTIME_SLACK) * 1e9:
+            self._cursors[directory] = mtime_ns
+        else:
+            self._cursors.pop(directory, None)  # List it again on the next pass
+        new_files.sort(key=backlog_order)
+        for file_name in new_files:
+            self.queue_event(FileCreatedEvent(os.path.join(directory, file_name)))
+        return len(new_files)
+
+    def _is_settled(self, path: str, stat: os.stat_result, now: float) -> bool:
+        observed = (stat.st_size, stat.st_mtime_ns)
+        if stat.st_mtime < now - self.settle_time or self._unsettled.get(path) == observed:
+            return True
+        self._next_unsettled[path] = observed
+        return False
+
+
+def backlog_order(file_name: str) -> tuple:
+    """
+    Sort key ordering files by the timestamp in their names, files without one last.
+    """
+    return get_file_timestamp(file_name) or datetime.max, file_name
@@ -0,0 +1,167 @@
+import multiprocessing
+import queue
+import signal
+import time
+from typing import Callable
+
+from logger_config import get_logger
+
+# Seconds before a worker that exited unexpectedly is restarted
+DEFAULT_RESTART_DELAY = 5.0
+# Seconds a worker is given to finish its files once asked to stop, before it is terminated
+DEFAULT_STOP_TIMEOUT = 60.0
+
+# Set up logging
+logger = get_logger(__name__)
+
+
+class WorkerSupervisor:
+    """
+    Run a fixed number of worker processes, restart the ones that exit unexpectedly, and collect
+    the exit status and counters of every worker.
+
+    Workers are started with the `spawn` method and run target(index, stop, results): `stop` is
+    a multiprocessing Event set when the workers should finish, and a worker reports its
+    counters by putting (index, counters) on the `results` queue before it exits, counters being
+    a dictionary of counter name -> label values tuple -> value (see MetricsRegistry.counters).
+    """
+
+    def __init__(
+            self,
+            target: Callable,
+            num_processes: int,
+            restart_delay: float = DEFAULT_RESTART_DELAY,
+            stop_timeout: float = DEFAULT_STOP_TIMEOUT
+    ):
+        """
+        :param target: Module-level function run by every worker process.
+        :param num_processes: Number of worker processes.
+        :param restart_delay: Seconds before a worker that exited unexpectedly is restarted.
+        :param stop_timeout: Seconds a worker is given to finish once asked to stop.
+        """
+        if num_processes < 1:
+            raise ValueError("num_processes must be at least 1")
+        self.target = target
+        self.num_processes = num_processes
+        self.restart_delay = restart_delay
+        self.stop_timeout = stop_timeout
+        self._context = multiprocessing.get_context('spawn')
+        self._stop = self._context.Event()
+        self._results = self._context.Queue()
+        self._processes: dict[int, multiprocessing.Process] = {}
+        self._restart_at: dict[int, float] = {}
+        self.exit_codes: dict[int, list[int]] = {}
+        self.counters: dict[int, dict] = {}
+
+    def start(self):
+        """
+        Start the worker processes.
+        """
+        self._stop.clear()
+        for index in range(self.num_processes):
+            self._start_worker(index)
+        logger.info(f"Started {self.num_processes} worker processes")
+
+    def run(self):
+        """
+        Start the workers and supervise them until interrupted (SIGINT or SIGTERM), then stop them.
+
+        :return: The counters of all workers summed, see `totals`.
+        """
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+        self.start()
+        try:
+            while True:
+                self.poll(timeout=1)
+        except KeyboardInterrupt:
+            logger.info("Stopping worker processes")
+        return self.stop()
+
+    def poll(self, timeout: float = 0):
+        """
+        Collect reported counters, and restart workers that exited.
+
+        :param timeout: Seconds to wait for a report.
+        """
+        self._collect(timeout=timeout)
+        now = time.monotonic()
+        for index, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            if index not in self._restart_at:
+                self._record_exit(index, process)
+                logger.error(f"Worker {index} exited with code {process.exitcode}, restarting it")
+                self._restart_at[index] = now + self.restart_delay
+            elif now >= self._restart_at[index]:
+                del self._restart_at[index]
+                self._start_worker(index)
+
+    def stop(self) -> dict:
+        """
+        Ask the workers to finish, wait for them, and terminate the ones that do not stop in time.
+
+        :return: The counters of all workers summed, see `totals`.
+        """
+        self._stop.set()
+        deadline = time.monotonic() + self.stop_timeout
+        alive = [index for index, process in self._processes.items() if index not in self._restart_at]
+        # Keep reading the queue while waiting, a worker exits only once its report is consumed
+        while alive and time.monotonic() < deadline:
+            self._collect(timeout=0.2)
+            alive = [index for index in alive if self._processes[index].is_alive()]
+        for index in alive:
+            logger.warning(f"Worker {index} did not stop within {self.stop_timeout}s, terminating it")
+            self._processes[index].terminate()
+        for index, process in self._processes.items():
+            process.join()
+            if index not in self._restart_at:
+                self._record_exit(index, process)
+        self._collect(timeout=0)
+        for index in sorted(self.exit_codes):
+            logger.info(f"Worker {index} exit codes: {self.exit_codes[index]}")
+        totals = self.totals()
+        logger.info(f"Worker totals: {totals}")
+        return totals
+
+    def totals(self) -> dict:
+        """
+        Sum the counters reported by the workers.
+
+        :return: Counter name -> label values tuple -> value.
+        """
+        totals = {}
+        for counters in self.counters.values():
+            for name, samples in counters.items():
+                metric_totals = totals.setdefault(name, {})
+                for key, value in samples.items():
+                    metric_totals[key] = metric_totals.get(key, 0) + value
+        return totals
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(
+            target=self.target, args=(index, self._stop, self._results), name=f"ingest-worker-{index}"
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _record_exit(self, index: int, process: multiprocessing.Process):
+        self.exit_codes.setdefault(index, []).append(process.exitcode)
+
+    def _collect(self, timeout: float):
+        while True:
+            try:
+                index, counters = self._results.get(timeout=timeout)
+            except queue.Empty:
+                return
+            # Counters of a restarted worker start over, keep the sum of its runs
+            previous = self.counters.get(index, {})
+            for name, samples in counters.items():
+                merged = previous.setdefault(name, {})
+                for key, value in samples.items():
+                    merged[key] = merged.get(key, 0) + value
+            self.counters[index] = previous
+            timeout = 0
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
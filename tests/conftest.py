@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import select, func
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from services.db.postgres_client import PostgresDB
+from tests.helpers import TEST_DB_CONFIG
+
+
+@pytest.fixture
+def db_config(request) -> dict:
+    """
+    Connection details of the scratch database of the test module, e.g. test_ledger_db for tests/test_ledger.py.
+    """
+    return {**TEST_DB_CONFIG, "database": f"{request.module.__name__.rpartition('.')[2]}_db"}
+
+
+@pytest.fixture
+def db_engine_options() -> dict:
+    """
+    Keyword arguments of the PostgresDB of the `db` fixture, overridden by modules needing e.g. a larger pool.
+    """
+    return {}
+
+
+@pytest.fixture
+def db(db_config: dict, db_engine_options: dict):
+    """
+    PostgresDB connected to a scratch database created and initialized for the test, and dropped after it.
+    """
+    PostgresDB.create_database(config=db_config)
+    try:
+        with PostgresDB(connection_details=db_config, **db_engine_options) as db:
+            db.initialize()
+            yield db
+    finally:
+        PostgresDB.drop_database(config=db_config)
+
+
+class FakeDB:
+    """
+    Stand-in for PostgresDB recording the rows committed per model. Inserts fail with a retryable database error
+    while `down` is set, and with the error returned by `fail(row)` for any row it returns one for.
+    """
+
+    def __init__(self, fail=None):
+        self.committed = {}
+        self.transactions = 0
+        self.removed_sessions = 0
+        self.down = False
+        self.fail = fail or (lambda row: None)
+        self._pending = None
+
+    @contextmanager
+    def transaction(self):
+        if self._pending is not None:
+            # Nested transactions join the outer one
+            yield self
+            return
+        self._pending = {}
+        try:
+            yield self
+            for model, rows in self._pending.items():
+                self.committed.setdefault(model, []).extend(rows)
+            self.transactions += 1
+        finally:
+            self._pending = None
+
+    def insert(self, model, data, **kwargs):
+        if self.down:
+            raise SQLAlchemyError("Error inserting data") from OperationalError("INSERT", {}, Exception("down"))
+        for row in data:
+            error = self.fail(row)
+            if error is not None:
+                raise error
+        with self.transaction():
+            self._pending.setdefault(model, []).extend(data)
+
+    def remove_session(self):
+        self.removed_sessions += 1
+
+
+class FakeRetry:
+    """
+    Stand-in for RetryScheduler recording the reported results.
+    """
+
+    def __init__(self):
+        self.results = []
+
+    def on_result(self, file_path: str, error: Exception | None):
+        self.results.append((file_path, error))
+
+
+def count_rows(db, model) -> int:
+    return db.execute(select(func.count()).select_from(model)).scalar()
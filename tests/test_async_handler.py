@@ -0,0 +1,98 @@
+import asyncio
+import json
+import os
+
+import pytest
+from sqlalchemy import select
+
+import main_async
+from models.db_models import ObjectsDetectionEvent, Detection, VehicleStatus
+from services.db.async_postgres_client import AsyncPostgresDB
+from file_processing.async_handler import async_load_file
+from tests.conftest import count_rows
+
+STATUSES = [
+    {"vehicle_id": f"v{index}", "report_time": "2024-07-21T14:30:00Z", "status": "driving"} for index in range(5)
+]
+EVENTS = [
+    {
+        "vehicle_id": f"v{index % 2}",
+        "detection_time": f"2024-07-21T14:{index:02d}:00Z",
+        "detections": [{"object_type": "car", "object_value": index}]
+    }
+    for index in range(5)
+]
+
+
+async def _load(file_path, db_config: dict):
+    async with AsyncPostgresDB(connection_details=db_config) as async_db:
+        await async_load_file(file_name=file_path.name, file_path=str(file_path), db=async_db, batch_size=2)
+
+
+@pytest.mark.parametrize("suffix", ["json", "ndjson"])
+def test_async_load_of_every_format(db, db_config, tmp_path, suffix):
+    if suffix == "ndjson":
+        status_content = "".join(json.dumps(item) + "\n" for item in STATUSES)
+        events_content = "".join(json.dumps(item) + "\n" for item in EVENTS)
+    else:
+        status_content = json.dumps({"vehicle_status": STATUSES})
+        events_content = json.dumps({"objects_detection_events": EVENTS})
+    status_path = tmp_path / f"vehicle_status_20240721T143000.{suffix}"
+    status_path.write_text(status_content)
+    events_path = tmp_path / f"objects_detection_20240721T143000.{suffix}"
+    events_path.write_text(events_content)
+
+    asyncio.run(_load(status_path, db_config))
+    asyncio.run(_load(events_path, db_config))
+
+    assert db.execute(select(VehicleStatus.vehicle_id).order_by(VehicleStatus.vehicle_id)).scalars().all() == [
+        item["vehicle_id"] for item in STATUSES
+    ]
+    assert count_rows(db, ObjectsDetectionEvent) == len(EVENTS)
+    assert count_rows(db, Detection) == len(EVENTS)
+
+
+class _FakeAsyncDB:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        pass
+
+    async def initialize(self):
+        pass
+
+
+def test_cancelled_main_loads_the_queued_files(tmp_path, monkeypatch):
+    loaded = []
+
+    async def consume_files(file_queue, db, max_in_flight):
+        while True:
+            file_path = await file_queue.get()
+            try:
+                await asyncio.sleep(0.05)
+                loaded.append(os.path.basename(file_path))
+            finally:
+                file_queue.task_done()
+
+    monkeypatch.setattr(main_async, 'AsyncPostgresDB', lambda **kwargs: _FakeAsyncDB())
+    monkeypatch.setattr(main_async, 'get_connection_details', lambda: {})
+    monkeypatch.setattr(main_async, 'consume_files', consume_files)
+    monkeypatch.setattr(main_async, 'DIRECTORY_TO_WATCH', str(tmp_path))
+    names = [f"vehicle_status_{index}.json" for index in range(5)]
+
+    async def run():
+        task = asyncio.create_task(main_async.main())
+        await asyncio.sleep(0.2)  # Let the observer start
+        for name in names:
+            (tmp_path / name).write_text("{}")
+        while not loaded:
+            await asyncio.sleep(0.01)
+        task.cancel()  # As asyncio.run does on Ctrl+C
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(task, timeout=10)
+
+    asyncio.run(run())
+
+    # Only the file in flight when the task was cancelled may be lost
+    assert set(loaded) <= set(names) and len(set(loaded)) >= len(names) - 1
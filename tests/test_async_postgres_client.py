@@ -0,0 +1,87 @@
+import asyncio
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, func
+from sqlalchemy.exc import SQLAlchemyError
+
+from models.db_models import ObjectsDetectionEvent, Detection, DetectionHourlyRollup, VehicleStatus
+from services.db.async_postgres_client import AsyncPostgresDB
+from tests.conftest import count_rows
+NOW = datetime(2024, 7, 21, 14, 30, tzinfo=timezone.utc)
+EVENTS = [
+    {
+        "vehicle_id": f'v"{index % 2}", é',
+        "detection_time": NOW + timedelta(minutes=index),
+        "detections": [{"object_type": "car", "object_value": value} for value in range(index)],
+    }
+    for index in range(4)
+]
+StatusRow = namedtuple('StatusRow', ['vehicle_id', 'report_time', 'status'])
+
+
+@pytest.fixture
+def run(db, db_config: dict):
+    """
+    Runs an async operation on an AsyncPostgresDB connected to the database of `db`.
+    """
+    def run(operation):
+        async def run_operation():
+            async with AsyncPostgresDB(connection_details=db_config) as async_db:
+                await operation(async_db)
+
+        asyncio.run(run_operation())
+
+    return run
+
+
+def test_copy_insert_writes_events_and_their_detections(db, run):
+    run(lambda async_db: async_db.insert(model=ObjectsDetectionEvent, data=EVENTS))
+
+    query = select(
+        ObjectsDetectionEvent.vehicle_id, ObjectsDetectionEvent.detection_time, ObjectsDetectionEvent.detections
+    ).order_by(ObjectsDetectionEvent.detection_time)
+    assert [row._asdict() for row in db.execute(query).all()] == EVENTS
+    detections = db.execute(
+        select(ObjectsDetectionEvent.detection_time, func.count(Detection.id))
+        .join(Detection, Detection.event_id == ObjectsDetectionEvent.id)
+        .group_by(ObjectsDetectionEvent.detection_time)
+        .order_by(ObjectsDetectionEvent.detection_time)
+    ).all()
+    assert [tuple(row) for row in detections] == [
+        (event["detection_time"], len(event["detections"])) for event in EVENTS[1:]
+    ]
+    assert db.execute(select(func.sum(DetectionHourlyRollup.detection_count))).scalar() == 6
+
+
+def test_statuses_are_written_at_commit_from_row_tuples(db, run):
+    async def insert(async_db):
+        async with async_db.transaction() as session:
+            for row in (StatusRow("a", NOW, "driving"), StatusRow("a", NOW - timedelta(minutes=1), "parking")):
+                await async_db.insert(model=VehicleStatus, data=[row], session=session)
+
+    run(insert)
+
+    assert [tuple(row) for row in db.execute(select(VehicleStatus.vehicle_id, VehicleStatus.status)).all()] == [
+        ("a", "driving")
+    ]
+
+
+def test_rolled_back_transaction_writes_nothing(db, run):
+    async def insert(async_db):
+        async with async_db.transaction() as session:
+            await async_db.insert(model=ObjectsDetectionEvent, data=EVENTS, session=session)
+            raise RuntimeError("rolled back")
+
+    with pytest.raises(RuntimeError):
+        run(insert)
+
+    assert count_rows(db, ObjectsDetectionEvent) == 0 and count_rows(db, Detection) == 0
+
+
+def test_database_errors_are_raised_as_sqlalchemy_errors(db, run):
+    rows = [{"event_id": 1, "vehicle_id": "a", "detection_time": NOW, "object_type": None, "object_value": 1}]
+
+    with pytest.raises(SQLAlchemyError):
+        run(lambda async_db: async_db.insert(model=Detection, data=rows))
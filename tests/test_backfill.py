@@ -0,0 +1,112 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select, func, text
+
+from models.db_models import ObjectsDetectionEvent, Detection, DetectionHourlyRollup, VehicleStatus, IngestedFile
+from services.db.ledger import LOADED, FAILED
+import file_processing.backfill
+from file_processing.backfill import Backfill, BACKFILL_FILES, find_input_files
+from tests.conftest import count_rows
+
+FILE_COUNT = 4
+EVENTS_PER_FILE = 30
+
+
+@pytest.fixture
+def archive(tmp_path):
+    for index in range(FILE_COUNT):
+        events = [
+            {
+                "vehicle_id": f"v{n % 3}",
+                "detection_time": f"2024-07-{20 + index}T1{n % 2}:{n:02d}:00Z",
+                "detections": [{"object_type": "car", "object_value": n}, {"object_type": "person", "object_value": 1}]
+            }
+            for n in range(EVENTS_PER_FILE)
+        ]
+        statuses = [
+            {"vehicle_id": f"v{n}", "report_time": f"2024-07-{20 + index}T12:00:00Z", "status": f"status {index}"}
+            for n in range(3)
+        ]
+        (tmp_path / f"objects_detection_202407{20 + index}T120000.json").write_text(
+            json.dumps({"objects_detection_events": events})
+        )
+        # Newest files first in the listing, the backfill orders them by timestamp
+        (tmp_path / f"vehicle_status_202407{23 - index}T120000.json").write_text(
+            json.dumps({"vehicle_status": statuses})
+        )
+    (tmp_path / "vehicle_status_20240730T120000.json").write_text('{"vehicle_status": [{"vehicle_id": ')
+    return tmp_path
+
+
+def test_backfill_merges_staged_files(db, archive):
+    summary = Backfill(db=db, merge_batch_rows=50, progress_interval=0).run(find_input_files([str(archive)]))
+
+    assert summary['stage']['files'] == 2 * FILE_COUNT + 1 and summary['stage']['failed'] == 1
+    # Events files of 30 rows are merged in pairs, the small status files at once
+    assert summary['merge']['batches'] == FILE_COUNT // 2 + 1
+    assert count_rows(db, ObjectsDetectionEvent) == FILE_COUNT * EVENTS_PER_FILE
+    assert count_rows(db, Detection) == 2 * FILE_COUNT * EVENTS_PER_FILE
+    assert db.execute(
+        select(func.sum(DetectionHourlyRollup.detection_count)).where(DetectionHourlyRollup.object_type == 'car')
+    ).scalar() == FILE_COUNT * EVENTS_PER_FILE
+    # Detections reference their events
+    assert db.execute(text(
+        "SELECT count(*) FROM detections JOIN objects_detection_events ON objects_detection_events.id = event_id"
+    )).scalar() == 2 * FILE_COUNT * EVENTS_PER_FILE
+    # The file of the 23rd wins, although the status files are staged in separate batches
+    statuses = db.execute(select(VehicleStatus.status)).scalars().all()
+    assert statuses == [f"status {FILE_COUNT - 1}"] * 3
+    ledger = dict(db.execute(select(IngestedFile.status, func.count()).group_by(IngestedFile.status)).all())
+    assert ledger == {LOADED: 2 * FILE_COUNT, FAILED: 1}
+    assert count_rows(db, BACKFILL_FILES) == 0
+
+
+def test_backfill_resumes_and_skips_loaded_files(db, archive):
+    files = find_input_files([str(archive)])
+    backfill = Backfill(db=db, merge_batch_rows=50, progress_interval=0)
+    backfill.prepare()
+    # Interrupted after staging half of the files and merging nothing
+    backfill.stage_files(files[:FILE_COUNT])
+
+    summary = backfill.run(files)
+    again = backfill.run(files)
+
+    assert summary['stage']['skipped'] == FILE_COUNT
+    assert again['stage']['skipped'] == 2 * FILE_COUNT and again['merge']['batches'] == 0
+    assert count_rows(db, ObjectsDetectionEvent) == FILE_COUNT * EVENTS_PER_FILE
+    assert count_rows(db, Detection) == 2 * FILE_COUNT * EVENTS_PER_FILE
+
+
+def test_deferred_indexes_are_built_again(db, archive):
+    def indexes():
+        return set(db.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename IN ('objects_detection_events', 'detections')"
+        )).scalars())
+
+    before = indexes()
+    Backfill(db=db, defer_indexes=True, progress_interval=0).run(find_input_files([str(archive)]))
+
+    assert indexes() == before
+    assert count_rows(db, Detection) == 2 * FILE_COUNT * EVENTS_PER_FILE
+
+
+def test_deferred_indexes_of_partitioned_tables_are_valid(db, monkeypatch):
+    with db.transaction():
+        db.execute(text("CREATE TABLE readings (taken_at date NOT NULL, value int) PARTITION BY RANGE (taken_at)"))
+        db.execute(text(
+            "CREATE TABLE readings_p202407 PARTITION OF readings FOR VALUES FROM ('2024-07-01') TO ('2024-08-01')"
+        ))
+        db.execute(text("CREATE INDEX ix_readings_value ON readings (value)"))
+    monkeypatch.setattr(file_processing.backfill, 'INDEXED_MODELS', [SimpleNamespace(__tablename__='readings')])
+    backfill = Backfill(db=db, progress_interval=0)
+    backfill.prepare()
+
+    backfill.drop_secondary_indexes()
+    assert backfill.build_deferred_indexes() == 1
+
+    indexes = db.execute(text(
+        "SELECT indrelid::regclass::text, indisvalid FROM pg_index WHERE indrelid::regclass::text LIKE 'readings%'"
+    )).all()
+    assert sorted(indexes) == [("readings", True), ("readings_p202407", True)]
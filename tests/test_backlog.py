@@ -0,0 +1,73 @@
+import os
+from datetime import datetime
+
+from file_processing.handler import NewFileHandler, get_file_timestamp
+from services.observer.observer_client import DirectoryObserver
+
+
+class FakePool:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, file_name: str, file_path: str):
+        self.submitted.append(file_name)
+
+
+def test_get_file_timestamp():
+    assert get_file_timestamp("vehicle_status_20240721T143000.json") == datetime(2024, 7, 21, 14, 30)
+    assert get_file_timestamp("vehicle_status.json") is None
+    assert get_file_timestamp("vehicle_status_20241341T143000.json") is None
+
+
+def test_files_are_submitted_once(tmp_path):
+    file_path = tmp_path / "vehicle_status_20240721T143000.json"
+    file_path.write_text("{}")
+    handler = NewFileHandler(db=None, pool=FakePool())
+
+    handler.submit_file(str(file_path))
+    handler.submit_file(os.path.join(str(tmp_path), ".", file_path.name))
+    assert handler.pool.submitted == [file_path.name]
+
+    file_path.unlink()
+    (tmp_path / "other").write_text("{}")  # Keep the old inode in use
+    file_path.write_text("{}")
+    handler.submit_file(str(file_path))
+    assert handler.pool.submitted == [file_path.name] * 2
+
+
+def test_backlog_is_dispatched_oldest_first(tmp_path):
+    names = [
+        "vehicle_status_20240721T143000.json",
+        "objects_detection_20240720T090000.json",
+        "notes.txt",
+        "objects_detection_20240721T120000.json",
+    ]
+    for name in names:
+        (tmp_path / name).write_text("{}")
+    (tmp_path / "subdir").mkdir()
+    observer = DirectoryObserver(directory_path=str(tmp_path), db=None, num_workers=0)
+    observer.event_handler.pool = FakePool()
+
+    observer.scan_backlog()
+    assert observer.event_handler.pool.submitted == [
+        "objects_detection_20240720T090000.json",
+        "objects_detection_20240721T120000.json",
+        "vehicle_status_20240721T143000.json",
+        "notes.txt",
+    ]
+
+
+def test_recursive_backlog_includes_subdirectories(tmp_path):
+    (tmp_path / "2024-07-21").mkdir()
+    (tmp_path / ".hidden").mkdir()
+    (tmp_path / "2024-07-21" / "objects_detection_20240721T120000.json").write_text("{}")
+    (tmp_path / ".hidden" / "objects_detection_20240719T120000.json").write_text("{}")
+    (tmp_path / "vehicle_status_20240720T090000.json").write_text("{}")
+    observer = DirectoryObserver(directory_path=str(tmp_path), db=None, num_workers=0, recursive=True)
+    observer.event_handler.pool = FakePool()
+
+    observer.scan_backlog()
+    assert observer.event_handler.pool.submitted == [
+        "vehicle_status_20240720T090000.json",
+        "objects_detection_20240721T120000.json",
+    ]
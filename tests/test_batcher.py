@@ -0,0 +1,67 @@
+from sqlalchemy.exc import SQLAlchemyError
+
+from file_processing.batcher import MicroBatcher
+from tests.conftest import FakeDB
+
+
+def _fail(row: dict) -> Exception | None:
+    """
+    Fails the transaction of rows with 'bad' set, and raises a non-database error for rows with 'broken' set.
+    """
+    if row.get('bad'):
+        return SQLAlchemyError("bad row")
+    if row.get('broken'):
+        return TypeError("unsupported value")
+    return None
+
+
+def test_files_are_written_in_one_transaction():
+    db, results = FakeDB(fail=_fail), {}
+    batcher = MicroBatcher(db=db, max_rows=6, on_result=lambda path, error: results.update({path: error}))
+    batcher.add("a.json", "events", [{"id": 1}, {"id": 2}, {"id": 3}])
+    batcher.add("b.json", "status", [{"id": 4}])
+    assert db.transactions == 0
+    batcher.add("c.json", "events", [{"id": 5}, {"id": 6}])  # Reaches max_rows
+
+    assert db.transactions == 1
+    assert [row["id"] for row in db.committed["events"]] == [1, 2, 3, 5, 6]
+    assert results == {"a.json": None, "b.json": None, "c.json": None}
+
+
+def test_bad_file_does_not_poison_the_batch():
+    db, results = FakeDB(fail=_fail), {}
+    batcher = MicroBatcher(db=db, on_result=lambda path, error: results.update({path: error}))
+    batcher.add("a.json", "events", [{"id": 1}])
+    batcher.add("b.json", "events", [{"id": 2, "bad": True}])
+    batcher.add("c.json", "events", [{"id": 3}])
+    batcher.stop()
+
+    assert [row["id"] for row in db.committed["events"]] == [1, 3]
+    assert results["a.json"] is None and results["c.json"] is None
+    assert isinstance(results["b.json"], SQLAlchemyError)
+
+
+def test_non_database_error_fails_only_its_file():
+    db, results = FakeDB(fail=_fail), {}
+    batcher = MicroBatcher(db=db, on_result=lambda path, error: results.update({path: error}))
+    batcher.add("a.json", "events", [{"id": 1}])
+    batcher.add("b.json", "status", [{"id": 2, "broken": True}])
+    batcher.add("c.json", "events", [{"id": 3}])
+    batcher.stop()
+
+    assert [row["id"] for row in db.committed["events"]] == [1, 3]
+    assert results["a.json"] is None and results["c.json"] is None
+    assert isinstance(results["b.json"], TypeError)
+
+
+def test_latency_flush():
+    db, results = FakeDB(fail=_fail), {}
+    batcher = MicroBatcher(db=db, max_latency=0.05, on_result=lambda path, error: results.update({path: error}))
+    batcher.start()
+    batcher.add("a.json", "events", [{"id": 1}])
+    for _ in range(100):
+        if results:
+            break
+        batcher._stopped.wait(0.01)
+    batcher.stop()
+    assert results == {"a.json": None}
@@ -0,0 +1,89 @@
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from models.db_models import ObjectsDetectionEvent, VehicleStatus
+from services.db.bulk import VALUES, COPY, COPY_MERGE, get_bulk_writer
+
+NOW = datetime(2024, 7, 21, 14, 30, tzinfo=timezone.utc)
+# Values needing quoting or escaping in CSV and JSON
+EVENTS = [
+    {
+        "vehicle_id": 'v"1", with comma',
+        "detection_time": NOW,
+        "detections": [{"object_type": 'car, "red"\nline', "object_value": 1}],
+    },
+    {"vehicle_id": "véhicule \\N", "detection_time": NOW + timedelta(seconds=1), "detections": []},
+    {"vehicle_id": "", "detection_time": NOW + timedelta(seconds=2), "detections": None},
+]
+EventRow = namedtuple('EventRow', ['vehicle_id', 'detection_time', 'detections'])
+
+
+def _write(db, strategy: str, model, data: list):
+    with db.transaction():
+        get_bulk_writer(strategy).write(db, model, data)
+
+
+def _events(db) -> list[dict]:
+    query = select(
+        ObjectsDetectionEvent.vehicle_id, ObjectsDetectionEvent.detection_time, ObjectsDetectionEvent.detections
+    ).order_by(ObjectsDetectionEvent.detection_time)
+    return [row._asdict() for row in db.execute(query).all()]
+
+
+def _statuses(db) -> list[tuple]:
+    query = select(VehicleStatus.vehicle_id, VehicleStatus.report_time, VehicleStatus.status)
+    return [tuple(row) for row in db.execute(query.order_by(VehicleStatus.vehicle_id)).all()]
+
+
+@pytest.mark.parametrize("strategy", [VALUES, COPY])
+def test_rows_round_trip(db, strategy: str):
+    _write(db, strategy, ObjectsDetectionEvent, EVENTS)
+
+    assert _events(db) == EVENTS
+
+
+def test_copy_writes_named_tuples(db):
+    _write(db, COPY, ObjectsDetectionEvent, [EventRow(**event) for event in EVENTS])
+
+    assert _events(db) == EVENTS
+
+
+def test_copy_merge_keeps_the_newest_status(db):
+    _write(db, COPY_MERGE, VehicleStatus, [
+        {"vehicle_id": "a", "report_time": NOW, "status": "driving"},
+        {"vehicle_id": "b", "report_time": NOW, "status": 'parked, "north"'},
+    ])
+    _write(db, COPY_MERGE, VehicleStatus, [
+        {"vehicle_id": "a", "report_time": NOW + timedelta(minutes=2), "status": "accident"},
+        {"vehicle_id": "a", "report_time": NOW + timedelta(minutes=1), "status": "parking"},
+        {"vehicle_id": "b", "report_time": NOW - timedelta(minutes=1), "status": "driving"},
+        {"vehicle_id": "c", "report_time": NOW, "status": None},
+    ])
+
+    assert _statuses(db) == [
+        ("a", NOW + timedelta(minutes=2), "accident"),
+        ("b", NOW, 'parked, "north"'),
+        ("c", NOW, None),
+    ]
+
+
+@pytest.mark.parametrize("strategy, model, data", [
+    (VALUES, ObjectsDetectionEvent, EVENTS),
+    (COPY, ObjectsDetectionEvent, EVENTS),
+    (COPY_MERGE, VehicleStatus, [{"vehicle_id": "a", "report_time": NOW, "status": "driving"}]),
+])
+def test_writers_join_the_caller_transaction(db, strategy: str, model, data: list):
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            get_bulk_writer(strategy).write(db, model, data)
+            raise RuntimeError("rolled back")
+
+    assert _events(db) == [] and _statuses(db) == []
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        get_bulk_writer("upsert")
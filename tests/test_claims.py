@@ -0,0 +1,97 @@
+import os
+import time
+
+from file_processing.claims import FileClaims
+from file_processing.handler import NewFileHandler, get_prefix, get_file_timestamp
+from services.supervisor import WorkerSupervisor
+from tests.test_backlog import FakePool
+
+
+def _claims(tmp_path, worker_id: str, **kwargs) -> FileClaims:
+    claims = FileClaims(
+        input_dir=str(tmp_path / "input"), worker_id=worker_id, processing_dir=str(tmp_path / "processing"), **kwargs
+    )
+    os.makedirs(claims.worker_dir, exist_ok=True)
+    claims.heartbeat()
+    return claims
+
+
+def test_a_file_is_claimed_once(tmp_path):
+    (tmp_path / "input").mkdir()
+    file_path = tmp_path / "input" / "vehicle_status_20240721T143000.json"
+    file_path.write_text("{}")
+    first, second = _claims(tmp_path, "a"), _claims(tmp_path, "b")
+
+    claimed = first.claim(str(file_path))
+    assert claimed == os.path.join(first.worker_dir, file_path.name)
+    assert second.claim(str(file_path)) is None
+    assert first.claimed_files() == [claimed]
+
+    first.complete(claimed)
+    assert first.claimed_files() == [] and not os.path.exists(claimed)
+
+
+def test_claims_of_stale_workers_are_recovered(tmp_path):
+    (tmp_path / "input").mkdir()
+    file_path = tmp_path / "input" / "vehicle_status_20240721T143000.json"
+    file_path.write_text("{}")
+    dead = _claims(tmp_path, "dead", stale_after=30)
+    live = _claims(tmp_path, "live", stale_after=30)
+    dead.claim(str(file_path))
+
+    assert live.recover_stale() == []
+    heartbeat = os.path.join(dead.worker_dir, ".heartbeat")
+    os.utime(heartbeat, (time.time() - 60, time.time() - 60))
+    assert live.recover_stale() == [str(file_path)]
+    assert file_path.exists() and not os.path.exists(dead.worker_dir)
+
+
+def test_colliding_names_keep_their_prefix_and_timestamp(tmp_path):
+    (tmp_path / "input").mkdir()
+    file_path = tmp_path / "input" / "vehicle_status_20240721T143000.json.gz"
+    file_path.write_text("{}")
+    dead = _claims(tmp_path, "dead", stale_after=30)
+    live = _claims(tmp_path, "live", stale_after=30)
+    dead.claim(str(file_path))
+    file_path.write_text("{}")  # A new file of the same name
+    heartbeat = os.path.join(dead.worker_dir, ".heartbeat")
+    os.utime(heartbeat, (time.time() - 60, time.time() - 60))
+
+    [recovered] = live.recover_stale()
+    name = os.path.basename(recovered)
+    assert recovered != str(file_path) and name.endswith(".json.gz")
+    assert get_prefix(name) == "vehicle_status"
+    assert get_file_timestamp(name) == get_file_timestamp(file_path.name)
+
+
+def test_recovered_files_are_dispatched_again(tmp_path):
+    (tmp_path / "input").mkdir()
+    file_path = tmp_path / "input" / "vehicle_status_20240721T143000.json"
+    file_path.write_text("{}")
+    dead = _claims(tmp_path, "dead", stale_after=30)
+    live = _claims(tmp_path, "live", stale_after=30)
+    handler = NewFileHandler(db=None, pool=FakePool(), file_claims=live)
+
+    # Claimed by the dead worker in between the stat and the rename of the live worker
+    assert handler.claim(str(file_path))
+    dead.claim(str(file_path))
+    handler.submit_file(str(file_path))
+    assert handler.pool.submitted == []
+
+    os.utime(os.path.join(dead.worker_dir, ".heartbeat"), (time.time() - 60, time.time() - 60))
+    recovered = live.recover_stale()
+    handler.submit_file(recovered[0])
+    assert handler.pool.submitted == [file_path.name]
+
+
+def count_and_wait(index, stop, results):
+    stop.wait(30)
+    results.put((index, {"ingest_files_total": {("vehicle_status", "loaded"): index + 1}}))
+
+
+def test_supervisor_collects_counters_and_exit_codes():
+    supervisor = WorkerSupervisor(target=count_and_wait, num_processes=2, stop_timeout=30)
+    supervisor.start()
+    totals = supervisor.stop()
+    assert totals == {"ingest_files_total": {("vehicle_status", "loaded"): 3}}
+    assert supervisor.exit_codes == {0: [0], 1: [0]}
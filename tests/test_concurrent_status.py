@@ -0,0 +1,82 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from models.db_models import ObjectsDetectionEvent, DetectionHourlyRollup, VehicleStatus
+from services.db.bulk import VALUES, COPY_MERGE
+from services.db.postgres_client import PostgresDB
+
+NOW = datetime(2024, 7, 21, 14, 30, tzinfo=timezone.utc)
+VEHICLES = 40
+LOADS = 16
+CHUNKS_PER_LOAD = 4
+
+
+@pytest.fixture
+def db_engine_options() -> dict:
+    return {"pool_size": LOADS}
+
+
+def _load(db: PostgresDB, seed: int) -> list[dict]:
+    """
+    Upsert every vehicle in a random order, in several chunks of one transaction, as a file load does.
+    """
+    rng = random.Random(seed)
+    rows = [
+        {"vehicle_id": f"v{n}", "report_time": NOW + timedelta(seconds=rng.randrange(10_000)), "status": f"load {seed}"}
+        for n in range(VEHICLES)
+    ]
+    rng.shuffle(rows)
+    size = VEHICLES // CHUNKS_PER_LOAD
+    with db.transaction():
+        for start in range(0, VEHICLES, size):
+            db.insert(model=VehicleStatus, data=rows[start:start + size])
+    return rows
+
+
+@pytest.mark.parametrize("strategy", [COPY_MERGE, VALUES])
+def test_concurrent_overlapping_loads_keep_newest_status(db, monkeypatch, strategy):
+    monkeypatch.setattr(VehicleStatus, 'bulk_strategy', strategy)
+    with ThreadPoolExecutor(max_workers=LOADS) as executor:
+        loads = list(executor.map(lambda seed: _load(db, seed), range(LOADS)))
+
+    newest = {}
+    for row in (row for rows in loads for row in rows):
+        if row["vehicle_id"] not in newest or row["report_time"] > newest[row["vehicle_id"]]["report_time"]:
+            newest[row["vehicle_id"]] = row
+    stored = db.execute(select(VehicleStatus.vehicle_id, VehicleStatus.report_time, VehicleStatus.status)).all()
+    assert {row.vehicle_id: (row.report_time, row.status) for row in stored} == {
+        vehicle_id: (row["report_time"], row["status"]) for vehicle_id, row in newest.items()
+    }
+
+
+def test_statuses_are_written_in_the_caller_transaction(db):
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.insert(model=VehicleStatus, data=[{"vehicle_id": "v1", "report_time": NOW, "status": "driving"}])
+            raise RuntimeError("Bad row in a later chunk")
+
+    assert db.execute(select(VehicleStatus.status)).scalars().all() == []
+    assert VehicleStatus.last_applied(db).get("v1") is None
+
+
+def test_deferred_tables_are_written_in_a_fixed_order(db, monkeypatch):
+    written = []
+    insert = PostgresDB.insert
+
+    def recording_insert(self, model, data, strategy=None):
+        if getattr(self._local, 'writing_deferred', False):
+            written.append(model.__tablename__)
+        insert(self, model, data, strategy)
+
+    monkeypatch.setattr(PostgresDB, 'insert', recording_insert)
+    with db.transaction():
+        db.insert(model=VehicleStatus, data=[{"vehicle_id": "v1", "report_time": NOW, "status": "driving"}])
+        db.insert(model=ObjectsDetectionEvent, data=[
+            {"vehicle_id": "v1", "detection_time": NOW, "detections": [{"object_type": "car", "object_value": 1}]}
+        ])
+
+    assert written == sorted(written) == [DetectionHourlyRollup.__tablename__, VehicleStatus.__tablename__]
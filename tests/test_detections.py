@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+
+from file_processing.loader import OBJECTS_DETECTION_SOURCE, validate_rows
+from models.db_models import ObjectsDetectionEvent, Detection, DetectionHourlyRollup
+from services.db.bulk import with_ids
+
+NOW = datetime(2024, 7, 21, 14, 30, tzinfo=timezone.utc)
+CONTENT = (
+    b'{"objects_detection_events": [{"vehicle_id": "a", "detection_time": "2024-07-21T14:30:00Z",'
+    b' "detections": [{"object_type": "cars", "object_value": 2}, {"object_type": "signs", "object_value": 1}]}]}'
+)
+
+
+def test_with_ids_keeps_row_kind():
+    rows = validate_rows(CONTENT, OBJECTS_DETECTION_SOURCE.source_model, OBJECTS_DETECTION_SOURCE.data_key)
+
+    tuple_rows = with_ids(rows, [7])
+    dict_rows = with_ids([row._asdict() for row in rows], [7])
+
+    assert tuple_rows[0].id == 7 and tuple_rows[0].vehicle_id == "a"
+    assert dict_rows[0] == {**rows[0]._asdict(), "id": 7}
+
+
+def test_related_rows_normalizes_detections():
+    rows = with_ids(
+        validate_rows(CONTENT, OBJECTS_DETECTION_SOURCE.source_model, OBJECTS_DETECTION_SOURCE.data_key), [7]
+    )
+
+    related = ObjectsDetectionEvent.related_rows(rows)
+    assert related[Detection] == [
+        {"event_id": 7, "vehicle_id": "a", "detection_time": NOW, "object_type": "cars", "object_value": 2},
+        {"event_id": 7, "vehicle_id": "a", "detection_time": NOW, "object_type": "signs", "object_value": 1},
+    ]
+    assert ObjectsDetectionEvent.related_rows([row._asdict() for row in rows]) == related
+
+
+def test_rollups_aggregate_and_combine_per_vehicle_hour_and_type():
+    def detection(vehicle_id: str, minute: int, object_type: str, value: int) -> dict:
+        return {
+            "event_id": 1, "vehicle_id": vehicle_id, "detection_time": NOW.replace(minute=minute),
+            "object_type": object_type, "object_value": value,
+        }
+
+    first = DetectionHourlyRollup.aggregate([detection("a", 0, "cars", 2), detection("a", 59, "cars", 3)])
+    second = DetectionHourlyRollup.aggregate([detection("a", 10, "cars", 1), detection("b", 10, "cars", 1)])
+
+    hour = NOW.replace(minute=0)
+    assert first == [
+        {"vehicle_id": "a", "hour": hour, "object_type": "cars", "detection_count": 2, "object_value_sum": 5},
+    ]
+    assert DetectionHourlyRollup.combine(first + second) == [
+        {"vehicle_id": "a", "hour": hour, "object_type": "cars", "detection_count": 3, "object_value_sum": 6},
+        {"vehicle_id": "b", "hour": hour, "object_type": "cars", "detection_count": 1, "object_value_sum": 1},
+    ]
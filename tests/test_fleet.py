@@ -0,0 +1,21 @@
+import json
+
+from benchmarks.fleet import FleetGenerator
+from file_processing.handler import get_prefix, get_file_timestamp, DATA_SOURCES
+from file_processing.loader import validate_rows
+
+
+def test_generated_files_are_deterministic_and_loadable():
+    files = [FleetGenerator(vehicles=5, rows_per_file=4, seed=1).next_file() for _ in range(2)]
+    assert files[0] == files[1]
+
+    generator = FleetGenerator(vehicles=5, rows_per_file=4, seed=1)
+    names = set()
+    for _ in range(20):
+        file_name, content = generator.next_file()
+        names.add(file_name)
+        data_source = DATA_SOURCES[get_prefix(file_name)]
+        assert get_file_timestamp(file_name) is not None
+        assert len(validate_rows(content, data_source.source_model, data_source.data_key)) == 4
+        assert set(json.loads(content)) == {data_source.data_key}
+    assert len(names) == 20
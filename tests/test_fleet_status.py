@@ -0,0 +1,73 @@
+import json
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models.db_models import VehicleStatus
+from services.fleet_status import FleetStatusIndex, FleetStatusServer, VehicleState
+
+NOW = datetime(2024, 7, 21, 14, 30, tzinfo=timezone.utc)
+
+
+def _status(vehicle_id: str, minutes: int, status: str) -> dict:
+    return {"vehicle_id": vehicle_id, "report_time": NOW + timedelta(minutes=minutes), "status": status}
+
+
+def test_index_keeps_latest_status_per_vehicle():
+    index = FleetStatusIndex()
+    index.update([_status("v1", 0, "driving"), _status("v2", 0, "driving")])
+    index.update([_status("v1", 5, "accident"), _status("v2", -5, "accident")])
+    index.update([VehicleState("v3", NOW, "accident")])
+
+    assert index.get("v1") == VehicleState("v1", NOW + timedelta(minutes=5), "accident")
+    assert index.get("v2").status == "driving" and index.get("v4") is None
+    assert sorted(state.vehicle_id for state in index.with_status("accident")) == ["v1", "v3"]
+    assert index.status_counts() == {"driving": 1, "accident": 2}
+
+
+def test_server_answers_point_and_filter_queries():
+    index = FleetStatusIndex()
+    index.update([_status("v 1", 0, "accident"), _status("v2", 0, "parking")])
+    server = FleetStatusServer(index=index, port=0)
+    server.start()
+    base = f"http://{server.host}:{server.port}"
+    try:
+        with urllib.request.urlopen(f"{base}/vehicles/v%201") as response:
+            assert json.load(response) == {"vehicle_id": "v 1", "report_time": NOW.isoformat(), "status": "accident"}
+        with urllib.request.urlopen(f"{base}/vehicles?status=parking") as response:
+            assert [state["vehicle_id"] for state in json.load(response)] == ["v2"]
+        with urllib.request.urlopen(f"{base}/statuses") as response:
+            assert json.load(response) == {"accident": 1, "parking": 1}
+        with pytest.raises(urllib.error.HTTPError, match="404"):
+            urllib.request.urlopen(f"{base}/vehicles/unknown")
+    finally:
+        server.stop()
+
+
+def test_index_is_warmed_and_follows_commits(db):
+    db.insert(model=VehicleStatus, data=[_status(f"v{n}", 0, "driving") for n in range(3)])
+    index = FleetStatusIndex()
+    assert index.warm(db, chunk_size=2) == 3
+    VehicleStatus.status_index = index
+    try:
+        with db.transaction():
+            db.insert(model=VehicleStatus, data=[_status("v0", 1, "accident"), _status("v3", 1, "parking")])
+            assert index.get("v0").status == "driving"
+    finally:
+        VehicleStatus.status_index = None
+    assert index.get("v0").status == "accident" and len(index) == 4
+
+
+def test_warming_again_picks_up_statuses_of_other_writers(db):
+    db.execute(VehicleStatus.insert_statement([_status("v0", 0, "driving"), _status("v1", 2, "parking")]))
+    index = FleetStatusIndex()
+    index.warm(db)
+    index.update([_status("v1", 3, "driving")])  # Committed by this process meanwhile
+    # Merged by another process, e.g. main_backfill.py, bypassing VehicleStatus.on_committed
+    db.execute(VehicleStatus.insert_statement([_status("v0", 1, "accident"), _status("v2", 0, "parking")]))
+
+    assert index.warm(db) == 3
+    assert [index.get(f"v{n}").status for n in range(3)] == ["accident", "driving", "parking"]
+    assert index.status_counts() == {"accident": 1, "driving": 1, "parking": 1}
@@ -0,0 +1,90 @@
+import gzip
+import json
+import pytest
+from json.decoder import JSONDecodeError
+
+from file_processing.formats import GZIP, ZSTD, FileFormat, detect_format, decoded_size, open_decoded, read_decoded
+from file_processing.loader import VEHICLE_STATUS_SOURCE, read_rows, iter_file_chunks
+from tests.helpers import read_json_file, VEHICLE_STATUS_FILE_NAME, VEHICLE_STATUS_TABLE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ITEMS = read_json_file(VEHICLE_STATUS_FILE_NAME)[VEHICLE_STATUS_TABLE]
+DOCUMENT = json.dumps({VEHICLE_STATUS_TABLE: ITEMS}).encode()
+NDJSON = b''.join(json.dumps(item).encode() + b'\n' for item in ITEMS)
+
+
+def _read(path) -> list[tuple]:
+    return read_rows(
+        file_path=str(path),
+        source_model=VEHICLE_STATUS_SOURCE.source_model,
+        data_key=VEHICLE_STATUS_SOURCE.data_key
+    )
+
+
+def _stream(path, batch_size: int = 2) -> list[tuple]:
+    file_format = detect_format(str(path))
+    with open_decoded(str(path), file_format) as file:
+        chunks = iter_file_chunks(
+            file=file,
+            file_format=file_format,
+            source_model=VEHICLE_STATUS_SOURCE.source_model,
+            data_key=VEHICLE_STATUS_SOURCE.data_key,
+            batch_size=batch_size
+        )
+        return [row for chunk in chunks for row in chunk]
+
+
+@pytest.mark.parametrize("name, content", [
+    ("vehicle_status_1.json.gz", gzip.compress(DOCUMENT)),
+    ("vehicle_status_1.ndjson", NDJSON),
+    ("vehicle_status_1.jsonl.gz", gzip.compress(NDJSON)),
+])
+def test_formats_match_plain_json(tmp_path, name: str, content: bytes):
+    plain_path = tmp_path / "vehicle_status_0.json"
+    plain_path.write_bytes(DOCUMENT)
+    path = tmp_path / name
+    path.write_bytes(content)
+
+    expected = _read(plain_path)
+    assert len(expected) == len(ITEMS)
+    assert _read(path) == expected
+    assert _stream(path) == expected
+
+
+def test_compression_detected_from_magic_bytes(tmp_path):
+    path = tmp_path / "vehicle_status_1.json"
+    path.write_bytes(gzip.compress(DOCUMENT))
+
+    assert detect_format(str(path)) == FileFormat(compression=GZIP, ndjson=False)
+    assert decoded_size(str(path)) == len(DOCUMENT)
+    assert read_decoded(str(path)) == DOCUMENT
+
+
+def test_truncated_and_invalid_input_raise_json_errors(tmp_path):
+    truncated = tmp_path / "vehicle_status_1.json.gz"
+    truncated.write_bytes(gzip.compress(DOCUMENT)[:-12])
+    invalid_line = tmp_path / "vehicle_status_2.ndjson"
+    invalid_line.write_bytes(NDJSON + b'{"vehicle_id": \n')
+
+    for path in (truncated, invalid_line):
+        with pytest.raises(JSONDecodeError):
+            _read(path)
+        with pytest.raises(JSONDecodeError):
+            _stream(path)
+    with pytest.raises(JSONDecodeError, match=f"line {len(ITEMS) + 1}"):
+        _read(invalid_line)
+
+
+def test_zstd(tmp_path):
+    if zstandard is None:
+        pytest.skip("zstandard is not installed")
+    path = tmp_path / "vehicle_status_1.ndjson.zst"
+    path.write_bytes(zstandard.ZstdCompressor().compress(NDJSON))
+
+    assert detect_format(str(path)) == FileFormat(compression=ZSTD, ndjson=True)
+    assert decoded_size(str(path)) == len(NDJSON)
+    assert len(_stream(path)) == len(ITEMS)
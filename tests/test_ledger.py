@@ -0,0 +1,102 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select, func
+
+from models.db_models import IngestedFile, VehicleStatus
+from services.db.ledger import IngestionLedger, DuplicateFileError, FileRecord, fingerprint_file, LOADED, FAILED
+
+STATUS = {"vehicle_id": "v1", "report_time": datetime(2024, 7, 21, 14, 30, tzinfo=timezone.utc), "status": "driving"}
+
+
+def _record(name: str) -> FileRecord:
+    return FileRecord(
+        file_name=f"{name}.json", file_size=1, content_hash=name.ljust(64, '0'), started_at=datetime.now(timezone.utc)
+    )
+
+
+def _entries(db) -> list[tuple]:
+    query = select(IngestedFile.file_name, IngestedFile.status, IngestedFile.row_count).order_by(IngestedFile.id)
+    return [tuple(row) for row in db.execute(query).all()]
+
+
+def test_fingerprint_identifies_the_content(tmp_path):
+    first, second = tmp_path / "a.json", tmp_path / "b.json"
+    first.write_text('{"vehicle_status": []}')
+    second.write_text('{"vehicle_status": []}')
+
+    record = fingerprint_file(str(first))
+
+    assert record.file_name == "a.json" and record.file_size == first.stat().st_size
+    assert record.content_hash == fingerprint_file(str(second)).content_hash
+
+
+def test_record_loaded_rejects_duplicates_and_rolls_back_their_rows(db):
+    ledger = IngestionLedger(db=db)
+    record = _record("a")
+    with db.transaction():
+        db.insert(model=VehicleStatus, data=[STATUS])
+        ledger.record_loaded(record=record, row_count=1)
+    assert ledger.is_loaded(record.content_hash)
+
+    with pytest.raises(DuplicateFileError):
+        with db.transaction():
+            db.execute(VehicleStatus.__table__.delete())
+            ledger.record_loaded(record=record._replace(file_name="copy.json"), row_count=1)
+
+    assert _entries(db) == [("a.json", LOADED, 1)]
+    assert db.execute(select(func.count()).select_from(VehicleStatus)).scalar() == 1
+
+
+def test_index_is_updated_only_when_the_transaction_commits(db):
+    ledger = IngestionLedger(db=db)
+    record = _record("a")
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            ledger.record_loaded(record=record, row_count=1)
+            raise RuntimeError("rolled back")
+
+    assert not ledger.is_loaded(record.content_hash)
+    assert _entries(db) == []
+
+
+def test_record_failed_is_overwritten_by_a_later_load_only(db):
+    ledger = IngestionLedger(db=db)
+    failed, loaded = _record("a"), _record("b")
+    with db.transaction():
+        ledger.record_loaded(record=loaded, row_count=3)
+
+    ledger.record_failed(record=failed, error=ValueError("boom"))
+    ledger.record_failed(record=loaded, error=ValueError("boom"))
+    assert _entries(db) == [("b.json", LOADED, 3), ("a.json", FAILED, None)]
+    assert db.execute(select(IngestedFile.error).where(IngestedFile.status == FAILED)).scalar() == "boom"
+
+    with db.transaction():
+        ledger.record_loaded(record=failed, row_count=2)
+    assert _entries(db) == [("b.json", LOADED, 3), ("a.json", LOADED, 2)]
+    assert db.execute(select(func.count()).where(IngestedFile.error.is_not(None))).scalar() == 0
+
+
+def test_preload_keeps_the_most_recently_loaded_hashes(db):
+    ledger = IngestionLedger(db=db)
+    records = [_record(name) for name in "abc"]
+    for record in records:
+        with db.transaction():
+            ledger.record_loaded(record=record, row_count=1)
+    ledger.record_failed(record=_record("d"), error=ValueError("boom"))
+
+    preloaded = IngestionLedger(db=db, max_index_size=2)
+    preloaded.preload()
+
+    assert [preloaded.is_loaded(record.content_hash) for record in records] == [False, True, True]
+    assert not preloaded.is_loaded(_record("d").content_hash)
+
+
+def test_index_evicts_the_least_recently_added_hashes(db):
+    ledger = IngestionLedger(db=db, max_index_size=2)
+
+    ledger._add_to_index(["a", "b"])
+    ledger._add_to_index(["a", "c"])
+
+    assert [ledger.is_loaded(content_hash) for content_hash in "abc"] == [True, False, True]
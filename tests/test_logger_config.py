@@ -0,0 +1,92 @@
+import json
+import logging
+import time
+
+import pytest
+
+import logger_config
+from logger_config import EventLog, JsonFormatter, configure_logging, get_logger, stop_logging
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "app.log"
+    configure_logging(log_file=str(path), log_format='json', max_bytes=2048, backup_count=2)
+    yield path
+    configure_logging()
+
+
+def test_event_log_rate_limits_and_summarizes():
+    logger = logging.getLogger('tests.event_log')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = _ListHandler()
+    logger.addHandler(handler)
+    event_log = EventLog(logger, burst=2, interval=3600)
+
+    for index in range(5):
+        event_log.info('loaded', "Loaded file %s", index)
+    event_log.info('skipped', "Skipped file %s", 'x')
+    event_log.flush()
+    event_log.flush()
+
+    messages = [record.getMessage() for record in handler.records]
+    assert messages[:3] == ["Loaded file 0", "Loaded file 1", "Skipped file x"]
+    assert len(messages) == 4
+    summary = handler.records[-1]
+    assert summary.events == {'loaded': 5, 'skipped': 1} and summary.suppressed == 3
+
+
+def test_event_log_summary_is_logged_by_the_listener_once_the_interval_ended():
+    logger = logging.getLogger('tests.event_log_timer')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = _ListHandler()
+    logger.addHandler(handler)
+    event_log = EventLog(logger, burst=1, interval=0.1)
+
+    for index in range(3):
+        event_log.info('loaded', "Loaded file %s", index)
+    get_logger('tests.event_log_timer.listener').info("Start the listener")
+    deadline = time.monotonic() + 5 * logger_config.LOG_SUMMARY_CHECK_INTERVAL
+    while len(handler.records) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert [record.getMessage() for record in handler.records][:1] == ["Loaded file 0"]
+    assert len(handler.records) == 2 and handler.records[1].events == {'loaded': 3}
+
+
+def test_json_formatter_includes_extra_fields_and_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError as e:
+        record = logging.LogRecord('tests', logging.ERROR, __file__, 1, "Failed %s", ('x',), (type(e), e, e.__traceback__))
+    record.file_path = 'input/a.json'
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry['message'] == "Failed x" and entry['level'] == 'ERROR' and entry['logger'] == 'tests'
+    assert entry['file_path'] == 'input/a.json'
+    assert 'ValueError: boom' in entry['exception']
+
+
+def test_records_are_written_and_rotated_by_the_listener(log_file):
+    logger = get_logger('tests.listener')
+    for index in range(100):
+        logger.info(f"Message {index}", extra={'index': index})
+    stop_logging()
+
+    entries = [json.loads(line) for line in log_file.read_text().splitlines()]
+    last = [entry for entry in entries if entry['logger'] == 'tests.listener'][-1]
+    assert last['message'] == "Message 99" and last['index'] == 99
+    assert log_file.with_name("app.log.1").exists()
+    assert logger_config._listener is None
@@ -0,0 +1,47 @@
+import urllib.request
+
+import pytest
+
+from services.metrics import MetricsRegistry, MetricsServer
+
+
+def test_histogram_counts_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram("stage_seconds", "Stage latency", labels=("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.observe(value, stage="read")
+
+    sample = registry.snapshot()["stage_seconds"][("read",)]
+    assert sample["count"] == 4
+    assert sample["sum"] == pytest.approx(6.05)
+    assert sample["buckets"] == {0.1: 1, 1.0: 3, float("inf"): 4}
+
+
+def test_counter_and_gauge_snapshot():
+    registry = MetricsRegistry()
+    files = registry.counter("files_total", "Files", labels=("prefix", "outcome"))
+    files.inc(prefix="vehicle_status", outcome="loaded")
+    files.inc(2, prefix="vehicle_status", outcome="loaded")
+    registry.gauge("queue_depth", "Queue depth").set_function(lambda: 7)
+
+    assert registry.snapshot() == {
+        "files_total": {("vehicle_status", "loaded"): 3},
+        "queue_depth": {(): 7},
+    }
+    with pytest.raises(ValueError):
+        files.inc(prefix="vehicle_status")
+
+
+def test_server_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("files_total", "Files", labels=("prefix",)).inc(prefix='a"b')
+    server = MetricsServer(registry=registry, port=0)
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://{server.host}:{server.port}/metrics") as response:
+            body = response.read().decode()
+    finally:
+        server.stop()
+
+    assert "# TYPE files_total counter" in body
+    assert 'files_total{prefix="a\\"b"} 1' in body
@@ -0,0 +1,104 @@
+import json
+import os
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+from pydantic import ValidationError
+
+from file_processing import parallel_parser
+from file_processing.handler import load_file
+from file_processing.parallel_parser import ParallelParser
+from file_processing.loader import OBJECTS_DETECTION_SOURCE, read_rows
+from file_processing.retry import is_retryable
+from tests.conftest import FakeDB, FakeRetry
+
+EVENT_COUNT = 400
+
+
+def _events() -> list[dict]:
+    return [
+        {
+            "vehicle_id": f"v{index % 7}é",
+            "detection_time": f"2024-07-21T14:{index // 60 % 60:02d}:{index % 60:02d}Z",
+            "detections": [{"object_type": f"type, {{\"x\": {index}}}", "object_value": n} for n in range(index % 4)]
+        }
+        for index in range(EVENT_COUNT)
+    ]
+
+
+@pytest.fixture(scope='module')
+def parser():
+    parser = ParallelParser(processes=2, span_bytes=2048, min_file_bytes=0)
+    parser.start()
+    yield parser
+    parser.stop()
+
+
+def _parse(parser: ParallelParser, path) -> list[tuple]:
+    chunks = parser.iter_chunks(file_path=str(path), data_source=OBJECTS_DETECTION_SOURCE, batch_size=50)
+    return [row for chunk in chunks for row in chunk]
+
+
+def _expected(path) -> list[tuple]:
+    return read_rows(
+        file_path=str(path),
+        source_model=OBJECTS_DETECTION_SOURCE.source_model,
+        data_key=OBJECTS_DETECTION_SOURCE.data_key
+    )
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_json_spans_match_sequential_parse(parser, tmp_path, indent):
+    path = tmp_path / "objects_detection_1.json"
+    path.write_text(json.dumps({OBJECTS_DETECTION_SOURCE.data_key: _events()}, indent=indent, ensure_ascii=False))
+
+    assert len(_expected(path)) == EVENT_COUNT
+    assert _parse(parser, path) == _expected(path)
+
+
+def test_ndjson_spans_match_sequential_parse(parser, tmp_path):
+    path = tmp_path / "objects_detection_1.ndjson"
+    path.write_text(''.join(json.dumps(event) + '\n' for event in _events()))
+
+    assert _parse(parser, path) == _expected(path)
+
+
+def test_wrong_boundary_guesses_are_resynced(parser, tmp_path, monkeypatch):
+    # Guess boundaries between nested detections, none of which is an item boundary
+    monkeypatch.setattr(parallel_parser, '_item_keys', lambda source_model: ['object_type'])
+    path = tmp_path / "objects_detection_1.json"
+    path.write_text(json.dumps({OBJECTS_DETECTION_SOURCE.data_key: _events()}))
+
+    assert _parse(parser, path) == _expected(path)
+
+
+def test_invalid_item_is_reported(parser, tmp_path):
+    events = _events()
+    events[EVENT_COUNT - 3]["detections"] = [{"object_type": "cars", "object_value": "many"}]
+    path = tmp_path / "objects_detection_1.json"
+    path.write_text(json.dumps({OBJECTS_DETECTION_SOURCE.data_key: events}))
+
+    with pytest.raises(ValidationError):
+        _parse(parser, path)
+
+
+def test_broken_pool_is_replaced_and_the_file_retried(tmp_path):
+    parser = ParallelParser(processes=2, span_bytes=2048, min_file_bytes=0)
+    parser.start()
+    try:
+        path = tmp_path / "objects_detection_20240721T143000.json"
+        path.write_text(json.dumps({OBJECTS_DETECTION_SOURCE.data_key: _events()}))
+        broken = parser._executor
+        broken.submit(os.getpid).result()
+        for process in list(broken._processes.values()):
+            process.kill()
+            process.join()
+        retry = FakeRetry()
+
+        load_file(file_name=path.name, file_path=str(path), db=FakeDB(), retry=retry, parser=parser)
+
+        [(file_path, error)] = retry.results
+        assert isinstance(error, BrokenProcessPool) and is_retryable(error)
+        assert parser._executor is not broken
+        assert _parse(parser, path) == _expected(path)
+    finally:
+        parser.stop()
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import BigInteger, Column, Integer, MetaData, Table, TIMESTAMP, text
+
+from models.db_models import Detection
+from services.db.config import DAILY, MONTHLY
+from services.db.partitions import PartitionManager, partition_start, next_partition_start, partition_name
+
+READINGS = Table(
+    "readings",
+    MetaData(),
+    Column("id", BigInteger, primary_key=True, autoincrement=True),
+    Column("taken_at", TIMESTAMP(timezone=True), primary_key=True),
+    Column("value", Integer, index=True),
+    postgresql_partition_by="RANGE (taken_at)"
+)
+
+
+def test_partition_start_uses_utc_bounds():
+    timestamp = datetime(2024, 7, 21, 1, 30, tzinfo=timezone(timedelta(hours=3)))
+
+    assert partition_start(timestamp, DAILY) == datetime(2024, 7, 20, tzinfo=timezone.utc)
+    assert partition_start(timestamp, MONTHLY) == datetime(2024, 7, 1, tzinfo=timezone.utc)
+
+
+def test_next_partition_start_rolls_over_year():
+    start = datetime(2024, 12, 1, tzinfo=timezone.utc)
+
+    assert next_partition_start(start, MONTHLY) == datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert next_partition_start(start, DAILY) == datetime(2024, 12, 2, tzinfo=timezone.utc)
+
+
+def test_partition_name():
+    start = datetime(2024, 7, 1, tzinfo=timezone.utc)
+
+    assert partition_name(Detection.__table__, start, DAILY) == "detections_p20240701"
+    assert partition_name(Detection.__table__, start, MONTHLY) == "detections_p202407"
+
+
+@pytest.fixture
+def db_engine_options() -> dict:
+    # Creating a partition must not wait for the caller's transaction, fail instead of hanging
+    return {"connect_args": {"options": "-c lock_timeout=5000"}}
+
+
+@pytest.fixture
+def readings(db):
+    with db.separate_transaction() as connection:
+        READINGS.create(bind=connection)
+
+
+def test_partitions_are_created_outside_the_caller_transaction(db, readings):
+    partitions = PartitionManager(db=db, tables=[READINGS], interval=DAILY)
+    first, second = datetime(2024, 7, 21, tzinfo=timezone.utc), datetime(2024, 7, 22, tzinfo=timezone.utc)
+    partitions.ensure_partitions([first])
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.execute(READINGS.insert().values(taken_at=first, value=1))
+            partitions.ensure_partitions([second])
+            with db.separate_transaction() as connection:
+                assert connection.execute(text("SELECT to_regclass('readings_p20240722')")).scalar() is not None
+            db.execute(READINGS.insert().values(taken_at=second, value=2))
+            raise RuntimeError("Bad row in a later chunk")
+
+    assert partitions.list_partitions(READINGS) == [first, second]
+    indexes = db.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'readings_p20240722'")).scalars()
+    assert len(list(indexes)) == 2
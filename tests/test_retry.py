@@ -0,0 +1,67 @@
+import json
+import threading
+from json.decoder import JSONDecodeError
+
+from pydantic import ValidationError
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from file_processing.retry import RetryScheduler, is_retryable, MANIFEST_FILE_NAME
+from models.source_models import SourceVehicleStatus
+from tests.conftest import FakeDB
+
+
+def _validation_error() -> ValidationError:
+    try:
+        SourceVehicleStatus(vehicle_id="a")
+    except ValidationError as e:
+        return e
+
+
+def _wrapped(error: Exception) -> SQLAlchemyError:
+    try:
+        raise SQLAlchemyError("Error inserting data") from error
+    except SQLAlchemyError as e:
+        return e
+
+
+def test_is_retryable():
+    assert is_retryable(JSONDecodeError("Expecting value", "", 0))
+    assert is_retryable(_wrapped(OperationalError("INSERT", {}, Exception("server closed the connection"))))
+    assert not is_retryable(_wrapped(Exception("syntax error")))
+    assert not is_retryable(_validation_error())
+
+
+def test_permanent_failure_is_quarantined(tmp_path):
+    file_path = tmp_path / "vehicle_status_20240721T143000.json"
+    file_path.write_text("{}")
+    quarantine_dir = tmp_path / "quarantine"
+    scheduler = RetryScheduler(db=FakeDB(), quarantine_dir=str(quarantine_dir))
+
+    scheduler.on_result(str(file_path), _validation_error())
+
+    assert not file_path.exists()
+    assert (quarantine_dir / file_path.name).exists()
+    entry = json.loads((quarantine_dir / MANIFEST_FILE_NAME).read_text())
+    assert entry["error_type"] == "ValidationError" and entry["attempts"] == 1
+
+
+def test_retryable_failure_is_retried_until_attempts_run_out(tmp_path):
+    file_path = tmp_path / "vehicle_status_20240721T143000.json"
+    file_path.write_text("")
+    attempts = []
+    done = threading.Event()
+    scheduler = RetryScheduler(db=FakeDB(), quarantine_dir=str(tmp_path / "quarantine"), max_attempts=3, base_delay=0.01)
+
+    def process(file_name: str, file_path: str, db):
+        attempts.append(file_name)
+        scheduler.on_result(file_path, JSONDecodeError("Expecting value", "", 0))
+        if len(attempts) == 2:
+            done.set()
+
+    scheduler.start(process=process)
+    scheduler.on_result(str(file_path), JSONDecodeError("Expecting value", "", 0))
+    assert done.wait(timeout=5)
+    scheduler.stop()
+
+    assert attempts == [file_path.name] * 2
+    assert (tmp_path / "quarantine" / file_path.name).exists()
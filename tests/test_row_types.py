@@ -0,0 +1,39 @@
+from json.decoder import JSONDecodeError
+
+import pytest
+from pydantic import ValidationError
+
+from file_processing.loader import OBJECTS_DETECTION_SOURCE, validate_rows
+
+
+def _validate(content: bytes) -> list[tuple]:
+    return validate_rows(
+        content=content,
+        source_model=OBJECTS_DETECTION_SOURCE.source_model,
+        data_key=OBJECTS_DETECTION_SOURCE.data_key
+    )
+
+
+def test_rows_match_per_item_validation():
+    content = (
+        b'{"objects_detection_events": [{"vehicle_id": "v1", "detection_time": "2024-07-21T10:00:00Z",'
+        b' "detections": [{"object_type": "cars", "object_value": 2}]}]}'
+    )
+    rows = _validate(content)
+    expected = OBJECTS_DETECTION_SOURCE.source_model(
+        vehicle_id="v1",
+        detection_time="2024-07-21T10:00:00Z",
+        detections=[{"object_type": "cars", "object_value": 2}]
+    ).model_dump()
+    assert len(rows) == 1
+    assert rows[0]._asdict() == expected
+
+
+def test_truncated_document_raises_json_decode_error():
+    with pytest.raises(JSONDecodeError):
+        _validate(b'{"objects_detection_events": [{"vehicle_id": "v1"')
+
+
+def test_invalid_item_raises_validation_error():
+    with pytest.raises(ValidationError):
+        _validate(b'{"objects_detection_events": [{"vehicle_id": "v1"}]}')
@@ -0,0 +1,64 @@
+import os
+import queue
+import time
+
+from watchdog.observers.api import ObservedWatch
+
+from services.observer.scanner import ScandirEmitter
+
+
+def _emitter(path, recursive: bool = False) -> tuple[ScandirEmitter, queue.Queue]:
+    events = queue.Queue()
+    return ScandirEmitter(events, ObservedWatch(str(path), recursive), settle_time=30), events
+
+
+def _drain(events: queue.Queue) -> list[str]:
+    paths = []
+    while not events.empty():
+        event, _ = events.get()
+        paths.append(os.path.basename(event.src_path))
+    return paths
+
+
+def _write(path, age: float = 0):
+    path.write_text("{}")
+    if age:
+        os.utime(path, (time.time() - age, time.time() - age))
+
+
+def test_existing_files_are_emitted_once_in_timestamp_order(tmp_path):
+    _write(tmp_path / "vehicle_status_20240721T143001.json", age=60)
+    _write(tmp_path / "objects_detection_20240721T143000.json", age=60)
+    _write(tmp_path / ".upload.tmp", age=60)
+    os.utime(tmp_path, (time.time() - 60, time.time() - 60))
+    emitter, events = _emitter(tmp_path)
+
+    emitter.scan()
+    assert _drain(events) == ["objects_detection_20240721T143000.json", "vehicle_status_20240721T143001.json"]
+    emitter.scan()
+    assert _drain(events) == []
+    assert str(tmp_path) in emitter._cursors  # Unchanged, the directory is not listed again
+
+
+def test_file_being_written_waits_until_it_settles(tmp_path):
+    emitter, events = _emitter(tmp_path)
+    file_path = tmp_path / "vehicle_status_20240721T143000.json"
+    _write(file_path)
+    emitter.scan()
+    assert _drain(events) == []
+    with open(file_path, 'a') as file:
+        file.write(" ")
+    emitter.scan()
+    assert _drain(events) == []
+    emitter.scan()  # Same size and mtime as on the previous pass
+    assert _drain(events) == [file_path.name]
+
+
+def test_recursive_scan_finds_files_in_new_subdirectories(tmp_path):
+    emitter, events = _emitter(tmp_path, recursive=True)
+    emitter.scan()
+    day = tmp_path / "2024" / "07" / "21"
+    day.mkdir(parents=True)
+    _write(day / "vehicle_status_20240721T143000.json", age=60)
+    emitter.scan()
+    assert _drain(events) == ["vehicle_status_20240721T143000.json"]
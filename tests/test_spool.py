@@ -0,0 +1,108 @@
+from sqlalchemy.exc import SQLAlchemyError
+
+from file_processing.loader import VEHICLE_STATUS_SOURCE, validate_rows
+from file_processing.spool import Spool, SpoolDrainer, SEGMENT_SUFFIX, CORRUPT_SUFFIX
+from models.db_models import VehicleStatus
+from tests.conftest import FakeDB, FakeRetry
+
+STATUS_FILE = b'{"vehicle_status": [{"vehicle_id": "v1", "report_time": "2024-07-21T14:30:00Z", "status": "driving"}]}'
+
+
+def _append(spool: Spool, name: str, vehicle_id: str = "v1") -> int:
+    content = STATUS_FILE.replace(b'"v1"', f'"{vehicle_id}"'.encode())
+    rows = validate_rows(content, VEHICLE_STATUS_SOURCE.source_model, VEHICLE_STATUS_SOURCE.data_key)
+    return spool.append_rows(file_path=name, data_source=VEHICLE_STATUS_SOURCE, rows=rows)
+
+
+def test_records_survive_reopen_and_torn_tail(tmp_path):
+    with Spool(directory=str(tmp_path), segment_max_bytes=200) as spool:
+        for index in range(3):
+            _append(spool, f"{index}.json")
+        assert len(list(tmp_path.glob(f"*{SEGMENT_SUFFIX}"))) == 3
+    last_segment = sorted(tmp_path.glob(f"*{SEGMENT_SUFFIX}"))[-1]
+    with open(last_segment, 'ab') as file:
+        file.write(b'\x00\x00\x00\x10torn')
+
+    with Spool(directory=str(tmp_path), segment_max_bytes=200) as spool:
+        records = spool.read()
+        assert [record.metadata["file_path"] for record in records] == ["0.json", "1.json", "2.json"]
+        spool.commit(records[1].end)
+    with Spool(directory=str(tmp_path), segment_max_bytes=200) as spool:
+        assert [record.metadata["file_path"] for record in spool.read()] == ["2.json"]
+        assert len(list(tmp_path.glob(f"*{SEGMENT_SUFFIX}"))) == 1
+
+
+def test_drainer_keeps_records_while_database_is_down(tmp_path):
+    db = FakeDB()
+    with Spool(directory=str(tmp_path)) as spool:
+        _append(spool, "a.json")
+        _append(spool, "b.json")
+        drainer = SpoolDrainer(spool=spool, db=db)
+
+        db.down = True
+        try:
+            drainer.drain_once()
+        except SQLAlchemyError:
+            pass
+        assert db.committed == {} and spool.pending_bytes > 0
+
+        db.down = False
+        assert drainer.drain_once() == 2
+        assert [row.vehicle_id for row in db.committed[VehicleStatus]] == ["v1", "v1"]
+        assert spool.pending_bytes == 0
+        assert drainer.drain_once() == 0
+
+
+def test_drainer_reports_files_once_committed(tmp_path):
+    db, retry = FakeDB(), FakeRetry()
+    with Spool(directory=str(tmp_path)) as spool:
+        _append(spool, "a.json")
+        drainer = SpoolDrainer(spool=spool, db=db, retry=retry)
+
+        db.down = True
+        try:
+            drainer.drain_once()
+        except SQLAlchemyError:
+            pass
+        assert retry.results == []
+
+        db.down = False
+        drainer.drain_once()
+        assert retry.results == [("a.json", None)]
+
+
+def test_file_failing_with_a_non_database_error_is_reported_and_skipped(tmp_path):
+    db, retry = FakeDB(fail=lambda row: TypeError("unsupported value") if row.vehicle_id == "v2" else None), FakeRetry()
+    with Spool(directory=str(tmp_path)) as spool:
+        _append(spool, "a.json")
+        _append(spool, "b.json", vehicle_id="v2")
+        _append(spool, "c.json", vehicle_id="v3")
+        drainer = SpoolDrainer(spool=spool, db=db, retry=retry)
+
+        assert drainer.drain_once() == 3
+
+        assert [row.vehicle_id for row in db.committed[VehicleStatus]] == ["v1", "v3"]
+        assert spool.pending_bytes == 0
+        assert [(file_path, type(error)) for file_path, error in retry.results] == [
+            ("a.json", type(None)), ("b.json", TypeError), ("c.json", type(None))
+        ]
+
+
+def test_corrupt_record_is_set_aside_and_skipped(tmp_path):
+    db = FakeDB()
+    with Spool(directory=str(tmp_path)) as spool:
+        _append(spool, "a.json")
+        end = _append(spool, "b.json")
+        _append(spool, "c.json")
+        segment = next(tmp_path.glob(f"*{SEGMENT_SUFFIX}"))
+        content = bytearray(segment.read_bytes())
+        content[end - 5] ^= 0xff  # In the body of b.json
+        segment.write_bytes(bytes(content))
+        drainer = SpoolDrainer(spool=spool, db=db)
+
+        while drainer.drain_once() or spool.pending_bytes:
+            pass
+
+        assert len(db.committed[VehicleStatus]) == 2
+        [corrupt] = tmp_path.glob(f"*{CORRUPT_SUFFIX}")
+        assert b"b.json" in corrupt.read_bytes()
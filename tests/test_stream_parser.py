@@ -0,0 +1,54 @@
+import io
+import json
+import pytest
+from json.decoder import JSONDecodeError
+from pydantic import ValidationError
+
+from file_processing import loader
+from file_processing.handler import load_file
+from file_processing.retry import is_retryable
+from file_processing.stream_parser import iter_json_array_items
+from tests.conftest import FakeDB, FakeRetry
+from tests.helpers import read_json_file, OBJECTS_DETECTION_FILE_NAME, TEST_DATA_DIRECTORY, OBJECTS_DETECTION_TABLE
+
+
+@pytest.mark.parametrize("read_size", [1, 7, 64, 2 ** 16])
+def test_items_match_json_load(read_size: int):
+    expected = read_json_file(OBJECTS_DETECTION_FILE_NAME)[OBJECTS_DETECTION_TABLE]
+    with open(f"{TEST_DATA_DIRECTORY}/{OBJECTS_DETECTION_FILE_NAME}", 'r') as file:
+        items = list(iter_json_array_items(file, data_key=OBJECTS_DETECTION_TABLE, read_size=read_size))
+    assert items == expected
+
+
+def test_unrelated_keys_are_skipped():
+    document = {"meta": {"count": 12345, "tags": ["a", "b"]}, "items": [1, 2.5, "x", None], "after": True}
+    file = io.StringIO(json.dumps(document))
+    assert list(iter_json_array_items(file, data_key="items", read_size=3)) == [1, 2.5, "x", None]
+
+
+def test_empty_array():
+    assert list(iter_json_array_items(io.StringIO('{"items": []}'), data_key="items")) == []
+
+
+@pytest.mark.parametrize("text", ['{}', '{"other": []}'])
+def test_missing_key(text: str):
+    with pytest.raises(ValidationError, match="items"):
+        list(iter_json_array_items(io.StringIO(text), data_key="items"))
+
+
+@pytest.mark.parametrize("text", ["", '{"items": [{"a": 1}, ', '{"items": [1 2]}'])
+def test_invalid_documents(text: str):
+    with pytest.raises(JSONDecodeError):
+        list(iter_json_array_items(io.StringIO(text), data_key="items", read_size=4))
+
+
+def test_missing_key_is_a_permanent_failure_of_the_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(loader, 'FAST_PATH_MAX_BYTES', 0)
+    path = tmp_path / "vehicle_status_20240721T143000.json"
+    path.write_text(json.dumps({"other": []}))
+    retry = FakeRetry()
+
+    load_file(file_name=path.name, file_path=str(path), db=FakeDB(), retry=retry)
+
+    [(file_path, error)] = retry.results
+    assert isinstance(error, ValidationError) and not is_retryable(error)
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models.db_models import ObjectsDetectionEvent
+
+NOW = datetime(2024, 7, 21, 14, 30, tzinfo=timezone.utc)
+ROW_COUNT = 25
+
+
+@pytest.fixture(autouse=True)
+def events(db):
+    # Pairs of events share a detection_time, so pages must be ordered by id as well
+    db.insert(model=ObjectsDetectionEvent, data=[
+        {"vehicle_id": f"v{index % 3}", "detection_time": NOW + timedelta(seconds=index // 2), "detections": []}
+        for index in range(ROW_COUNT)
+    ])
+
+
+def test_stream_yields_chunks_of_column_tuples(db):
+    chunks = list(db.stream(model=ObjectsDetectionEvent, columns=["id", "vehicle_id"], chunk_size=10))
+
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert all(len(row) == 2 for chunk in chunks for row in chunk)
+    assert sum(len(chunk) for chunk in db.stream(model=ObjectsDetectionEvent, vehicle_id="v0")) == 9
+
+
+def test_iter_keyset_pages_in_key_order_and_resumes(db):
+    pages = list(db.iter_keyset(model=ObjectsDetectionEvent, columns=["vehicle_id"], chunk_size=7))
+    rows = [row for page in pages for row in page]
+    keys = [(row.detection_time, row.id) for row in rows]
+
+    assert [len(page) for page in pages] == [7, 7, 7, 4]
+    assert keys == sorted(keys) and len(set(keys)) == ROW_COUNT
+
+    resumed = [row for page in db.iter_keyset(model=ObjectsDetectionEvent, after=keys[9], chunk_size=7) for row in page]
+    assert [(row.detection_time, row.id) for row in resumed] == keys[10:]
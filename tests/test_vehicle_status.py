@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from models.db_models import VehicleStatus
+from services.db.last_seen_cache import LastSeenCache
+
+NOW = datetime(2024, 7, 21, 14, 30, tzinfo=timezone.utc)
+
+
+def _status(vehicle_id: str, minutes: int, status: str = "driving") -> dict:
+    return {"vehicle_id": vehicle_id, "report_time": NOW + timedelta(minutes=minutes), "status": status}
+
+
+def test_latest_per_vehicle_keeps_newest_report():
+    rows = [_status("a", 1, "parking"), _status("b", 0), _status("a", 3, "accident"), _status("a", 2)]
+    latest = {row["vehicle_id"]: row for row in VehicleStatus.latest_per_vehicle(rows)}
+    assert latest == {"a": _status("a", 3, "accident"), "b": _status("b", 0)}
+
+
+def test_prepare_data_drops_rows_not_newer_than_last_applied():
+    db = SimpleNamespace(model_state={})
+    VehicleStatus.on_committed(db, [_status("a", 5), _status("b", 5)])
+
+    prepared = VehicleStatus.prepare_data(db, [_status("a", 4), _status("b", 5), _status("b", 6), _status("c", 0)])
+    assert prepared == [_status("b", 6), _status("c", 0)]
+    assert VehicleStatus.last_applied(SimpleNamespace(model_state={})).get("a") is None
+
+
+def test_report_times_without_offset_are_taken_as_utc():
+    db = SimpleNamespace(model_state={})
+    VehicleStatus.on_committed(db, [_status("a", 5)])
+    naive = {"vehicle_id": "a", "report_time": (NOW + timedelta(minutes=6)).replace(tzinfo=None), "status": "parking"}
+
+    prepared = VehicleStatus.prepare_data(db, [naive, _status("a", 4), _status("b", 0)])
+    assert prepared == [_status("a", 6, "parking"), _status("b", 0)]
+
+
+def test_last_seen_cache_evicts_least_recently_used():
+    cache = LastSeenCache(maxsize=2)
+    cache.update([("a", 1), ("b", 1)])
+    assert cache.is_stale("a", 1)  # Touches "a"
+    cache.update([("c", 1)])
+
+    assert cache.get("b") is None
+    assert not cache.is_stale("b", 0)
+    cache.update([("a", 0)])
+    assert cache.get("a") == 1
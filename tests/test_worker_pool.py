@@ -0,0 +1,37 @@
+import queue
+import threading
+import pytest
+
+from file_processing.worker_pool import IngestionWorkerPool
+from tests.conftest import FakeDB
+
+
+def test_pool_processes_all_files_and_releases_sessions():
+    db = FakeDB()
+    processed = []
+    pool = IngestionWorkerPool(db=db, process=lambda **kwargs: processed.append(kwargs['file_name']), num_workers=3)
+    pool.start()
+    for index in range(20):
+        pool.submit(file_name=f"file_{index}.json", file_path=f"/tmp/file_{index}.json")
+    pool.stop()
+
+    assert sorted(processed) == sorted(f"file_{index}.json" for index in range(20))
+    assert db.removed_sessions == 3
+    assert pool.stats()['processed_files'] == 20
+
+
+def test_submit_blocks_when_queue_is_full():
+    release = threading.Event()
+    pool = IngestionWorkerPool(db=FakeDB(), process=lambda **kwargs: release.wait(), num_workers=1, max_queue_size=1)
+    pool.start()
+    pool.submit(file_name="a.json", file_path="a.json")  # Taken by the worker
+    while pool.busy_workers != 1:
+        pass
+    pool.submit(file_name="b.json", file_path="b.json")  # Fills the queue
+
+    with pytest.raises(queue.Full):
+        pool.submit(file_name="c.json", file_path="c.json", timeout=0.1)
+    assert pool.queue_depth == 1
+
+    release.set()
+    pool.stop()